@@ -52,7 +52,7 @@ class TUAapp(TAS_app.app):
         self.mongo = self.plugins.DataBase.MongoDB(self)
 
         self.my_db = self.mongo.connect_to_database("TEST_DB")
-        self.tweets_DB = self.my_db.get_collection("Tweets")
+        self.tweets_DB = self.mongo.buffered_collection(self.my_db, "Tweets")
         self.passcount = 0
         self.maxpass = 3
         self.test_str = "This is a test string"
@@ -26,9 +26,12 @@ import importlib
 import os
 import sys
 
-import TCS_utils
-import TCS_variables
-import TNS_run
+import TCS_profiler  # first, so that --profile-startup sees every other import
+
+with TCS_profiler.phase("import modules"):
+    import TCS_utils
+    import TCS_variables
+    import TNS_run
 
 
 def pre_start():
@@ -60,8 +63,13 @@ def launch_node(node_name: str):
     :param node_name:
     :return:
     """
-    node = TNS_run.run(node_name)
-    node.start()
+    with TCS_profiler.phase("create node"):
+        node = TNS_run.run(node_name)
+    with TCS_profiler.phase("start node"):
+        node.start()
+    report = TCS_profiler.finish(node_name)
+    if report is not None:
+        print(f"Start up profile written to {report}")
     # print(f"Starting Node {node_name}")
     node.run()
 
@@ -82,7 +90,8 @@ def launch_app(app_name: str):
 
 
 if __name__ == "__main__":
-    pre_start()
+    with TCS_profiler.phase("pre start"):
+        pre_start()
 
     # handle nodes first
     node_name = "N000"  # default node name
@@ -30,3 +30,9 @@ class app(TAS_app_base.app):
     def __init__(self, name, parameters: TCS_configApp._app_config, test: bool = False):
         super().__init__(name, parameters, test)
         self.plugins = TAS_Plugins.Plugins()
+
+
+class async_app(TAS_app_base.async_app):
+    def __init__(self, name, parameters: TCS_configApp._app_config, test: bool = False):
+        super().__init__(name, parameters, test)
+        self.plugins = TAS_Plugins.Plugins()
@@ -21,6 +21,7 @@
 #
 # ##########################################################################
 
+import time
 
 import TCS_config
 import TCS_configApp
@@ -46,7 +47,7 @@ class app(TCS_core.core):
         # config set up
         self._app_config: TCS_configApp._app_config = parameters
         self.name: str = self._app_config.app_code
-        self._config: TCS_config.TCS_config = TCS_config.TCS_config()
+        self._config: TCS_config.TCS_config = TCS_config.get_config()
         self.save_key = self._app_config.save_key
 
         # interface initial set up
@@ -62,8 +63,14 @@ class app(TCS_core.core):
             self.interface.log("Started in test mode TEST MODE", logType="INFO")
 
         # NVM initial set up
-        self.data_interface = TDS_NVM.NVM_dataInterface(self.name, save_key=self.save_key)
+        self.data_interface = TDS_NVM.NVM_dataInterface(self.name, save_key=self.save_key,
+                                                        backend=self._config.nvm.backend,
+                                                        cache_size=self._config.nvm.cache_size,
+                                                        flush_steps=self._config.nvm.flush_steps,
+                                                        flush_interval=self._config.nvm.flush_interval)
         self.file_interface = TDS_file.TDS_file(self.name, save_key=self.save_key)
+        # called by _handle_cleanup, plugins register what has to be written when the node shuts down
+        self._cleanup_handlers: list = []
 
         self.interface.dlog(
             f"{self.name} v{self.version} : APP-BASE INITIALIZED", logType="INFO")
@@ -100,7 +107,98 @@ class app(TCS_core.core):
         """
         if self._app_config.save_after_each_step:
             self.mySave()
+        self.data_interface.end_step()
+
+    def _register_cleanup(self, handler) -> None:
+        """
+        Call handler when the app is cleaned up
+        :param handler: callable without arguments
+        :return:
+        """
+        self._cleanup_handlers.append(handler)
+
+    def _handle_cleanup(self):
+        """
+        Write the plugin and app data that has not been written yet
+        """
+        for handler in self._cleanup_handlers:
+            try:
+                handler()
+            except Exception as e:
+                self.interface.log("Unable to clean up : " + str(e), logType="ERROR")
+        self.data_interface.flush()
 
     def myTimeRequest(self):
         # to be overridden in parent class
         pass
+
+
+class async_app(app):
+    """
+    App with coroutine hooks (myStart, myStep, myLoad, mySave) that the node awaits on its event loop
+    Async apps only step concurrently when the node executor mode is "asyncio", otherwise each step is run to completion
+    myTimeRequest stays synchronous, it is called by the node scheduler
+    """
+
+    def __init__(self, name, parameters: TCS_configApp._app_config, test: bool = False):
+        super().__init__(name, parameters, test)
+        self.isAsync = True
+
+    async def _start(self):
+        # host will call on bootup
+        self._start_base()
+        await self.myStart()
+        self.interface.dlog(
+            f"{self.name} v{self.version} : RUN COMMAND COMPLETE", logType="INFO")
+
+        self._settings()
+
+    async def myStart(self):
+        """
+        Override this function to add your own init
+        """
+        pass
+
+    async def step(self):
+        self.step_count += 1
+        start = time.perf_counter()
+        await self.preStep()
+        pre = time.perf_counter()
+        self._step_base()
+        await self.myStep()
+        step = time.perf_counter()
+        await self.postStep()
+        # includes time spent awaiting other apps on the event loop
+        self.step_times = (pre - start, step - pre, time.perf_counter() - step)
+
+    async def myStep(self):
+        """
+        Override this function to add your own step
+        Blocking calls should be moved off the event loop (asyncio.to_thread) so other apps keep stepping
+        """
+        pass
+
+    async def myLoad(self):
+        # to be overridden in parent class
+        pass
+
+    async def mySave(self):
+        # to be overridden in parent class
+        pass
+
+    async def preStep(self):
+        """
+        Pre step
+        :return:
+        """
+        if self._app_config.load_before_each_step:
+            await self.myLoad()
+
+    async def postStep(self):
+        """
+        Post step
+        :return:
+        """
+        if self._app_config.save_after_each_step:
+            await self.mySave()
+        self.data_interface.end_step()
@@ -0,0 +1,142 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+App Finder
+Meta path finder that maps app modules straight to their app directories (APP_LOCAL or PYBIRD_REMOTE_APP_DIRECTORY)
+app directories are not added to sys.path so the cost of every import in the process does not grow with the number
+of apps on the node
+"""
+import importlib.abc
+import importlib.machinery
+import importlib.util
+import os
+import sys
+import threading
+import typing
+
+
+class app_finder(importlib.abc.MetaPathFinder):
+    """
+    - add_directory() - makes the modules in an app directory importable
+    - directories() - app directories that have been added
+    - find_spec() - called by the import system
+    """
+
+    def __init__(self) -> None:
+        # module name -> file
+        self._modules: typing.Dict[str, str] = {}
+        self._directories: typing.List[str] = []
+        self._specs: typing.Dict[str, importlib.machinery.ModuleSpec] = {}
+        self._lock = threading.Lock()
+
+    def add_directory(self, directory: str) -> None:
+        """
+        Make the modules in an app directory importable by name, the directory is listed once
+        modules already added from another app directory are not replaced (same as the order on sys.path)
+        :param directory:
+        :return:
+        """
+        directory = os.path.abspath(directory)
+        with self._lock:
+            if directory in self._directories:
+                return
+            self._directories.append(directory)
+            if not os.path.isdir(directory):
+                return
+            for entry in sorted(os.listdir(directory)):
+                path = os.path.join(directory, entry)
+                if entry.endswith(".py"):
+                    name = entry[:-3]
+                elif os.path.isfile(os.path.join(path, "__init__.py")):
+                    name = entry
+                    path = os.path.join(path, "__init__.py")
+                else:
+                    continue
+                if name.isidentifier() and name not in self._modules:
+                    self._modules[name] = path
+
+    def directories(self) -> typing.List[str]:
+        """
+        App directories that have been added, oldest first
+        :return:
+        """
+        return list(self._directories)
+
+    def find_spec(self, fullname, path=None, target=None):
+        if path is not None:
+            # submodules are found by their package
+            return None
+        spec = self._specs.get(fullname)
+        if spec is not None:
+            return spec
+        file = self._modules.get(fullname)
+        if file is None:
+            return None
+        if os.path.basename(file) == "__init__.py":
+            spec = importlib.util.spec_from_file_location(fullname, file,
+                                                          submodule_search_locations=[os.path.dirname(file)])
+        else:
+            spec = importlib.util.spec_from_file_location(fullname, file)
+        self._specs[fullname] = spec
+        return spec
+
+    def invalidate_caches(self) -> None:
+        """
+        Called by importlib.invalidate_caches(), app directories are listed again
+        :return:
+        """
+        with self._lock:
+            directories = self._directories
+            self._directories = []
+            self._modules = {}
+            self._specs = {}
+        for directory in directories:
+            self.add_directory(directory)
+
+
+_finder: typing.Union[app_finder, None] = None
+_finder_lock = threading.Lock()
+
+
+def get_finder() -> app_finder:
+    """
+    Get the process app finder, it is installed on sys.meta_path the first time it is needed
+    :return:
+    """
+    global _finder
+    if _finder is None:
+        with _finder_lock:
+            if _finder is None:
+                _finder = app_finder()
+                sys.meta_path.append(_finder)
+    return _finder
+
+
+def add_directory(directory: str) -> None:
+    """
+    Make the modules in an app directory importable
+    :param directory:
+    :return:
+    """
+    get_finder().add_directory(directory)
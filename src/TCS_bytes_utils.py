@@ -44,6 +44,24 @@ def read_bytes(in_bytes: bytes, in_index: int = 0) -> tuple[bytes, int]:
     return my_bytes, my_index
 
 
+def write_bytes32(in_bytes: bytes) -> bytes:
+    if in_bytes is None or len(in_bytes) == 0:
+        my_bytes: bytes = write_uint32(0)
+    else:
+        my_bytes: bytes = write_uint32(len(in_bytes))
+        my_bytes += in_bytes
+    return my_bytes
+
+
+def read_bytes32(in_bytes: bytes, in_index: int = 0) -> tuple[bytes, int]:
+    my_bytes: bytes = bytes()
+    (my_len, my_index) = read_uint32(in_bytes, in_index)
+    if my_len > 0:
+        my_bytes = in_bytes[my_index: my_index + my_len]
+        my_index += my_len
+    return my_bytes, my_index
+
+
 def write_bytes_len(in_bytes: bytes) -> bytes:
     return in_bytes
 
@@ -87,6 +105,15 @@ def read_text(in_bytes: bytes, in_index: int = 0) -> tuple[str, int]:
     return my_byte.decode('utf-8'), my_index
 
 
+def write_text32(in_str: str) -> bytes:
+    return write_bytes32(in_str.encode('utf-8'))
+
+
+def read_text32(in_bytes: bytes, in_index: int = 0) -> tuple[str, int]:
+    (my_byte, my_index) = read_bytes32(in_bytes, in_index)
+    return my_byte.decode('utf-8'), my_index
+
+
 # end Region
 ####################################################################################################
 ####################################################################################################
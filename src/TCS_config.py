@@ -25,35 +25,55 @@
 Configuration Manager
 handles all file processing for config directory
 
+get_config() returns a shared read only snapshot of the server config, it is parsed once per process
 """
 import os
 import sys
+import threading
+import typing
 
-import toml
-
+import TCS_config_cache
+import TCS_profiler
 import TCS_utils
 import TCS_variables
 
 
-class TCS_config:
+class _config_section:
+    """
+    Config values can not be changed once the config has been read (the config is shared, get_config())
+    """
+
+    def __setattr__(self, key, value):
+        if self.__dict__.get("_frozen", False):
+            raise TCS_variables.PYBIRDTypeError(f"config is read only, unable to set {key}")
+        super().__setattr__(key, value)
+
+    def _freeze(self) -> None:
+        for value in self.__dict__.values():
+            if isinstance(value, _config_section):
+                value._freeze()
+        self._frozen = True
+
+
+class TCS_config(_config_section):
     def __init__(self):
         self._config = None
         if TCS_utils.arg_in_sys_args(TCS_variables.SYS_ARG.BOOT):
             try:
                 self.file = os.path.join(TCS_variables.HOME, TCS_variables.FILE_NAMES.SERVER_CONFIG)
-                self._fullConfig = toml.load(self.file)
+                self._fullConfig = TCS_config_cache.load_toml(self.file)
                 self._config = self._fullConfig["system_config"]
             except:
                 raise TCS_variables.PYBIRDIOError(TCS_variables.FILE_NAMES.SERVER_CONFIG + " not found")
         if self._config == None:
             try:
                 self.file = os.path.join(TCS_variables.HOME, TCS_variables.FILE_NAMES.SERVER_CONFIG)
-                self._fullConfig = toml.load(self.file)
+                self._fullConfig = TCS_config_cache.load_toml(self.file)
                 self._config = self._fullConfig["system_config"]
             except:
                 self.file = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.CONFIG,
                                          TCS_variables.FILE_NAMES.SERVER_CONFIG)
-                self._fullConfig = toml.load(self.file)
+                self._fullConfig = TCS_config_cache.load_toml(self.file)
                 self._config = self._fullConfig["system_config"]
 
         self._agrv = None
@@ -66,6 +86,11 @@ class TCS_config:
         self.status: status = status()
         self.encryption: encryption = encryption()
         self.credentials: credentials = credentials()
+        self.executor: executor_config = executor_config()
+        self.metrics: metrics_config = metrics_config()
+        self.app_reload: app_reload_config = app_reload_config()
+        self.nvm: nvm_config = nvm_config()
+        self.atlas: atlas_config = atlas_config()
 
         self._read_config()
 
@@ -77,6 +102,17 @@ class TCS_config:
         if not self.logging.enable_master_log and not self.logging.enable_session_log:
             self.logging.enable_session_log = True
 
+        self._mtime = _get_mtime(self.file)
+        self._argv = list(sys.argv)
+        self._freeze()
+
+    def changed(self) -> bool:
+        """
+        True if the config file or the system arguments have changed since the config was read
+        :return:
+        """
+        return _get_mtime(self.file) != self._mtime or list(sys.argv) != self._argv
+
     def _read_config(self):
         """
         Read the config file
@@ -90,6 +126,11 @@ class TCS_config:
         self.status._read(self._config)
         self.encryption._read(self._config)
         self.credentials._read(self._config)
+        self.executor._read(self._config)
+        self.metrics._read(self._config)
+        self.app_reload._read(self._config)
+        self.nvm._read(self._config)
+        self.atlas._read(self._config)
 
     def _read_sys_argv(self):
         """
@@ -153,10 +194,14 @@ class TCS_config:
         string_out += f"platform: \n{self.platform}\n"
         string_out += f"status: \n{self.status}\n"
         string_out += f"encryption: \n{self.encryption}\n"
+        string_out += f"executor: \n{self.executor}\n"
+        string_out += f"app_reload: \n{self.app_reload}\n"
+        string_out += f"nvm: \n{self.nvm}\n"
+        string_out += f"atlas: \n{self.atlas}\n"
         return string_out
 
 
-class system_config:
+class system_config(_config_section):
     """
     System configuration
     """
@@ -201,7 +246,7 @@ class system_config:
         return string_out
 
 
-class logging_config:
+class logging_config(_config_section):
     """
     Logging configuration
     """
@@ -217,6 +262,9 @@ class logging_config:
         self.session_log_length = -1
         self.app_log_length = 100000
 
+        self.buffered = True
+        self.enable_binary_log = False
+
     def _read(self, _config):
         """
         Read the config
@@ -231,6 +279,8 @@ class logging_config:
         self.master_length = self._raw["master_log_length"]
         self.session_length = self._raw["session_log_length"]
         self.app_length = self._raw["app_log_length"]
+        self.buffered = self._raw.get("buffered", self.buffered)
+        self.enable_binary_log = self._raw.get("enable_binary_log", self.enable_binary_log)
 
     def __str__(self) -> str:
         string_out = ""
@@ -240,11 +290,13 @@ class logging_config:
         string_out += f"master_length: {self.master_length}\n"
         string_out += f"session_length: {self.session_length}\n"
         string_out += f"app_length: {self.app_length}\n"
+        string_out += f"buffered: {self.buffered}\n"
+        string_out += f"enable_binary_log: {self.enable_binary_log}\n"
 
         return string_out
 
 
-class console_config:
+class console_config(_config_section):
     """
     Console configuration
     """
@@ -271,7 +323,7 @@ class console_config:
         return string_out
 
 
-class twitter_config:
+class twitter_config(_config_section):
     """
     Twitter configuration
     """
@@ -297,7 +349,7 @@ class twitter_config:
         return string_out
 
 
-class platform:
+class platform(_config_section):
     """
     Platform configuration
     """
@@ -313,7 +365,7 @@ class platform:
         return string_out
 
 
-class status:
+class status(_config_section):
     """
     Status configuration
     """
@@ -337,7 +389,7 @@ class status:
         return string_out
 
 
-class encryption:
+class encryption(_config_section):
     """
     Encryption configuration
     """
@@ -361,7 +413,7 @@ class encryption:
         return string_out
 
 
-class credentials:
+class credentials(_config_section):
     """
     Credentials configuration
     """
@@ -370,6 +422,7 @@ class credentials:
         self._raw = None
         self.delete_dir_after_upload = True
         self.delete_file_after_upload = True
+        self.cache_ttl: float = 300
 
     def _read(self, _config):
         """
@@ -380,13 +433,249 @@ class credentials:
         self._raw = _config["credentials"]
         self.delete_dir_after_upload = self._raw["delete_dir_after_upload"]
         self.delete_file_after_upload = self._raw["delete_file_after_upload"]
+        self.cache_ttl = self._raw.get("cache_ttl", self.cache_ttl)
 
     def __str__(self) -> str:
         string_out = ""
         string_out += f"delete_dir_after_upload: {self.delete_dir_after_upload}\n"
         string_out += f"delete_file_after_upload: {self.delete_file_after_upload}\n"
+        string_out += f"cache_ttl: {self.cache_ttl}\n"
         return string_out
 
 
+class executor_config(_config_section):
+    """
+    Executor configuration
+    """
+
+    def __init__(self) -> None:
+        self._raw = None
+        self.mode: str = TCS_variables.EXECUTOR.SERIAL
+        self.thread_workers: int = 4
+        self.process_workers: int = 2
+
+    def _read(self, _config):
+        """
+        Read the config
+        section is optional so config files from older versions still load
+        :param _config:
+        :return:
+        """
+        self._raw = _config.get("executor", {})
+        self.mode = self._raw.get("mode", self.mode)
+        self.thread_workers = self._raw.get("thread_workers", self.thread_workers)
+        self.process_workers = self._raw.get("process_workers", self.process_workers)
+
+    def __str__(self) -> str:
+        string_out = ""
+        string_out += f"mode: {self.mode}\n"
+        string_out += f"thread_workers: {self.thread_workers}\n"
+        string_out += f"process_workers: {self.process_workers}\n"
+        return string_out
+
+
+class metrics_config(_config_section):
+    """
+    Node metrics configuration
+    """
+
+    def __init__(self) -> None:
+        self._raw = None
+        self.enable: bool = True
+        self.report_interval: float = 3600
+
+    def _read(self, _config):
+        """
+        Read the config
+        section is optional so config files from older versions still load
+        :param _config:
+        :return:
+        """
+        self._raw = _config.get("metrics", {})
+        self.enable = self._raw.get("enable", self.enable)
+        self.report_interval = self._raw.get("report_interval", self.report_interval)
+
+    def __str__(self) -> str:
+        string_out = ""
+        string_out += f"enable: {self.enable}\n"
+        string_out += f"report_interval: {self.report_interval}\n"
+        return string_out
+
+
+class app_reload_config(_config_section):
+    """
+    App config reload configuration
+    """
+
+    def __init__(self) -> None:
+        self._raw = None
+        self.enable: bool = True
+        self.check_interval: float = 5
+
+    def _read(self, _config):
+        """
+        Read the config
+        section is optional so config files from older versions still load
+        :param _config:
+        :return:
+        """
+        self._raw = _config.get("app_reload", {})
+        self.enable = self._raw.get("enable", self.enable)
+        self.check_interval = self._raw.get("check_interval", self.check_interval)
+
+    def __str__(self) -> str:
+        string_out = ""
+        string_out += f"enable: {self.enable}\n"
+        string_out += f"check_interval: {self.check_interval}\n"
+        return string_out
+
+
+class nvm_config(_config_section):
+    """
+    App data storage configuration
+    """
+
+    def __init__(self) -> None:
+        self._raw = None
+        self.backend: str = TCS_variables.NVM.SQLITE
+        self.cache_size: int = 0
+        self.flush_steps: int = 0
+        self.flush_interval: float = 30
+
+    def _read(self, _config):
+        """
+        Read the config
+        section is optional so config files from older versions still load
+        :param _config:
+        :return:
+        """
+        self._raw = _config.get("nvm", {})
+        self.backend = self._raw.get("backend", self.backend)
+        self.cache_size = self._raw.get("cache_size", self.cache_size)
+        self.flush_steps = self._raw.get("flush_steps", self.flush_steps)
+        self.flush_interval = self._raw.get("flush_interval", self.flush_interval)
+
+    def __str__(self) -> str:
+        string_out = ""
+        string_out += f"backend: {self.backend}\n"
+        string_out += f"cache_size: {self.cache_size}\n"
+        string_out += f"flush_steps: {self.flush_steps}\n"
+        string_out += f"flush_interval: {self.flush_interval}\n"
+        return string_out
+
+
+class atlas_config(_config_section):
+    """
+    MongoDB Atlas client configuration
+    """
+
+    def __init__(self) -> None:
+        self._raw = None
+        self.client: str = TCS_variables.ATLAS.PYMONGO
+        self.max_pool_size: int = 10
+        self.min_pool_size: int = 0
+        self.max_idle_time: float = 60
+        self.connect_timeout: float = 10
+        self.server_selection_timeout: float = 10
+        self.buffer_documents: int = 1000
+        self.buffer_bytes: int = 4 * 1024 * 1024
+        self.buffer_age: float = 1
+        self.write_retries: int = 5
+        self.retry_backoff: float = 0.5
+        self.log_queue: int = 10000
+        self.log_batch: int = 500
+        self.log_interval: float = 1
+        self.log_collection_bytes: int = 64 * 1024 * 1024
+        self.log_spill_bytes: int = 64 * 1024 * 1024
+        self.log_retry_interval: float = 30
+
+    def _read(self, _config):
+        """
+        Read the config
+        section is optional so config files from older versions still load
+        :param _config:
+        :return:
+        """
+        self._raw = _config.get("atlas", {})
+        self.client = self._raw.get("client", self.client)
+        self.max_pool_size = self._raw.get("max_pool_size", self.max_pool_size)
+        self.min_pool_size = self._raw.get("min_pool_size", self.min_pool_size)
+        self.max_idle_time = self._raw.get("max_idle_time", self.max_idle_time)
+        self.connect_timeout = self._raw.get("connect_timeout", self.connect_timeout)
+        self.server_selection_timeout = self._raw.get("server_selection_timeout", self.server_selection_timeout)
+        self.buffer_documents = self._raw.get("buffer_documents", self.buffer_documents)
+        self.buffer_bytes = self._raw.get("buffer_bytes", self.buffer_bytes)
+        self.buffer_age = self._raw.get("buffer_age", self.buffer_age)
+        self.write_retries = self._raw.get("write_retries", self.write_retries)
+        self.retry_backoff = self._raw.get("retry_backoff", self.retry_backoff)
+        self.log_queue = self._raw.get("log_queue", self.log_queue)
+        self.log_batch = self._raw.get("log_batch", self.log_batch)
+        self.log_interval = self._raw.get("log_interval", self.log_interval)
+        self.log_collection_bytes = self._raw.get("log_collection_bytes", self.log_collection_bytes)
+        self.log_spill_bytes = self._raw.get("log_spill_bytes", self.log_spill_bytes)
+        self.log_retry_interval = self._raw.get("log_retry_interval", self.log_retry_interval)
+
+    def __str__(self) -> str:
+        string_out = ""
+        string_out += f"client: {self.client}\n"
+        string_out += f"max_pool_size: {self.max_pool_size}\n"
+        string_out += f"min_pool_size: {self.min_pool_size}\n"
+        string_out += f"max_idle_time: {self.max_idle_time}\n"
+        string_out += f"connect_timeout: {self.connect_timeout}\n"
+        string_out += f"server_selection_timeout: {self.server_selection_timeout}\n"
+        string_out += f"buffer_documents: {self.buffer_documents}\n"
+        string_out += f"buffer_bytes: {self.buffer_bytes}\n"
+        string_out += f"buffer_age: {self.buffer_age}\n"
+        string_out += f"write_retries: {self.write_retries}\n"
+        string_out += f"retry_backoff: {self.retry_backoff}\n"
+        string_out += f"log_queue: {self.log_queue}\n"
+        string_out += f"log_batch: {self.log_batch}\n"
+        string_out += f"log_interval: {self.log_interval}\n"
+        string_out += f"log_collection_bytes: {self.log_collection_bytes}\n"
+        string_out += f"log_spill_bytes: {self.log_spill_bytes}\n"
+        string_out += f"log_retry_interval: {self.log_retry_interval}\n"
+        return string_out
+
+
+_shared: typing.Union[TCS_config, None] = None
+_shared_lock = threading.Lock()
+
+
+def get_config() -> TCS_config:
+    """
+    Get the shared config, the server config is parsed the first time it is needed
+    :return:
+    """
+    global _shared
+    if _shared is None:
+        with _shared_lock:
+            if _shared is None:
+                with TCS_profiler.phase("read server config"):
+                    _shared = TCS_config()
+    return _shared
+
+
+def reload_config(force: bool = False) -> bool:
+    """
+    Re-read the shared config if the config file (mtime) or the system arguments have changed
+    objects keep the snapshot they were built with, new objects get the new config
+    :param force: re-read even if nothing has changed
+    :return: True if the config was re-read
+    """
+    global _shared
+    with _shared_lock:
+        if _shared is not None and not force and not _shared.changed():
+            return False
+        _shared = TCS_config()
+    return True
+
+
+def _get_mtime(path: str) -> typing.Union[float, None]:
+    try:
+        return os.path.getmtime(path)
+    except OSError:
+        return None
+
+
 if __name__ == "__main__":
     test = TCS_config()
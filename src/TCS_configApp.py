@@ -22,10 +22,16 @@
 # ##########################################################################
 
 import csv
+import hashlib
+import io
 import os
+import typing
 
 import toml
 
+import TCS_config_cache
+import TCS_profiler
+import TCS_timing_manager
 import TCS_utils
 import TCS_variables
 
@@ -35,17 +41,52 @@ class TAS_apps_config:
     read from the app config CSV file
     """
 
-    def __init__(self, nodeName="N000") -> None:
+    def __init__(self, nodeName="N000", app_code_suffix: str = "") -> None:
         self.version = TCS_utils.version()
         self.file = os.path.join(
             TCS_variables.PYBIRD_DIRECTORIES.CONFIG,
             str(nodeName + TCS_variables.FILE_EXTENSIONS.NODE_CONFIG))
+        # appended to every app code (core apps are renamed per node)
+        self.app_code_suffix = app_code_suffix
 
         self.configs: list[_app_config] = []
+        # path: (mtime, sha1) of every file the configs were read from
+        self._files: dict[str, tuple] = {}
 
-        self._read_config_csv()
-        self._read_configtoml()
+        # parsed configs are cached until one of the files changes
+        self._cache = "APPS_" + nodeName + app_code_suffix
+        with TCS_profiler.phase("read config cache"):
+            cached = TCS_config_cache.load(self._cache, self._cache_key())
+        if cached is not None:
+            self.configs, self._files = cached
+            return
+        with TCS_profiler.phase("read node config"):
+            self._read_config_csv()
+        with TCS_profiler.phase("read app configs"):
+            self._read_configtoml()
         self._post_process_config()
+        self._store_cache()
+
+    def _store_cache(self) -> None:
+        TCS_config_cache.store(self._cache, self._files, (self.configs, self._files), self._cache_key())
+
+    @staticmethod
+    def _cache_key() -> tuple:
+        # the app tomls are found in these directories (--remote)
+        return (TCS_variables.PYBIRD_DIRECTORIES.APP_LOCAL,
+                TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_REMOTE_APP_DIRECTORY)
+
+    def _read_file(self, path: str) -> str:
+        """
+        Read a config file and record its modification time and hash
+        :param path:
+        :return:
+        """
+        mtime = os.path.getmtime(path)
+        with open(path, "rb") as f:
+            data = f.read()
+        self._files[path] = (mtime, hashlib.sha1(data).hexdigest())
+        return data.decode("UTF-8")
 
     def _read_config_csv(self):
         """
@@ -53,38 +94,45 @@ class TAS_apps_config:
         :return:
         """
         # read configuration file
-        with open(self.file, mode='r', encoding='UTF-8', newline='') as config_file:
-            csv_read = csv.reader(config_file)
-            i = 0
-            for row in csv_read:
-                if i != 0:
-                    self.configs.append(_app_config())
-                    self.configs[-1]._csv = row
-                    if row[1][0] == "#":
-                        self.configs[-1].active = False
-                    else:
-                        self.configs[-1].active = TCS_utils.str_to_bool(row[1].strip())
-
-                    if row[2][0] == "#":
-                        self.configs[-1].active_test = False
-                    else:
-                        self.configs[-1].active_test = TCS_utils.str_to_bool(row[2].strip())
-
-                    if row[0][0] == "#":
-                        self.configs[-1].app_code = row[0][1:]
-                        self.configs[-1]._full_disable = True
-                        self.configs[-1].active = False
-                        self.configs[-1].active_test = False
-                    else:
-                        self.configs[-1].app_code = row[0].strip()
-
-                    self.configs[-1].local_app = TCS_utils.str_to_bool(row[3].strip())
-                    self.configs[-1].csv_debug_mode = TCS_utils.str_to_bool(row[4].strip())
-                    self.configs[-1].main_app = row[5].strip()
-                    self.configs[-1].app_config = row[6].strip()
-                    self.configs[-1].dependencies = TCS_utils.delimitated_to_list_str(row[7].strip(), "|")
-
-                i += 1
+        csv_read = csv.reader(io.StringIO(self._read_file(self.file), newline=''))
+        i = 0
+        for row in csv_read:
+            if i != 0:
+                self.configs.append(self._csv_config(row))
+            i += 1
+
+    def _csv_config(self, row: list):
+        """
+        app config from a node config csv row
+        :param row:
+        :return:
+        """
+        config = _app_config()
+        config._csv = row
+        if row[1][0] == "#":
+            config.active = False
+        else:
+            config.active = TCS_utils.str_to_bool(row[1].strip())
+
+        if row[2][0] == "#":
+            config.active_test = False
+        else:
+            config.active_test = TCS_utils.str_to_bool(row[2].strip())
+
+        if row[0][0] == "#":
+            config.app_code = row[0][1:]
+            config._full_disable = True
+            config.active = False
+            config.active_test = False
+        else:
+            config.app_code = row[0].strip()
+
+        config.local_app = TCS_utils.str_to_bool(row[3].strip())
+        config.csv_debug_mode = TCS_utils.str_to_bool(row[4].strip())
+        config.main_app = row[5].strip()
+        config.app_config = row[6].strip()
+        config.dependencies = TCS_utils.delimitated_to_list_str(row[7].strip(), "|")
+        return config
 
     def _read_configtoml(self):
         """
@@ -93,43 +141,88 @@ class TAS_apps_config:
         """
         for config in self.configs:
             if not config._full_disable:
-                if config.local_app:
-                    toml_address = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.APP_LOCAL, config.app_code,
-                                                config.app_config)
-                else:
-                    toml_address = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_REMOTE_APP_DIRECTORY,
-                                                config.app_code,
-                                                config.app_config)
-                # print(json_address)
-                with open(toml_address, "r") as toml_file:
-                    config.toml = toml.load(toml_file)
-
-                    config.load_before_each_step = config.toml["app_config"]["load_before_each_step"]
-                    config.save_after_each_step = config.toml["app_config"]["save_after_each_step"]
-
-                    config.timing_mode = config.toml["app_config"]["timing"]["mode"]
-                    config.timing_step_duration = config.toml["app_config"]["timing"]["step"]["step_duration"]
-                    config.timing_step_skip_missed = config.toml["app_config"]["timing"]["step"]["skip_missed"]
-                    config.timing_step_sync_time = config.toml["app_config"]["timing"]["step"]["sync_time"]
-                    config.timing_time_list = config.toml["app_config"]["timing"]["time"]["time_list"]
-                    config.timing_once = config.toml["app_config"]["timing"]["once"]["time"]
+                self._read_app_toml(config)
 
-                    config.toml_debug_mode = config.toml["app_config"]["debug_mode"]
-                    config.save_key = config.toml["app_config"]["save_key"]
+    def _toml_address(self, config) -> str:
+        if config.local_app:
+            return os.path.join(TCS_variables.PYBIRD_DIRECTORIES.APP_LOCAL, config.app_code, config.app_config)
+        return os.path.join(TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_REMOTE_APP_DIRECTORY, config.app_code,
+                            config.app_config)
 
-                    config.plugin_twitter_enabled = config.toml["app_config"]["plugins"]["enable_twitter"]
-                    config.plugin_atlas_enabled = config.toml["app_config"]["plugins"]["enable_mongoDB_atlas"]
-
-                    config.app_parameters = config.toml["app_parameters"]
+    def _read_app_toml(self, config):
+        """
+        read the toml file of an app
+        :param config:
+        :return:
+        """
+        path = self._toml_address(config)
+        compile_app_toml(config, toml.loads(self._read_file(path)), path)
 
-    def _post_process_config(self):
+    def _post_process_config(self, configs=None):
         """
         post process the configuration
+        :param configs: configs to process, default all
         :return:
         """
-        for config in self.configs:
+        for config in self.configs if configs is None else configs:
             if config.csv_debug_mode or config.toml_debug_mode:
                 config.debug_mode = True
+            config.app_code += self.app_code_suffix
+
+    def changed_files(self) -> list:
+        """
+        config files that have changed since they were read
+        a file is changed when its modification time and its content have changed
+        :return:
+        """
+        changed = []
+        for path, (mtime, digest) in list(self._files.items()):
+            try:
+                new_mtime = os.path.getmtime(path)
+                if new_mtime == mtime:
+                    continue
+                with open(path, "rb") as f:
+                    new_digest = hashlib.sha1(f.read()).hexdigest()
+            except OSError:
+                new_mtime, new_digest = None, None
+            self._files[path] = (new_mtime, new_digest)
+            if new_digest != digest:
+                changed.append(path)
+        return changed
+
+    def reload(self) -> dict:
+        """
+        Re-read the configs of the apps whose csv row or toml file has changed, other apps keep their config object
+        an error leaves the configs unchanged, the files are read again once they change again
+        :return: {app code: new config} of the changed apps, None for apps removed from the csv
+        """
+        changed_files = self.changed_files()
+        if len(changed_files) == 0:
+            return {}
+        if self.file in changed_files:
+            rows = list(csv.reader(io.StringIO(self._read_file(self.file), newline='')))[1:]
+        else:
+            rows = [config._csv for config in self.configs]
+
+        old_configs = {config._csv[0]: config for config in self.configs}
+        configs = []
+        changed = {}
+        for row in rows:
+            config = self._csv_config(row)
+            old = old_configs.pop(row[0], None)
+            if old is not None and old._csv == row and self._toml_address(config) not in changed_files:
+                configs.append(old)
+                continue
+            if not config._full_disable:
+                self._read_app_toml(config)
+            self._post_process_config([config])
+            configs.append(config)
+            changed[config.app_code] = config
+        for old in old_configs.values():
+            changed[old.app_code] = None
+        self.configs = configs
+        self._store_cache()
+        return changed
 
     @staticmethod
     def step_time_handle(in_step_time: str):
@@ -160,7 +253,15 @@ class _app_config:
     """
     class that acts as a struct data structure
     Only Stores Data
+    the toml fields are validated and the timing decoded by compile_app_toml, the parsed toml is not kept
     """
+    __slots__ = ("_csv", "_full_disable", "app_code", "active", "active_test", "local_app", "csv_debug_mode",
+                 "main_app", "app_config", "dependencies",
+                 "toml_debug_mode", "load_before_each_step", "save_after_each_step", "timing_mode",
+                 "timing_step_duration", "timing_step_skip_missed", "timing_step_sync_time", "timing_time_list",
+                 "timing_once", "save_key", "app_parameters", "plugin_twitter_enabled", "plugin_atlas_enabled",
+                 "executor_pool", "debug_mode", "atlas_logging_enabled", "atlas_logging_db",
+                 "step_seconds", "sync_time", "once_time", "time_calendar")
 
     def __init__(self) -> None:
         # csv
@@ -175,7 +276,7 @@ class _app_config:
         self.app_config: str = "unknown"
         self.dependencies: list[str] = ["unknown"]
 
-        self.toml: dict = {}
+        # toml
         self.toml_debug_mode: bool = False
         self.load_before_each_step: bool = False
         self.save_after_each_step: bool = False
@@ -189,7 +290,16 @@ class _app_config:
         self.app_parameters: dict = {}
         self.plugin_twitter_enabled: bool = False
         self.plugin_atlas_enabled: bool = False
+        self.executor_pool: str = TCS_variables.EXECUTOR.NONE
         self.debug_mode: bool = False
+        self.atlas_logging_enabled: bool = False
+        self.atlas_logging_db: str = ""
+
+        # decoded timing, only the fields of the timing mode are set
+        self.step_seconds: typing.Union[int, None] = None
+        self.sync_time: typing.Union[float, None] = None  # unix time
+        self.once_time: typing.Union[float, None] = None  # unix time
+        self.time_calendar: typing.Union[list, None] = None  # seconds of the week
 
     def __str__(self) -> str:
         string_out = ""
@@ -202,7 +312,6 @@ class _app_config:
         string_out += "main_app: " + str(self.main_app) + "\n"
         string_out += "app_config: " + str(self.app_config) + "\n"
         string_out += "dependencies: " + str(self.dependencies) + "\n"
-        string_out += "toml: " + str(self.toml) + "\n"
         string_out += "toml_debug_mode: " + str(self.toml_debug_mode) + "\n"
         string_out += "load_before_each_step: " + str(self.load_before_each_step) + "\n"
         string_out += "save_after_each_step: " + str(self.save_after_each_step) + "\n"
@@ -214,6 +323,83 @@ class _app_config:
         string_out += "app_parameters: " + str(self.app_parameters) + "\n"
         string_out += "plugin_twitter_enabled: " + str(self.plugin_twitter_enabled) + "\n"
         string_out += "plugin_atlas_enabled: " + str(self.plugin_atlas_enabled) + "\n"
+        string_out += "executor_pool: " + str(self.executor_pool) + "\n"
         string_out += "debug_mode: " + str(self.debug_mode) + "\n"
+        string_out += "atlas_logging_enabled: " + str(self.atlas_logging_enabled) + "\n"
+        string_out += "atlas_logging_db: " + str(self.atlas_logging_db) + "\n"
+        string_out += "step_seconds: " + str(self.step_seconds) + "\n"
+        string_out += "sync_time: " + str(self.sync_time) + "\n"
+        string_out += "once_time: " + str(self.once_time) + "\n"
+        string_out += "time_calendar: " + str(self.time_calendar) + "\n"
 
         return string_out
+
+
+_REQUIRED = object()
+# app toml schema: (attribute, toml keys, type, default), fields without a default must be in the toml
+_TOML_SCHEMA = (
+    ("load_before_each_step", ("app_config", "load_before_each_step"), bool, _REQUIRED),
+    ("save_after_each_step", ("app_config", "save_after_each_step"), bool, _REQUIRED),
+    ("timing_mode", ("app_config", "timing", "mode"), str, _REQUIRED),
+    ("timing_step_duration", ("app_config", "timing", "step", "step_duration"), str, _REQUIRED),
+    ("timing_step_skip_missed", ("app_config", "timing", "step", "skip_missed"), bool, _REQUIRED),
+    ("timing_step_sync_time", ("app_config", "timing", "step", "sync_time"), str, _REQUIRED),
+    ("timing_time_list", ("app_config", "timing", "time", "time_list"), list, _REQUIRED),
+    ("timing_once", ("app_config", "timing", "once", "time"), str, _REQUIRED),
+    ("toml_debug_mode", ("app_config", "debug_mode"), bool, _REQUIRED),
+    ("save_key", ("app_config", "save_key"), str, _REQUIRED),
+    # optional sections, apps without them have no plugins and step on the node
+    ("plugin_twitter_enabled", ("app_config", "plugins", "enable_twitter"), bool, False),
+    ("plugin_atlas_enabled", ("app_config", "plugins", "enable_mongoDB_atlas"), bool, False),
+    ("executor_pool", ("app_config", "executor", "pool"), str, TCS_variables.EXECUTOR.NONE),
+    ("atlas_logging_enabled", ("app_config", "atlas", "logging", "enabled"), bool, False),
+    ("atlas_logging_db", ("app_config", "atlas", "logging", "DB_Name"), str, ""),
+    ("app_parameters", ("app_parameters",), dict, _REQUIRED),
+)
+# element type of the list fields of the schema
+_TOML_LIST_TYPES = {"timing_time_list": str}
+_TIMING_MODES = ("test", "step", "time", "cont", "request", "start", "once")
+
+
+def compile_app_toml(config: _app_config, data: dict, path: str = "") -> _app_config:
+    """
+    Validate a parsed app toml against the schema and fill in the config, the timing of the app's mode is decoded
+    :param config:
+    :param data: parsed toml
+    :param path: toml file, for error messages
+    :return: config
+    """
+    for attribute, keys, value_type, default in _TOML_SCHEMA:
+        value = data
+        for key in keys:
+            if not isinstance(value, dict) or key not in value:
+                value = default
+                break
+            value = value[key]
+        if value is _REQUIRED:
+            raise TCS_variables.PYBIRDKeyError(f"{path} : missing {'.'.join(keys)}")
+        if not isinstance(value, value_type):
+            raise TCS_variables.PYBIRDTypeError(
+                f"{path} : {'.'.join(keys)} must be {value_type.__name__} not {type(value).__name__}")
+        if attribute in _TOML_LIST_TYPES:
+            item_type = _TOML_LIST_TYPES[attribute]
+            for index, item in enumerate(value):
+                if not isinstance(item, item_type):
+                    raise TCS_variables.PYBIRDTypeError(
+                        f"{path} : {'.'.join(keys)}[{index}] must be {item_type.__name__} not {type(item).__name__}")
+        setattr(config, attribute, value)
+
+    if config.timing_mode not in _TIMING_MODES:
+        raise TCS_variables.PYBIRDValueError(f"{path} : invalid timing mode [{config.timing_mode}]")
+    try:
+        if config.timing_mode == "step":
+            config.step_seconds = TAS_apps_config.step_time_handle(config.timing_step_duration)
+            if config.timing_step_sync_time != "":
+                config.sync_time = TCS_timing_manager.parse_utc(config.timing_step_sync_time)
+        elif config.timing_mode == "time":
+            config.time_calendar = TCS_timing_manager.compile_time_list(config.timing_time_list)
+        elif config.timing_mode == "once":
+            config.once_time = TCS_timing_manager.parse_utc(config.timing_once)
+    except (ValueError, IndexError) as e:
+        raise TCS_variables.PYBIRDValueError(f"{path} : invalid {config.timing_mode} timing : {e}")
+    return config
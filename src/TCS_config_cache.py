@@ -0,0 +1,124 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Config Cache
+Parsed config files are pickled to data/cache so a restarted node does not parse its toml and csv files again
+A cache entry is keyed by the path, modification time and sha1 of every file it was built from, it is used only if
+none of them have changed
+    - file_stamp() - (mtime, sha1) of a file
+    - load() - cached value if its files are unchanged
+    - store() - cache a value with the stamps of its files
+    - load_toml() - parsed toml file, from the cache when the file is unchanged
+"""
+import hashlib
+import os
+import pickle
+import typing
+
+import toml
+
+import TCS_utils
+import TCS_variables
+
+
+def file_stamp(path: str) -> tuple:
+    """
+    Modification time and sha1 of a file
+    :param path:
+    :return: (mtime, sha1)
+    """
+    mtime = os.path.getmtime(path)
+    with open(path, "rb") as f:
+        return mtime, hashlib.sha1(f.read()).hexdigest()
+
+
+def _cache_path(name: str) -> str:
+    return os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_CACHE, name + TCS_variables.CONFIG_CACHE.EXTENSION)
+
+
+def _key(key) -> tuple:
+    # cached objects are only valid for the code that pickled them
+    return TCS_variables.CONFIG_CACHE.FORMAT, str(TCS_utils.version()), key
+
+
+def load(name: str, key=None) -> typing.Any:
+    """
+    Get a cached value
+    :param name: cache entry name
+    :param key: extra key, the entry is not used if it was stored with a different key
+    :return: value, None if there is no entry or its files have changed
+    """
+    try:
+        with open(_cache_path(name), "rb") as f:
+            entry = pickle.load(f)
+        if entry["key"] != _key(key):
+            return None
+        for path, stamp in entry["files"].items():
+            if file_stamp(path) != tuple(stamp):
+                return None
+        return entry["value"]
+    except Exception:
+        # missing, unreadable or from an older version
+        return None
+
+
+def store(name: str, files: dict, value, key=None) -> bool:
+    """
+    Cache a value
+    :param name: cache entry name
+    :param files: {path: (mtime, sha1)} of the files the value was built from
+    :param value: picklable value
+    :param key: extra key
+    :return: True if the value was cached
+    """
+    path = _cache_path(name)
+    temp_path = path + "." + str(os.getpid())
+    try:
+        with open(temp_path, "wb") as f:
+            pickle.dump({"key": _key(key), "files": dict(files), "value": value}, f, protocol=pickle.HIGHEST_PROTOCOL)
+        # nodes started together may store the same entry
+        os.replace(temp_path, path)
+        return True
+    except Exception:
+        try:
+            os.remove(temp_path)
+        except OSError:
+            pass
+        return False
+
+
+def load_toml(path: str) -> dict:
+    """
+    Parse a toml file, the parsed file is cached until the file changes
+    :param path:
+    :return:
+    """
+    name = "TOML_" + hashlib.sha1(os.path.abspath(path).encode()).hexdigest()[:16]
+    data = load(name, path)
+    if data is not None:
+        return data
+    stamp = file_stamp(path)
+    data = toml.load(path)
+    store(name, {path: stamp}, data, path)
+    return data
@@ -21,6 +21,8 @@
 #
 # ##########################################################################
 
+import time
+
 import TCS_config
 import TCS_interface
 import TCS_utils
@@ -36,12 +38,14 @@ class core:
 
         # step info
         self.step_count = 0
+        self.step_times = None  # (preStep, myStep, postStep) sec of the last step
 
         self.test = False  # used for testing code
 
         self.isApp = False
+        self.isAsync = False  # hooks are coroutines (TAS_app_base.async_app)
 
-        self._config = TCS_config.TCS_config()
+        self._config = TCS_config.get_config()
 
         # Interface
         self.interface = TCS_interface.interface("CORE")
@@ -156,10 +160,14 @@ class core:
 
     def step(self):
         self.step_count += 1
+        start = time.perf_counter()
         self.preStep()
+        pre = time.perf_counter()
         self._step_base()
         self.myStep()
+        step = time.perf_counter()
         self.postStep()
+        self.step_times = (pre - start, step - pre, time.perf_counter() - step)
 
     def _step_base(self):
         """
@@ -23,7 +23,6 @@
 
 import hashlib
 import os
-import shutil
 import subprocess
 import sys
 import time
@@ -35,6 +34,10 @@ from typing import List
 import TCS_UIutils
 import TCS_config
 import TCS_configApp
+import TCS_log_atlas
+import TCS_log_binary
+import TCS_log_writer
+import TCS_timing_manager
 import TCS_utils
 import TCS_variables
 
@@ -98,7 +101,8 @@ class interface:
         self.isApp = False
         self.isSysApp = pybird_app
         self._app: required_app_var = required_app_var()
-        self._config = TCS_config.TCS_config()
+        self._atlas_sink: typing.Union[TCS_log_atlas.atlas_sink, None] = None
+        self._config = TCS_config.get_config()
         self._console_available = self._config.console.show_console
         try:
             self.sessionID, self.startUp = read_state_file()
@@ -111,6 +115,7 @@ class interface:
         self.master_log = ''
         self.session_log = ''
         self.app_log = ''
+        self.binary_log = ''
         self.update_dir()
 
         if self._config.system.headless:
@@ -126,6 +131,8 @@ class interface:
         self._app = app
         if self.isApp and self._app._app_config.debug_mode:
             self.allow_debug = True
+        if app._app_config.atlas_logging_enabled and app._app_config.atlas_logging_db != "":
+            self._atlas_sink = TCS_log_atlas.get_sink(app.name, app._app_config.atlas_logging_db)
 
     def _add_node(self, node):
         self._app = node
@@ -153,6 +160,13 @@ class interface:
                 key = "DEV_" + key
             self.app_log: str = self._create_log_file(str(key + self.sourceName + "_LOG.csv"))
 
+        if self._config.logging.enable_binary_log:
+            key = "MASTER_LOG"
+            if self._config.system.development_mode:
+                key = "DEV_MASTER_LOG"
+            self.binary_log: str = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG,
+                                                key + TCS_variables.LOG_BINARY.EXTENSION)
+
     def _create_log_file(self, in_FileName: str) -> str:
         """
 
@@ -185,11 +199,23 @@ class interface:
             print("INVALID CONFIRMATION ABORTING CLEAR")
             return
 
-        log_file = os.listdir(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG)
+        TCS_log_writer.flush()
+        log_file = list_logs()
         for file in log_file:
             try:
                 with open(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file), "w", encoding="utf-8") as f:
                     f.write(header_str)
+                TCS_log_writer.remove_segments(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file))
+                TCS_log_writer.get_writer().forget(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file))
+            except:
+                self.log("Unable to clear " + file, "ERROR")
+
+        for file in binary_logs():
+            path = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file)
+            try:
+                TCS_log_writer.remove_segments(path)
+                os.remove(path)
+                os.remove(TCS_log_binary.index_path(path))
             except:
                 self.log("Unable to clear " + file, "ERROR")
 
@@ -201,7 +227,7 @@ class interface:
         export all logs
         :return:
         """
-        log_files = os.listdir(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG)
+        log_files = list_logs()
         self._export_log(log_files, self.select_export_location(note="ALL LOGS"))
 
     def export_master_log(self):
@@ -270,19 +296,19 @@ class interface:
         conf = TCS_utils.getUserInput_Confirm(in_prompt="Confirm Combine and Export", in_confirmation_code="CONFIRM",
                                               in_case_sensitive=True)
         if conf:
+            TCS_log_writer.flush()
             os.makedirs(loc)
             file_name = "MASTER_COMBINED_SES_LOG.csv"
             file_path = os.path.join(loc, file_name)
             for file in logs:
-                with open(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file), "r", encoding="utf-8") as f:
-                    lines = f.readlines()
-                    TCS_utils.append_text_file(file_path, str("*********START OF " + file + "*********" + (
-                            "," * (len(_LOG_HEADER.split(",")) - 1))))
-                    for line in lines:
-                        TCS_utils.append_text_file(file_path, line.strip())
-                    TCS_utils.append_text_file(file_path, str("*********END OF " + file + "*********" + (
-                            "," * (len(_LOG_HEADER.split(",")) - 1))))
-                    print("Finished with: ", file)
+                lines = TCS_log_writer.read_lines(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file))
+                TCS_utils.append_text_file(file_path, str("*********START OF " + file + "*********" + (
+                        "," * (len(_LOG_HEADER.split(",")) - 1))))
+                for line in lines:
+                    TCS_utils.append_text_file(file_path, line.strip())
+                TCS_utils.append_text_file(file_path, str("*********END OF " + file + "*********" + (
+                        "," * (len(_LOG_HEADER.split(",")) - 1))))
+                print("Finished with: ", file)
 
     def export_keyword(self, keyword: str, select: bool = False):
         """
@@ -303,7 +329,7 @@ class interface:
         :param keyword:
         :return:
         """
-        log_file = os.listdir(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG)
+        log_file = list_logs()
         to_exp = []
         for file in log_file:
             if keyword.upper() in file.upper().replace(".", "_").split("_"):
@@ -371,11 +397,14 @@ class interface:
                                                  in_confirmation_code="CONFIRM",
                                                  in_case_sensitive=True)
         if confirm:
+            TCS_log_writer.flush()
             if not os.path.exists(out_path):
                 os.makedirs(out_path)
             for file in log_file:
-                shutil.copyfile(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file),
-                                os.path.join(out_path, file))
+                # segments are exported as one file
+                lines = TCS_log_writer.read_lines(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file))
+                with open(os.path.join(out_path, file), "w", encoding="utf-8") as f:
+                    f.writelines(lines)
                 print("EXPORT TO:", out_path + "/" + file)
         else:
             print("INVALID CONFIRMATION ABORTING EXPORT")
@@ -418,7 +447,7 @@ class interface:
         """
         con_msg, file_msg = self._build_message(str(in_string), logType=logType)
         self._to_console(con_msg, logType)
-        self._log_to_file(file_msg)
+        self._log_to_file(file_msg, str(in_string), logType)
 
     def log_list(self, in_list: list, logType: str = "MSG") -> None:
         """
@@ -436,7 +465,7 @@ class interface:
             msg += str(in_list[i])
             con_msg, file_msg = self._build_message(msg, logType=logType)
             self._to_console(con_msg, logType)
-            self._log_to_file(file_msg)
+            self._log_to_file(file_msg, msg, logType)
 
     def log_delimiter(self, in_string: str,
                       logType: str = "MSG",
@@ -467,7 +496,7 @@ class interface:
             msg += msgs[i].strip()
             con_msg, file_msg = self._build_message(msg, logType=logType)
             self._to_console(con_msg, logType)
-            self._log_to_file(file_msg)
+            self._log_to_file(file_msg, msg, logType)
 
     def log_multiline(self, in_string: str, logType: str = "MSG") -> None:
         """
@@ -584,37 +613,39 @@ class interface:
         elif self._config.system.headless and msgType.upper() == "SYSTEM NOTICE":
             print(msg)
 
-    def _log_to_file(self, msg: str) -> None:
+    def _log_to_file(self, msg: str, in_string: str = "", logType: str = "MSG") -> None:
         """
-        :param msg: message to be logged
+        Queue a message on the log writer, it is written to the log files in the background
+        :param msg: message to be logged (CSV line)
+        :param in_string: message without the header (binary log)
+        :param logType: type of log (binary log)
         :return: None
         """
-        if self._config.logging.enable_master_log:
-            try:
-                TCS_utils.append_text_file_restricted_file_length(self.master_log,
-                                                                  msg,
-                                                                  self._config.logging.master_log_length)
+        writer = TCS_log_writer.get_writer()
+        error = writer.take_error()
+        if error is not None:
+            raise TCS_variables.PYBIRDIOError("_log_to_file error on primary method only : " + str(error))
 
-            except Exception as e:
-                raise TCS_variables.PYBIRDIOError("_log_to_file error on primary method only (MASTER LOG)")
+        if self._config.logging.enable_master_log:
+            writer.write(self.master_log, msg, self._config.logging.master_log_length)
 
         if self._config.logging.enable_session_log:
-            try:
-                TCS_utils.append_text_file_restricted_file_length(self.session_log,
-                                                                  msg,
-                                                                  self._config.logging.session_log_length)
-
-            except Exception as e:
-                raise TCS_variables.PYBIRDIOError("_log_to_file error on primary method only (SESSION LOG)")
+            writer.write(self.session_log, msg, self._config.logging.session_log_length)
 
         if self._config.logging.enable_app_log:
-            try:
-                TCS_utils.append_text_file_restricted_file_length(self.app_log,
-                                                                  msg,
-                                                                  self._config.logging.app_log_length)
+            writer.write(self.app_log, msg, self._config.logging.app_log_length)
 
-            except Exception as e:
-                raise TCS_variables.PYBIRDIOError("_log_to_file error on primary method only (APP LOG)")
+        if self._config.logging.enable_binary_log or self._atlas_sink is not None:
+            record = TCS_log_binary.log_record(time.time(), self.version.short_str(), self.sessionID,
+                                               self.sourceName, self.get_uptime(), self.get_stepCount(),
+                                               str(logType).upper(), str(in_string))
+            if self._config.logging.enable_binary_log:
+                writer.write_record(self.binary_log, record, self._config.logging.master_log_length)
+            if self._atlas_sink is not None:
+                self._atlas_sink.write(record)
+
+        if not self._config.logging.buffered:
+            writer.flush()
 
     def _log_dict(self, in_dict: dict, logType: str = "MSG", indent: int = 0, total_items: int = 0,
                   in_item_number: int = 1, nested: bool = False) -> int:
@@ -682,6 +713,33 @@ class interface:
                 length += 1
         return length
 
+    def query_log(self,
+                  source_name: typing.Union[str, None] = None,
+                  start: typing.Union[datetime, float, None] = None,
+                  end: typing.Union[datetime, float, None] = None,
+                  session_id: typing.Union[str, None] = None,
+                  logType: typing.Union[str, None] = None) -> List[TCS_log_binary.log_record]:
+        """
+        Get log records from the binary log (logging.enable_binary_log) using its index
+        EX: records for one app in a time window
+            interface.query_log("PY1SYS", start=datetime.utcnow() - timedelta(hours=1))
+        :param source_name: app/subsystem name, None for all
+        :param start: datetime (UTC) or unix time, None for the start of the log
+        :param end: datetime (UTC) or unix time, None for the end of the log
+        :param session_id: None for all
+        :param logType: None for all
+        :return: records oldest first
+        """
+        if self.binary_log == '':
+            raise TCS_variables.PYBIRDIOError("binary log is not enabled (logging.enable_binary_log)")
+        TCS_log_writer.flush()
+        return TCS_log_binary.query(TCS_log_writer.segments(self.binary_log),
+                                    source_name=source_name,
+                                    start=None if start is None else TCS_timing_manager.to_epoch(start),
+                                    end=None if end is None else TCS_timing_manager.to_epoch(end),
+                                    session_id=session_id,
+                                    log_type=logType)
+
     def get_stepCount(self) -> typing.Union[int, None]:
         """
         :return: step count
@@ -841,6 +899,36 @@ def read_state_file():
     return sessionID, start
 
 
+def list_logs() -> List[str]:
+    """
+    Log files in the log directory, rolled segments are not listed (they are read with the log they belong to)
+    binary logs are not listed (binary_logs())
+    :return:
+    """
+    log_files = []
+    for file in os.listdir(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG):
+        path = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG, file)
+        if os.path.isfile(path) and not TCS_log_writer.is_segment(file) and not _is_binary_log(file):
+            log_files.append(file)
+    return log_files
+
+
+def binary_logs() -> List[str]:
+    """
+    Binary logs in the log directory (not including rolled segments)
+    :return:
+    """
+    log_files = []
+    for file in os.listdir(TCS_variables.PYBIRD_DIRECTORIES.DATA_LOG):
+        if file.endswith(TCS_variables.LOG_BINARY.EXTENSION) and not TCS_log_writer.is_segment(file):
+            log_files.append(file)
+    return log_files
+
+
+def _is_binary_log(file: str) -> bool:
+    return file.endswith(TCS_variables.LOG_BINARY.EXTENSION) or file.endswith(TCS_variables.LOG_BINARY.INDEX_EXTENSION)
+
+
 if __name__ == "__main__":
     write_state_file("N000")
     read_state_file()
@@ -0,0 +1,354 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Atlas log sink
+Ships the log records of an app to a capped MongoDB collection (app toml [app_config.atlas.logging])
+
+Records are queued in memory and written in batches from a background thread, logging never waits on the database.
+While the database can not be reached batches are spilled to DATA_ATLAS_SPILL/ATLAS_LOG_<app>_<db>.jsonl and written
+once it is back. Records are dropped (and counted) when the queue or the spill file is full
+Every record gets its _id when it is queued, a record written before a failure is not written again on replay
+"""
+import atexit
+import collections
+import datetime
+import json
+import os
+import threading
+import time
+import typing
+import uuid
+
+import TCS_config
+import TCS_log_binary
+import TCS_variables
+
+
+# MongoDB duplicate key error code
+_DUPLICATE_KEY = 11000
+
+
+class atlas_sink:
+    """
+    Log sink of one app database
+    - write() - queues a record, never blocks
+    - flush() - writes every queued record (or spills it)
+    - close() - flushes and stops the sink thread
+    """
+
+    def __init__(self, app_name: str, db_name: str) -> None:
+        config = TCS_config.get_config().atlas
+        self.app_name = app_name
+        self.db_name = db_name
+        self._max_queue = config.log_queue
+        self._batch = config.log_batch
+        self._interval = config.log_interval
+        self._collection_bytes = config.log_collection_bytes
+        self._spill_bytes = config.log_spill_bytes
+        self._retry_interval = config.log_retry_interval
+        self._spill_path = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_ATLAS_SPILL,
+                                        TCS_variables.ATLAS.LOG_SPILL_PREFIX + app_name + "_" + db_name +
+                                        TCS_variables.ATLAS.LOG_SPILL_EXTENSION)
+
+        self._queue: typing.Deque[TCS_log_binary.log_record] = collections.deque()
+        self._lock = threading.Lock()
+        # serialises flushes, the sink thread and flush() can both write
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._thread: typing.Union[threading.Thread, None] = None
+        self._collection = None
+        # time.monotonic() of the next connection attempt while the database is unreachable
+        self._retry_at = 0.0
+        self.error: typing.Union[str, None] = None
+        self.stats = {"written": 0, "spilled": 0, "dropped": 0}
+
+    def write(self, record: TCS_log_binary.log_record) -> None:
+        """
+        Queue a record, the record is dropped if the queue is full
+        :param record:
+        :return:
+        """
+        with self._lock:
+            if len(self._queue) >= self._max_queue:
+                self.stats["dropped"] += 1
+                return
+            self._queue.append(record)
+            if self._thread is None and not self._closed:
+                self._thread = threading.Thread(target=self._run, name="PYBIRD_ATLAS_LOG", daemon=True)
+                self._thread.start()
+            if len(self._queue) >= self._batch:
+                self._wake.set()
+
+    def flush(self) -> None:
+        """
+        Write every queued record, spilled records are written first
+        :return:
+        """
+        with self._flush_lock:
+            with self._lock:
+                records = list(self._queue)
+                self._queue.clear()
+            documents = [_document(record) for record in records]
+            if time.monotonic() < self._retry_at or not self._write_spill():
+                self._spill(documents)
+                return
+            for start in range(0, len(documents), self._batch):
+                unwritten = self._insert(documents[start:start + self._batch])
+                if len(unwritten) > 0:
+                    self._spill(unwritten + documents[start + self._batch:])
+                    return
+
+    def close(self) -> None:
+        """
+        Flush and stop the sink thread
+        :return:
+        """
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=TCS_variables.LOG_WRITER.CLOSE_TIMEOUT)
+        self.flush()
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(self._interval)
+            self._wake.clear()
+            try:
+                self.flush()
+            except Exception as e:
+                # spill file could not be written, the batch is lost but the sink keeps running
+                self._report(str(e))
+
+    def _connect(self):
+        """
+        Get the log collection, created as a capped collection the first time
+        :return:
+        """
+        if self._collection is None:
+            # imported here, the atlas modules log through TCS_interface
+            import TDS_database_atlas
+            import TKS_keychain
+            from pymongo.errors import CollectionInvalid
+            keys = TKS_keychain.keychain().load_atlas_keys(self.app_name, self.db_name)
+            db = TDS_database_atlas.clients.get(keys[1], keys[2]).get_database(keys[3])
+            del keys
+            try:
+                db.create_collection(TCS_variables.ATLAS.LOG_COLLECTION, capped=True, size=self._collection_bytes)
+            except CollectionInvalid:
+                # already created
+                pass
+            except NotImplementedError:
+                # mongomock has no capped collections
+                pass
+            self._collection = db.get_collection(TCS_variables.ATLAS.LOG_COLLECTION)
+        return self._collection
+
+    def _insert(self, documents: typing.List[dict]) -> typing.List[dict]:
+        """
+        :param documents:
+        :return: the documents that were not written, retried after log_retry_interval
+        """
+        if len(documents) == 0:
+            return []
+        try:
+            collection = self._connect()
+        except Exception as e:
+            return self._unreachable(documents, e)
+        # imported here, pymongo is loaded once the collection is
+        from pymongo.errors import BulkWriteError
+        try:
+            collection.insert_many(documents, ordered=False)
+        except BulkWriteError as e:
+            # unordered, every document without a write error has been written
+            errors = e.details.get("writeErrors", [])
+            # a duplicate _id was written before the database failed
+            # other write errors are rejected by the database on every retry, they are dropped
+            rejected = [error for error in errors if error.get("code") != _DUPLICATE_KEY]
+            self.stats["written"] += len(documents) - len(rejected)
+            self.stats["dropped"] += len(rejected)
+        except Exception as e:
+            return self._unreachable(documents, e)
+        else:
+            self.stats["written"] += len(documents)
+        if self.error is not None:
+            self._report(None)
+        return []
+
+    def _unreachable(self, documents: typing.List[dict], error: Exception) -> typing.List[dict]:
+        """
+        :param documents:
+        :param error:
+        :return: every document, none of them are known to be written
+        """
+        self._retry_at = time.monotonic() + self._retry_interval
+        if self.error is None:
+            self._report(str(error).split("\n")[0])
+        return documents
+
+    def _report(self, error: typing.Union[str, None]) -> None:
+        """
+        Log a change of the sink state, not to the app log (it would be queued on this sink)
+        :param error: None once the database can be reached again
+        :return:
+        """
+        import TCS_interface
+        self.error = error
+        interface = TCS_interface.interface("ATLAS_LOG", pybird_app=True)
+        if error is None:
+            interface.log("Logs of " + self.app_name + " are written to [" + self.db_name + "] again", "INFO")
+        else:
+            interface.log("Logs of " + self.app_name + " can not be written to [" + self.db_name + "], spilling to " +
+                          self._spill_path + " : " + error, "WARNING")
+
+    def _spill(self, documents: typing.List[dict]) -> None:
+        """
+        Append documents to the spill file, documents that do not fit are dropped
+        :param documents:
+        :return:
+        """
+        if len(documents) == 0:
+            return
+        try:
+            size = os.path.getsize(self._spill_path)
+        except OSError:
+            size = 0
+        lines = []
+        for document in documents:
+            line = json.dumps(_to_json(document)) + "\n"
+            size += len(line)
+            if size > self._spill_bytes:
+                self.stats["dropped"] += len(documents) - len(lines)
+                break
+            lines.append(line)
+        with open(self._spill_path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        self.stats["spilled"] += len(lines)
+
+    def _write_spill(self) -> bool:
+        """
+        Write the spilled documents, the ones that could not be written are kept in the spill file
+        :return: False if the database could not be reached
+        """
+        if not os.path.exists(self._spill_path):
+            return True
+        documents = self._read_spill()
+        for start in range(0, len(documents), self._batch):
+            unwritten = self._insert(documents[start:start + self._batch])
+            if len(unwritten) > 0:
+                tmp = self._spill_path + ".tmp"
+                with open(tmp, "w", encoding="utf-8") as f:
+                    f.write("".join(json.dumps(_to_json(document)) + "\n"
+                                    for document in unwritten + documents[start + self._batch:]))
+                os.replace(tmp, self._spill_path)
+                return False
+        os.remove(self._spill_path)
+        return True
+
+    def _read_spill(self) -> typing.List[dict]:
+        """
+        Read the spill file, lines that can not be read are moved to <spill file>.bad and counted as dropped
+        :return: spilled documents
+        """
+        documents = []
+        bad = []
+        with open(self._spill_path, "r", encoding="utf-8", errors="replace") as f:
+            for line in f:
+                if line.strip() == "":
+                    continue
+                try:
+                    documents.append(_from_json(json.loads(line)))
+                except (ValueError, TypeError, KeyError):
+                    bad.append(line if line.endswith("\n") else line + "\n")
+        if len(bad) > 0:
+            with open(self._spill_path + ".bad", "a", encoding="utf-8") as f:
+                f.write("".join(bad))
+            self.stats["dropped"] += len(bad)
+            import TCS_interface
+            TCS_interface.interface("ATLAS_LOG", pybird_app=True).log(
+                str(len(bad)) + " lines of " + self._spill_path + " can not be read, moved to " + self._spill_path +
+                ".bad", "WARNING")
+        return documents
+
+
+def _document(record: TCS_log_binary.log_record) -> dict:
+    return {"_id": uuid.uuid4().hex,
+            "date": datetime.datetime.fromtimestamp(record.timestamp, datetime.timezone.utc),
+            "version": record.version,
+            "session_id": record.session_id,
+            "source": record.source_name,
+            "uptime": record.uptime,
+            "step": record.step_count,
+            "type": record.log_type,
+            "message": record.message}
+
+
+def _to_json(document: dict) -> dict:
+    return dict(document, date=document["date"].timestamp())
+
+
+def _from_json(document: dict) -> dict:
+    return dict(document, date=datetime.datetime.fromtimestamp(document["date"], datetime.timezone.utc))
+
+
+_sinks: typing.Dict[typing.Tuple[str, str], atlas_sink] = {}
+_sinks_lock = threading.Lock()
+
+
+def get_sink(app_name: str, db_name: str) -> atlas_sink:
+    """
+    Get the sink of an app database, shared by every interface of the app in the process
+    :param app_name:
+    :param db_name:
+    :return:
+    """
+    with _sinks_lock:
+        sink = _sinks.get((app_name, db_name))
+        if sink is None:
+            sink = atlas_sink(app_name, db_name)
+            _sinks[(app_name, db_name)] = sink
+        return sink
+
+
+def close() -> None:
+    """
+    Flush and stop every sink
+    :return:
+    """
+    with _sinks_lock:
+        sinks = list(_sinks.values())
+    for sink in sinks:
+        sink.close()
+
+
+def _after_fork() -> None:
+    # the sink threads and locks do not survive a fork and the queued records belong to the parent
+    global _sinks, _sinks_lock
+    _sinks = {}
+    _sinks_lock = threading.Lock()
+
+
+atexit.register(close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
@@ -0,0 +1,257 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Binary Log
+Compact length prefixed log records (TCS_bytes_utils) with a sidecar index
+- <log>.plog - records
+- <log>.pidx - one fixed size entry per record (timestamp, offset, source name, session ID, log type)
+index entries are in the order the records were written (time order), a time window is found with a binary search
+on the index file without reading the log
+"""
+import os
+import struct
+import sys
+import time
+import typing
+import zlib
+
+import TCS_bytes_utils as bu
+import TCS_variables
+
+# timestamp, record offset, source name key, session ID key, log type key, record length
+_ENTRY = struct.Struct("!dQIIII")
+ENTRY_SIZE: int = _ENTRY.size
+
+
+class log_record:
+    """
+    One log message
+    """
+
+    def __init__(self, timestamp: float, version: str, session_id: str, source_name: str, uptime: float,
+                 step_count: typing.Union[int, None], log_type: str, message: str) -> None:
+        self.timestamp = timestamp
+        self.version = version
+        self.session_id = session_id
+        self.source_name = source_name
+        self.uptime = uptime
+        self.step_count = step_count
+        self.log_type = log_type
+        self.message = message
+
+    def to_csv(self) -> str:
+        """
+        Record as a CSV log line
+        :return:
+        """
+        date = time.strftime("%Y-%m-%d %H:%M:%S", time.gmtime(self.timestamp))
+        return ",".join([date, self.version, self.session_id, self.source_name, str(self.uptime)[:8],
+                         str(self.step_count), self.log_type, self.message.replace(",", "|")])
+
+    def __str__(self) -> str:
+        return self.to_csv()
+
+
+def key(value: str) -> int:
+    """
+    Index key of a source name, session ID or log type
+    :param value:
+    :return:
+    """
+    return zlib.crc32(value.upper().encode("utf-8"))
+
+
+def encode_record(record: log_record) -> bytes:
+    """
+    Encode a record, length prefixed
+    :param record:
+    :return:
+    """
+    step_count = -1 if record.step_count is None else record.step_count
+    payload = bu.write_double(record.timestamp)
+    payload += bu.write_text(record.version)
+    payload += bu.write_text(record.session_id)
+    payload += bu.write_text(record.source_name)
+    payload += bu.write_double(record.uptime)
+    payload += bu.write_int64(step_count)
+    payload += bu.write_text(record.log_type)
+    payload += bu.write_text32(record.message)
+    return bu.write_bytes32(payload)
+
+
+def decode_record(in_bytes: bytes, in_index: int = 0) -> typing.Tuple[log_record, int]:
+    """
+    Decode a length prefixed record
+    :param in_bytes:
+    :param in_index:
+    :return: record, index after the record
+    """
+    (payload, next_index) = bu.read_bytes32(in_bytes, in_index)
+    (timestamp, i) = bu.read_double(payload, 0)
+    (version, i) = bu.read_text(payload, i)
+    (session_id, i) = bu.read_text(payload, i)
+    (source_name, i) = bu.read_text(payload, i)
+    (uptime, i) = bu.read_double(payload, i)
+    (step_count, i) = bu.read_int64(payload, i)
+    (log_type, i) = bu.read_text(payload, i)
+    (message, i) = bu.read_text32(payload, i)
+    if step_count == -1:
+        step_count = None
+    return log_record(timestamp, version, session_id, source_name, uptime, step_count, log_type, message), next_index
+
+
+def index_keys(record: log_record) -> tuple:
+    """
+    Index entry of a record without its position in the log
+    :param record:
+    :return: (timestamp, source name key, session ID key, log type key)
+    """
+    return record.timestamp, key(record.source_name), key(record.session_id), key(record.log_type)
+
+
+def index_path(path: str) -> str:
+    """
+    Index file of a binary log
+    :param path: <log>.plog
+    :return: <log>.pidx
+    """
+    return os.path.splitext(path)[0] + TCS_variables.LOG_BINARY.INDEX_EXTENSION
+
+
+def write_records(path: str, records: typing.List[typing.Tuple[bytes, tuple]]) -> None:
+    """
+    Append encoded records to a binary log and its index
+    :param path: <log>.plog
+    :param records: [(encode_record(), index_keys())]
+    :return:
+    """
+    entries = []
+    with open(path, "ab") as f:
+        offset = f.tell()
+        for (data, (timestamp, source_key, session_key, type_key)) in records:
+            f.write(data)
+            entries.append(_ENTRY.pack(timestamp, offset, source_key, session_key, type_key, len(data)))
+            offset += len(data)
+    with open(index_path(path), "ab") as f:
+        f.write(b"".join(entries))
+    if entries[0][8:16] == bytes(8) and sys.platform.startswith(TCS_variables.PLATFORM_CHECK.LINUX):
+        # new log, shared by every node like the CSV logs
+        os.chmod(path, 0o666)
+        os.chmod(index_path(path), 0o666)
+
+
+def record_count(path: str) -> int:
+    """
+    Number of records in a binary log (from the size of its index)
+    :param path: <log>.plog
+    :return:
+    """
+    try:
+        return os.path.getsize(index_path(path)) // ENTRY_SIZE
+    except OSError:
+        return 0
+
+
+class _index:
+    """
+    Index file read one entry at a time
+    """
+
+    def __init__(self, f) -> None:
+        self.f = f
+        self.count = os.fstat(f.fileno()).st_size // ENTRY_SIZE
+
+    def entry(self, i: int) -> tuple:
+        self.f.seek(i * ENTRY_SIZE)
+        return _ENTRY.unpack(self.f.read(ENTRY_SIZE))
+
+    def bisect_time(self, timestamp: float) -> int:
+        """
+        First entry at or after a time
+        :param timestamp:
+        :return:
+        """
+        low = 0
+        high = self.count
+        while low < high:
+            mid = (low + high) // 2
+            if self.entry(mid)[0] < timestamp:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+
+def query(paths: typing.List[str],
+          source_name: typing.Union[str, None] = None,
+          start: typing.Union[float, None] = None,
+          end: typing.Union[float, None] = None,
+          session_id: typing.Union[str, None] = None,
+          log_type: typing.Union[str, None] = None) -> typing.List[log_record]:
+    """
+    Get the records in a time window
+    :param paths: binary log segments, oldest first
+    :param source_name: app/subsystem name, None for all
+    :param start: unix time, None for the start of the log
+    :param end: unix time, None for the end of the log
+    :param session_id: None for all
+    :param log_type: None for all
+    :return: records oldest first
+    """
+    source_key = None if source_name is None else key(source_name)
+    session_key = None if session_id is None else key(session_id)
+    type_key = None if log_type is None else key(log_type)
+    # nodes write in batches so records from different processes can be slightly out of order
+    slack = TCS_variables.LOG_BINARY.ORDER_SLACK
+
+    records = []
+    for path in paths:
+        try:
+            index_file = open(index_path(path), "rb")
+            log_file = open(path, "rb")
+        except FileNotFoundError:
+            # rolled while querying
+            continue
+        with index_file, log_file:
+            index = _index(index_file)
+            i = 0 if start is None else index.bisect_time(start - slack)
+            while i < index.count:
+                (timestamp, offset, source, session, type_, length) = index.entry(i)
+                i += 1
+                if end is not None and timestamp > end + slack:
+                    break
+                if (start is not None and timestamp < start) or (end is not None and timestamp > end):
+                    continue
+                if (source_key is not None and source != source_key) or \
+                        (session_key is not None and session != session_key) or \
+                        (type_key is not None and type_ != type_key):
+                    continue
+                log_file.seek(offset)
+                (record, _) = decode_record(log_file.read(length))
+                # keys are hashes, check the values
+                if (source_name is None or record.source_name == source_name.upper()) and \
+                        (session_id is None or record.session_id == session_id) and \
+                        (log_type is None or record.log_type == log_type.upper()):
+                    records.append(record)
+    return records
@@ -0,0 +1,410 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Log Writer
+Buffers log lines in memory and writes them from a background thread
+log files are only opened once per flush and their line counts are tracked as lines are written (never re-read)
+
+Log files are split into segments, MASTER_LOG.csv is always the newest segment and older segments are
+MASTER_LOG.<n>.csv (larger n is newer). Once a log is over its line limit the oldest segments are deleted
+use segments() / read_lines() to read a log and all of its segments as one log
+"""
+import atexit
+import glob
+import math
+import multiprocessing.util
+import os
+import re
+import sys
+import threading
+import typing
+
+import TCS_log_binary
+import TCS_variables
+
+
+class _log_file:
+    """
+    Pending lines and line count of one log file
+    """
+
+    def __init__(self, path: str, max_length: int, binary: bool = False) -> None:
+        self.path = path
+        self.max_length = max_length
+        self.binary = binary
+        # lines, or (record, index keys) for binary logs
+        self.pending: typing.List[typing.Union[str, tuple]] = []
+        # lines in the file not including the header, None until the file has been counted
+        self.length: typing.Union[int, None] = None
+        self.size = 0
+
+
+class log_writer:
+    """
+    Background log sink shared by every interface in the process
+    - write() - queues a line, never touches the disk
+    - write_record() - queues a binary log record (TCS_log_binary)
+    - flush() - writes every queued line and waits for it to be on disk
+    - close() - flushes and stops the writer thread
+    lines are written when LOG_WRITER.FLUSH_LINES are queued or every LOG_WRITER.FLUSH_INTERVAL sec
+    """
+
+    def __init__(self) -> None:
+        self._files: typing.Dict[str, _log_file] = {}
+        self._queued = 0
+        self._lock = threading.Lock()
+        # serialises flushes, the writer thread and flush() can both write
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._closed = False
+        self._error: typing.Union[Exception, None] = None
+        self._thread: typing.Union[threading.Thread, None] = None
+
+    def write(self, path: str, line: str, max_length: int = -1) -> None:
+        """
+        Queue a line
+        :param path: log file
+        :param line: line without a new line
+        :param max_length: max number of lines in the file not including the header (-1 == no restrictions)
+        :return:
+        """
+        self._queue(path, line + "\n", max_length, False)
+
+    def write_record(self, path: str, record: TCS_log_binary.log_record, max_length: int = -1) -> None:
+        """
+        Queue a binary log record
+        :param path: binary log file (.plog)
+        :param record:
+        :param max_length: max number of records in the log (-1 == no restrictions)
+        :return:
+        """
+        item = (TCS_log_binary.encode_record(record), TCS_log_binary.index_keys(record))
+        self._queue(path, item, max_length, True)
+
+    def _queue(self, path: str, item: typing.Union[str, tuple], max_length: int, binary: bool) -> None:
+        with self._lock:
+            self._start()
+            log_file = self._files.get(path)
+            if log_file is None:
+                log_file = _log_file(path, max_length, binary)
+                self._files[path] = log_file
+            log_file.max_length = max_length
+            log_file.pending.append(item)
+            self._queued += 1
+            if self._queued >= TCS_variables.LOG_WRITER.FLUSH_LINES:
+                self._wake.set()
+        if self._closed:
+            # logged during exit after the writer thread stopped
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write every queued line
+        :return:
+        """
+        with self._flush_lock:
+            with self._lock:
+                batch = [(log_file, log_file.pending) for log_file in self._files.values() if log_file.pending]
+                for log_file, _ in batch:
+                    log_file.pending = []
+                self._queued = 0
+            for log_file, lines in batch:
+                try:
+                    self._write_file(log_file, lines)
+                except Exception as e:
+                    self._error = e
+
+    def close(self) -> None:
+        """
+        Flush and stop the writer thread
+        :return:
+        """
+        self._closed = True
+        self._wake.set()
+        if self._thread is not None and self._thread.is_alive():
+            self._thread.join(timeout=TCS_variables.LOG_WRITER.CLOSE_TIMEOUT)
+        self.flush()
+
+    def take_error(self) -> typing.Union[Exception, None]:
+        """
+        Get and clear the last error raised while writing
+        :return:
+        """
+        error = self._error
+        self._error = None
+        return error
+
+    def forget(self, path: str) -> None:
+        """
+        Drop the tracked line count of a file (the file was changed outside of the writer)
+        :param path:
+        :return:
+        """
+        with self._lock:
+            if path in self._files:
+                self._files[path].length = None
+
+    def _start(self) -> None:
+        if self._thread is None and not self._closed:
+            self._thread = threading.Thread(target=self._run, name="PYBIRD_LOG_WRITER", daemon=True)
+            self._thread.start()
+            # worker processes exit without running atexit, multiprocessing finalizers still run
+            multiprocessing.util.Finalize(self, self.close, exitpriority=0)
+
+    def _run(self) -> None:
+        while not self._closed:
+            self._wake.wait(TCS_variables.LOG_WRITER.FLUSH_INTERVAL)
+            self._wake.clear()
+            self.flush()
+
+    def _write_file(self, log_file: _log_file, lines: typing.List[str]) -> None:
+        """
+        Append lines to a log file, rolling to a new segment when the current one is full
+        :param log_file:
+        :param lines:
+        :return:
+        """
+        if log_file.binary:
+            self._write_binary_file(log_file, lines)
+            return
+        try:
+            size = os.path.getsize(log_file.path)
+        except OSError:
+            size = 0
+        if log_file.length is None or size < log_file.size:
+            # first write to the file or it was cleared/rolled by another process
+            log_file.length = _count_lines(log_file.path)
+        elif size > log_file.size:
+            # another process (node) has written to the file, only count what it added
+            log_file.length += _count_lines(log_file.path, log_file.size)
+
+        if log_file.length >= _segment_lines(log_file.max_length) or \
+                size >= TCS_variables.LOG_ROTATION.MAX_SEGMENT_BYTES:
+            _roll(log_file.path, log_file.max_length)
+            log_file.length = 0
+
+        with open(log_file.path, "a", encoding="utf-8") as f:
+            f.write("".join(lines))
+        log_file.length += len(lines)
+        log_file.size = os.path.getsize(log_file.path)
+
+    def _write_binary_file(self, log_file: _log_file, records: typing.List[tuple]) -> None:
+        """
+        Append records to a binary log, rolling to a new segment when the current one is full
+        :param log_file:
+        :param records:
+        :return:
+        """
+        # the index has one fixed size entry per record, the count is always up to date
+        count = TCS_log_binary.record_count(log_file.path)
+        try:
+            size = os.path.getsize(log_file.path)
+        except OSError:
+            size = 0
+        if count >= _segment_lines(log_file.max_length) or size >= TCS_variables.LOG_ROTATION.MAX_SEGMENT_BYTES:
+            _roll(log_file.path, log_file.max_length, binary=True)
+        TCS_log_binary.write_records(log_file.path, records)
+
+
+def _count_lines(path: str, offset: int = 0) -> int:
+    """
+    Count the lines in a file not including the header
+    :param path:
+    :param offset: only count the lines after this byte offset (the header has already been counted)
+    :return:
+    """
+    if not os.path.exists(path):
+        return 0
+    count = 0
+    with open(path, "rb") as f:
+        f.seek(offset)
+        for block in iter(lambda: f.read(1 << 20), b""):
+            count += block.count(b"\n")
+    if offset > 0:
+        return count
+    return max(count - 1, 0)
+
+
+def _segment_lines(max_length: int) -> float:
+    """
+    Lines per segment
+    :param max_length: max number of lines in the log (-1 == no restrictions)
+    :return:
+    """
+    if max_length < 0:
+        return math.inf
+    return max(max_length // TCS_variables.LOG_ROTATION.SEGMENTS, TCS_variables.LOG_ROTATION.MIN_SEGMENT_LINES)
+
+
+def _roll(path: str, max_length: int, binary: bool = False) -> None:
+    """
+    Move the current segment of a log to the next numbered segment, start a new segment with the same header
+    and delete the oldest segments that are no longer needed to hold max_length lines
+    binary logs are moved with their index and the new segment is created on the next write
+    :param path:
+    :param max_length:
+    :param binary:
+    :return:
+    """
+    rolled = _rolled_segments(path)
+    number = _segment_number(rolled[-1]) + 1 if len(rolled) > 0 else 1
+    (stem, ext) = os.path.splitext(path)
+    if binary:
+        os.replace(TCS_log_binary.index_path(path), TCS_log_binary.index_path(f"{stem}.{number}{ext}"))
+        os.replace(path, f"{stem}.{number}{ext}")
+    else:
+        with open(path, "r", encoding="utf-8") as f:
+            header = f.readline()
+        os.replace(path, f"{stem}.{number}{ext}")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(header)
+        if sys.platform.startswith(TCS_variables.PLATFORM_CHECK.LINUX):
+            os.chmod(path, 0o666)
+    rolled.append(f"{stem}.{number}{ext}")
+
+    if max_length < 0:
+        return
+    keep = math.ceil(max_length / _segment_lines(max_length))
+    for old in rolled[:max(len(rolled) - keep, 0)]:
+        try:
+            os.remove(old)
+            if binary:
+                os.remove(TCS_log_binary.index_path(old))
+        except OSError:
+            pass
+
+
+_SEGMENT = re.compile(r"^(.*)\.(\d+)(\.[^.]*)$")
+
+
+def _segment_number(path: str) -> int:
+    return int(_SEGMENT.match(os.path.basename(path)).group(2))
+
+
+def _rolled_segments(path: str) -> typing.List[str]:
+    """
+    Rolled segments of a log, oldest first (the current segment is not included)
+    :param path:
+    :return:
+    """
+    (stem, ext) = os.path.splitext(path)
+    rolled = [p for p in glob.glob(glob.escape(stem) + ".*" + ext) if is_segment(p)]
+    return sorted(rolled, key=_segment_number)
+
+
+def is_segment(path: str) -> bool:
+    """
+    True if a file is a rolled segment of a log (EX: MASTER_LOG.3.csv)
+    :param path:
+    :return:
+    """
+    return _SEGMENT.match(os.path.basename(path)) is not None
+
+
+def segments(path: str) -> typing.List[str]:
+    """
+    Every segment of a log, oldest first, the log itself is last
+    :param path: log file (EX: MASTER_LOG.csv)
+    :return:
+    """
+    files = _rolled_segments(path)
+    if os.path.exists(path):
+        files.append(path)
+    return files
+
+
+def read_lines(path: str) -> typing.List[str]:
+    """
+    Read a log and all of its segments as one log (one header)
+    :param path: log file (EX: MASTER_LOG.csv)
+    :return: lines including the header
+    """
+    flush()
+    lines = []
+    for segment in segments(path):
+        try:
+            with open(segment, "r", encoding="utf-8") as f:
+                segment_lines = f.readlines()
+        except FileNotFoundError:
+            # deleted by a roll
+            continue
+        if len(lines) > 0:
+            segment_lines = segment_lines[1:]
+        lines.extend(segment_lines)
+    return lines
+
+
+def remove_segments(path: str) -> None:
+    """
+    Delete the rolled segments of a log, the log itself is kept
+    :param path:
+    :return:
+    """
+    for segment in _rolled_segments(path):
+        os.remove(segment)
+        if os.path.exists(TCS_log_binary.index_path(segment)):
+            os.remove(TCS_log_binary.index_path(segment))
+
+
+_writer: typing.Union[log_writer, None] = None
+_writer_lock = threading.Lock()
+
+
+def get_writer() -> log_writer:
+    """
+    Get the process log writer
+    :return:
+    """
+    global _writer
+    if _writer is None:
+        with _writer_lock:
+            if _writer is None:
+                _writer = log_writer()
+    return _writer
+
+
+def flush() -> None:
+    """
+    Write every queued log line
+    :return:
+    """
+    if _writer is not None:
+        _writer.flush()
+
+
+def _close() -> None:
+    if _writer is not None:
+        _writer.close()
+
+
+def _after_fork() -> None:
+    # the writer thread and locks do not survive a fork and the queued lines belong to the parent
+    global _writer, _writer_lock
+    _writer = None
+    _writer_lock = threading.Lock()
+
+
+atexit.register(_close)
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_after_fork)
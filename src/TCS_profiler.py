@@ -0,0 +1,251 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Startup Profiler
+Records a timing tree of the node start up phases when PYBIRD.py is run with --profile-startup
+    --profile-startup                       phase timing tree
+    --profile-startup cprofile              + cProfile stats of start up
+    --profile-startup importtime            + time of every module import (nested under the phase that imported it)
+    --profile-startup cprofile,importtime
+the report is written to DATA_PROFILE/STARTUP_PROFILE_<node>_<time>.txt when start up is complete
+phase() is a no-op when profiling is off
+this module is imported before TCS_variables so that its import time (directory creation) can be profiled
+"""
+import contextlib
+import importlib.abc
+import io
+import os
+import sys
+import threading
+import time
+import typing
+
+from TCS_variables_const import SYS_ARG, PROFILER
+
+
+class _phase:
+    """
+    One node of the timing tree
+    """
+
+    def __init__(self, name: str, parent=None) -> None:
+        self.name = name
+        self.parent = parent
+        self.children: typing.List[_phase] = []
+        self.start = time.perf_counter()
+        self.duration: typing.Union[float, None] = None
+        if threading.current_thread() is not threading.main_thread():
+            self.name += f" [{threading.current_thread().name}]"
+
+
+class startup_profiler:
+    """
+    - phase() - context manager that times a phase, phases opened inside it are its children
+    - report() - timing tree as text
+    - finish() - stops profiling and writes the report
+    """
+
+    def __init__(self, options: typing.List[str]) -> None:
+        self.options = options
+        self.root = _phase("startup")
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._main_stack: typing.List[_phase] = [self.root]
+        self._profile = None
+        self._import_timer = None
+        self.finished = False
+
+        if PROFILER.CPROFILE in options:
+            import cProfile
+            self._profile = cProfile.Profile()
+            self._profile.enable()
+        if PROFILER.IMPORTTIME in options:
+            self._import_timer = _import_timer(self)
+            sys.meta_path.insert(0, self._import_timer)
+
+    def _stack(self) -> typing.List[_phase]:
+        if threading.current_thread() is threading.main_thread():
+            return self._main_stack
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            # phases on other threads (app loading) are children of the main thread's current phase
+            stack = [self._main_stack[-1]]
+            self._local.stack = stack
+        return stack
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        stack = self._stack()
+        node = _phase(name, stack[-1])
+        with self._lock:
+            stack[-1].children.append(node)
+        stack.append(node)
+        try:
+            yield node
+        finally:
+            node.duration = time.perf_counter() - node.start
+            stack.pop()
+
+    def report(self) -> str:
+        """
+        Timing tree, phases shorter than PROFILER.MIN_TIME are left out
+        :return:
+        """
+        total = self.root.duration if self.root.duration is not None else time.perf_counter() - self.root.start
+        lines = [f"{'PHASE':<80}{'ms':>10}{'%':>8}"]
+        self._report(self.root, 0, total, lines)
+        return "\n".join(lines)
+
+    def _report(self, node: _phase, depth: int, total: float, lines: list) -> None:
+        duration = node.duration if node.duration is not None else time.perf_counter() - node.start
+        name = ("  " * min(depth, PROFILER.MAX_INDENT) + node.name)[:79]
+        lines.append(f"{name:<80}{duration * 1000:>10.1f}{duration / total * 100 if total > 0 else 0:>8.1f}")
+        for child in node.children:
+            if child.duration is None or child.duration >= PROFILER.MIN_TIME:
+                self._report(child, depth + 1, total, lines)
+
+    def finish(self, name: str = "") -> typing.Union[str, None]:
+        """
+        Stop profiling and write the report to the log directory
+        :param name: node name
+        :return: report path
+        """
+        if self.finished:
+            return None
+        self.finished = True
+        self.root.duration = time.perf_counter() - self.root.start
+        if self._import_timer is not None and self._import_timer in sys.meta_path:
+            sys.meta_path.remove(self._import_timer)
+        if self._profile is not None:
+            self._profile.disable()
+
+        import TCS_variables
+        stamp = time.strftime("%Y%m%d_%H%M%S", time.gmtime())
+        path = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_PROFILE,
+                            f"{PROFILER.FILE_PREFIX}{name}_{stamp}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"PYBIRD start up profile {name} {' '.join(sys.argv)}\n\n")
+            f.write(self.report() + "\n")
+            if self._profile is not None:
+                import pstats
+                stats_out = io.StringIO()
+                stats = pstats.Stats(self._profile, stream=stats_out)
+                stats.sort_stats("cumulative").print_stats(PROFILER.CPROFILE_LINES)
+                f.write("\ncProfile (cumulative)\n")
+                f.write(stats_out.getvalue())
+                stats.dump_stats(os.path.splitext(path)[0] + ".prof")
+        return path
+
+
+class _import_timer(importlib.abc.MetaPathFinder):
+    """
+    Finds modules with the rest of sys.meta_path and times their execution as profiler phases
+    """
+
+    def __init__(self, profiler: startup_profiler) -> None:
+        self.profiler = profiler
+
+    def find_spec(self, fullname, path=None, target=None):
+        spec = None
+        for finder in sys.meta_path:
+            if finder is self or not hasattr(finder, "find_spec"):
+                continue
+            spec = finder.find_spec(fullname, path, target)
+            if spec is not None:
+                break
+        if spec is None or spec.loader is None or not hasattr(spec.loader, "exec_module"):
+            return spec
+        spec.loader = _timed_loader(spec.loader, self.profiler)
+        return spec
+
+
+class _timed_loader(importlib.abc.Loader):
+    def __init__(self, loader, profiler: startup_profiler) -> None:
+        self.loader = loader
+        self.profiler = profiler
+
+    def __getattr__(self, item):
+        return getattr(self.loader, item)
+
+    def create_module(self, spec):
+        return self.loader.create_module(spec)
+
+    def exec_module(self, module):
+        # the module keeps its own loader
+        module.__loader__ = self.loader
+        if module.__spec__ is not None:
+            module.__spec__.loader = self.loader
+        with self.profiler.phase("import " + module.__name__):
+            self.loader.exec_module(module)
+
+
+def _options() -> typing.Union[typing.List[str], None]:
+    """
+    --profile-startup options from sys.argv
+    :return: None if profiling is off
+    """
+    for flag in SYS_ARG.PROFILE_STARTUP:
+        if flag in sys.argv:
+            index = sys.argv.index(flag) + 1
+            if index < len(sys.argv) and not sys.argv[index].startswith("-"):
+                return sys.argv[index].lower().split(",")
+            return []
+    return None
+
+
+_profiler: typing.Union[startup_profiler, None] = None
+if _options() is not None:
+    _profiler = startup_profiler(_options())
+
+
+def enabled() -> bool:
+    """
+    True while start up is being profiled
+    :return:
+    """
+    return _profiler is not None and not _profiler.finished
+
+
+def phase(name: str):
+    """
+    Time a start up phase
+        with TCS_profiler.phase("read config"):
+            ...
+    :param name:
+    :return:
+    """
+    if not enabled():
+        return contextlib.nullcontext()
+    return _profiler.phase(name)
+
+
+def finish(name: str = "") -> typing.Union[str, None]:
+    """
+    Stop profiling and write the report
+    :param name: node name
+    :return: report path, None if profiling is off
+    """
+    if _profiler is None:
+        return None
+    return _profiler.finish(name)
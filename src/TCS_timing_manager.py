@@ -21,8 +21,11 @@
 #
 # ##########################################################################
 
+import bisect
+import calendar
 import datetime
 import time
+import typing
 
 import TCS_configApp
 
@@ -36,9 +39,30 @@ day_codes: dict = {
     "U": 6
 }
 
+SECONDS_PER_DAY: int = 24 * 60 * 60
+SECONDS_PER_WEEK: int = 7 * SECONDS_PER_DAY
+_EPOCH_MONDAY: int = 4 * SECONDS_PER_DAY  # 5 Jan 1970 00:00:00 UTC, first monday after the unix epoch
+
+cron_day_names: dict = {
+    "SUN": 0,
+    "MON": 1,
+    "TUE": 2,
+    "WED": 3,
+    "THU": 4,
+    "FRI": 5,
+    "SAT": 6
+}
+
 
 class TimingManager:
-    def __init__(self, name, parameters: TCS_configApp._app_config):
+    """
+    Step timing for an app
+    Times are float seconds, interval modes (test, step, cont) run on time.monotonic() so wall clock changes do not
+    make them drift or double fire, wall clock modes (time, once, start) are kept as unix time (UTC)
+    datetimes are only used at the edges (config strings, myTimeRequest)
+    """
+
+    def __init__(self, name, parameters: "TCS_configApp._app_config"):
         self._app_config: TCS_configApp._app_config = parameters
         self.name: str = self._app_config.app_code
         self.mode = self._app_config.timing_mode
@@ -47,23 +71,29 @@ class TimingManager:
         self.timing_time_list = self._app_config.timing_time_list
         self.timing_once = self._app_config.timing_once
 
-        self.last_time = datetime.datetime.utcnow()
+        # scheduled time of the current step, unix time and monotonic
+        self.last_time: float = time.time()
+        self.mono_time: float = time.monotonic()
+        # 'request' or 'never' when the step is not at a fixed time
+        self._state: typing.Union[str, None] = None
+        self._wall_clock = self.mode in ['time', 'once', 'start']
 
         self._start_complete = False
 
         if self.mode == 'test':
             self._next_time = self._next_time_test
-            self.last_time = self.last_time - datetime.timedelta(seconds=60)
+            self.mono_time = self.mono_time - 60
         elif self.mode == 'step':
             self._next_time = self._next_time_step
-            self.step_duration = self._step_duration_decode(self.step_duration)
-            if self.step_sync_time != "":
-                self.temp_time = datetime.datetime.strptime(self.step_sync_time, "%d %b %Y %H:%M:%S")
-                delta = datetime.datetime.utcnow().timestamp() - self.temp_time.timestamp()
+            self.step_duration = self._app_config.step_seconds
+            if self._app_config.sync_time is not None:
+                sync_time = self._app_config.sync_time
+                delta = self.last_time - sync_time
                 mult = delta // self.step_duration
-                self.last_time = self.temp_time + datetime.timedelta(seconds=self.step_duration * mult)
+                self.mono_time = epoch_to_monotonic(sync_time + self.step_duration * mult)
         elif self.mode == 'time':
             self._next_time = self._next_time_time
+            self.time_calendar = self._app_config.time_calendar
         elif self.mode == 'cont':
             self._next_time = self._next_time_cont
         elif self.mode == 'request':
@@ -72,138 +102,264 @@ class TimingManager:
             self._next_time = self._next_time_start
         elif self.mode == 'once':
             self._next_time = self._next_time_once
+            self.once_time = self._app_config.once_time
         else:
             raise ValueError(f"Invalid mode: {self.mode}")
 
-    def get_cur_time(self):
+    def get_cur_time(self) -> typing.Union[float, str]:
         """
         Get the current step time
-        :return:
+        :return: time.monotonic() time the step is due, 'request' or 'never'
         """
-        return self.last_time
+        if self._state is not None:
+            return self._state
+        if self._wall_clock:
+            # follow wall clock changes
+            return epoch_to_monotonic(self.last_time)
+        return self.mono_time
 
-    def set_next_time(self):
+    def get_cur_datetime(self) -> typing.Union[datetime.datetime, str]:
+        """
+        Get the current step time as a datetime (UTC)
+        :return: datetime, 'request' or 'never'
+        """
+        if self._state is not None:
+            return self._state
+        return to_datetime(self.last_time)
+
+    def set_next_time(self) -> typing.Union[float, str]:
         """
         Set the next time
-        :return:
+        :return: unix time (wall clock modes), time.monotonic() time (interval modes), 'request' or 'never'
         """
         next_time = self._next_time()
-        self.last_time = next_time
+        if isinstance(next_time, str):
+            self._state = next_time
+            return next_time
+
+        self._state = None
+        if self._wall_clock:
+            self.last_time = next_time
+            self.mono_time = epoch_to_monotonic(next_time)
+        else:
+            self.mono_time = next_time
+            self.last_time = monotonic_to_epoch(next_time)
         return next_time
 
-    def _next_time_test(self):
+    def _next_time_test(self) -> float:
         """
         Get the next time for the test mode
         :return:
         """
-        return self.last_time + datetime.timedelta(seconds=60)
+        return self.mono_time + 60
 
-    def _next_time_step(self):
+    def _next_time_step(self) -> float:
         """
         Get the next time for the step mode
         :return:
         """
         if self._app_config.timing_step_skip_missed:
-            delta = datetime.datetime.utcnow().timestamp() - self.last_time.timestamp()
+            delta = time.monotonic() - self.mono_time
             if delta < self.step_duration:
-                return self.last_time + datetime.timedelta(seconds=self.step_duration)
+                return self.mono_time + self.step_duration
             else:
                 mult = delta // self.step_duration
-                return self.last_time + datetime.timedelta(seconds=self.step_duration * (mult + 1))
+                return self.mono_time + self.step_duration * (mult + 1)
         else:
-            return self.last_time + datetime.timedelta(seconds=self.step_duration)
+            return self.mono_time + self.step_duration
 
-    def _next_time_time(self):
+    def _next_time_time(self) -> typing.Union[float, str]:
         """
         Get the next time for the time mode
         :return:
         """
-        # build a list of times
-        time_list = []
-        for time in self.timing_time_list:
-            split_time = time.split()
-            my_time = datetime.datetime.strptime(split_time[0], "%H:%M:%S")
-            now = datetime.datetime.utcnow()
-            my_time = my_time.replace(year=now.year, month=now.month, day=now.day)
-            if split_time[1] in day_codes:
-                delta = day_codes[split_time[1]] - my_time.weekday()
-
-                if delta == 0:
-                    if my_time.timestamp() < now.timestamp():
-                        delta += 7
-                elif delta < 0:
-                    delta += 7
-
-                my_time = my_time + datetime.timedelta(days=delta)
-                time_list.append(my_time)
-            elif split_time[1] == "E":
-                if my_time.timestamp() < now.timestamp():
-                    my_time = my_time + datetime.timedelta(days=1)
-                time_list.append(my_time)
-        time_list.sort()
-        for time in time_list:
-            if time.timestamp() > self.last_time.timestamp():
-                return time
-
-    def _next_time_cont(self):
+        if len(self.time_calendar) == 0:
+            return 'never'
+        # first calendar entry after the later of the last step and now
+        ref = max(self.last_time, time.time())
+        offset = (ref - _EPOCH_MONDAY) % SECONDS_PER_WEEK
+        week_start = ref - offset
+        index = bisect.bisect_right(self.time_calendar, offset)
+        if index == len(self.time_calendar):
+            week_start += SECONDS_PER_WEEK
+            index = 0
+        return week_start + self.time_calendar[index]
+
+    def _next_time_cont(self) -> float:
         """
         Get the next time for the cont mode
         :return:
         """
-        return self.last_time
+        return self.mono_time
 
-    def _next_time_request(self):
+    def _next_time_request(self) -> str:
         """
         Get the next time for the request mode
         :return:
         """
         return 'request'
 
-    def _next_time_once(self):
+    def _next_time_once(self) -> typing.Union[float, str]:
         """
         Get the next time for the once mode
         :return:
         """
-        my_time = datetime.datetime.strptime(self.timing_once, "%d %b %Y %H:%M:%S")
-        if my_time.timestamp() > datetime.datetime.utcnow().timestamp():
-            return my_time
+        if self.once_time > time.time():
+            return self.once_time
         return 'never'
 
-    def _next_time_start(self):
+    def _next_time_start(self) -> typing.Union[float, str]:
         """
         Get the next time for the start mode
         :return:
         """
         if not self._start_complete:
             self._start_complete = True
-            return datetime.datetime.utcnow()
+            return time.time()
         return 'never'
 
-    def _step_duration_decode(self, duration: str):
-        """
-        Decode the step duration
-        :param duration:
-        :return:
-        """
-        accepted_vals = "dhms"
-        split_time = duration.split()
-        if len(split_time) == 1:
-            if split_time[0][-1] in accepted_vals:
-                split_time.append(split_time[0][-1])
-                split_time[0] = split_time[0][:-1]
-            else:
-                split_time.append("s")
-        if split_time[1] == "d":
-            return int(split_time[0]) * 24 * 60 * 60
-        elif split_time[1] == "h":
-            return int(split_time[0]) * 60 * 60
-        elif split_time[1] == "m":
-            return int(split_time[0]) * 60
+
+def parse_utc(in_time: str) -> float:
+    """
+    Parse a config time string ("1 Jan 2024 00:00:00", UTC) to unix time
+    :param in_time:
+    :return:
+    """
+    return float(calendar.timegm(time.strptime(in_time, "%d %b %Y %H:%M:%S")))
+
+
+def to_epoch(in_time: typing.Union[datetime.datetime, float, int]) -> float:
+    """
+    Convert a datetime (naive datetimes are UTC, EX: datetime.utcnow()) or unix time to unix time
+    :param in_time:
+    :return:
+    """
+    if isinstance(in_time, datetime.datetime):
+        if in_time.tzinfo is None:
+            in_time = in_time.replace(tzinfo=datetime.timezone.utc)
+        return in_time.timestamp()
+    return float(in_time)
+
+
+def to_datetime(in_time: float) -> datetime.datetime:
+    """
+    Convert unix time to a naive UTC datetime (same as datetime.utcnow())
+    :param in_time:
+    :return:
+    """
+    return datetime.datetime.fromtimestamp(in_time, datetime.timezone.utc).replace(tzinfo=None)
+
+
+def epoch_to_monotonic(in_time: float) -> float:
+    """
+    Convert unix time to time.monotonic() time using the current wall clock
+    :param in_time:
+    :return:
+    """
+    return in_time - time.time() + time.monotonic()
+
+
+def monotonic_to_epoch(in_time: float) -> float:
+    """
+    Convert time.monotonic() time to unix time using the current wall clock
+    :param in_time:
+    :return:
+    """
+    return in_time - time.monotonic() + time.time()
+
+
+def compile_time_list(time_list: list) -> list:
+    """
+    Compile a time mode time list into sorted seconds of the week (UTC, 0 = Monday 00:00:00)
+    Entries are either
+        "HH:MM:SS D" where D is a day code or E for every day
+        cron "minute hour day_of_month month day_of_week" with an optional leading second field
+        day of month and month must be "*" (schedules repeat weekly)
+    :param time_list:
+    :return:
+    """
+    calendar = set()
+    for entry in time_list:
+        fields = entry.split()
+        if len(fields) == 2:
+            calendar.update(_compile_time_entry(fields))
+        elif len(fields) in [5, 6]:
+            calendar.update(_compile_cron_entry(fields))
         else:
-            return int(split_time[0])
+            raise ValueError(f"Invalid time list entry: {entry}")
+    return sorted(calendar)
+
+
+def _compile_time_entry(fields: list) -> list:
+    """
+    Compile a "HH:MM:SS D" entry
+    :param fields:
+    :return: seconds of the week
+    """
+    my_time = datetime.datetime.strptime(fields[0], "%H:%M:%S")
+    seconds = my_time.hour * 60 * 60 + my_time.minute * 60 + my_time.second
+    if fields[1] in day_codes:
+        return [day_codes[fields[1]] * SECONDS_PER_DAY + seconds]
+    elif fields[1] == "E":
+        return [day * SECONDS_PER_DAY + seconds for day in range(7)]
+    raise ValueError(f"Invalid day code: {fields[1]}")
+
+
+def _compile_cron_entry(fields: list) -> list:
+    """
+    Compile a cron entry
+    :param fields: [second] minute hour day_of_month month day_of_week
+    :return: seconds of the week
+    """
+    if fields[-3] != "*" or fields[-2] != "*":
+        raise ValueError(f"Cron day of month and month must be '*': {' '.join(fields)}")
+    if len(fields) == 5:
+        fields = ["0"] + fields
+    seconds = _cron_field(fields[0], 0, 59)
+    minutes = _cron_field(fields[1], 0, 59)
+    hours = _cron_field(fields[2], 0, 23)
+    # cron counts days from sunday (0 or 7), day codes count from monday
+    days = set((day - 1) % 7 for day in _cron_field(fields[5], 0, 7, cron_day_names))
+    return [day * SECONDS_PER_DAY + hour * 60 * 60 + minute * 60 + second
+            for day in days for hour in hours for minute in minutes for second in seconds]
+
+
+def _cron_field(field: str, low: int, high: int, names: dict = None) -> list:
+    """
+    Expand a cron field ("*", "5", "1-5", "*/15", "0-30/10", "MON,WED") into its values
+    :param field:
+    :param low: lowest allowed value
+    :param high: highest allowed value
+    :param names: value names (EX: day names)
+    :return:
+    """
+    values = set()
+    for part in field.upper().split(","):
+        step = 1
+        if "/" in part:
+            part, step = part.split("/")
+            step = int(step)
+        if part == "*":
+            start, end = low, high
+        elif "-" in part:
+            start, end = [_cron_value(i, names) for i in part.split("-")]
+        else:
+            start = _cron_value(part, names)
+            end = start if step == 1 else high
+        if start < low or end > high or start > end or step < 1:
+            raise ValueError(f"Invalid cron field: {field}")
+        values.update(range(start, end + 1, step))
+    return sorted(values)
+
+
+def _cron_value(value: str, names: dict = None) -> int:
+    if names is not None and value in names:
+        return names[value]
+    return int(value)
 
 
 class test_config:
+    # a compiled TCS_configApp._app_config
     app_code = "test"
     timing_mode = "time"
     timing_step_duration = "1 s"
@@ -217,11 +373,19 @@ class test_config:
                         "16:00:00 M",
                         "17:00:00 T",
                         "18:00:00 E"]
+    timing_once = ""
+    step_seconds = 1
+    sync_time = None
+    once_time = None
+    time_calendar = None
 
 
 if __name__ == "__main__":
+    test_config.sync_time = parse_utc(test_config.timing_step_sync_time)
+    test_config.time_calendar = compile_time_list(test_config.timing_time_list)
     test = TimingManager("", test_config())
     for i in range(1):
-        print(test.set_next_time())
+        test.set_next_time()
+        print(test.get_cur_datetime())
         print(datetime.datetime.utcnow())
         time.sleep(2)
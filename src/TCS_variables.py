@@ -119,6 +119,21 @@ class PYBIRD_DIRECTORIES:
     DATA_APPDATA: str = os.path.join(DATA, DIRECTORY_NAME.APPDATA, NETWORK_NAME)
     _make_path(DATA_APPDATA)
 
+    DATA_CACHE: str = os.path.join(DATA, DIRECTORY_NAME.CACHE)
+    _make_path(DATA_CACHE)
+
+    # node step metrics dumps (TNS_node.dump_metrics), not logs
+    DATA_METRICS: str = os.path.join(DATA, DIRECTORY_NAME.METRICS)
+    _make_path(DATA_METRICS)
+
+    # start up profiles (TCS_profiler), not logs
+    DATA_PROFILE: str = os.path.join(DATA, DIRECTORY_NAME.PROFILE)
+    _make_path(DATA_PROFILE)
+
+    # app logs kept while their atlas database is unreachable (TCS_log_atlas), not logs of the node
+    DATA_ATLAS_SPILL: str = os.path.join(DATA, DIRECTORY_NAME.ATLAS_SPILL)
+    _make_path(DATA_ATLAS_SPILL)
+
     # endregion
     ####################################################################################################
     # region HOME Directories .pybird
@@ -81,6 +81,7 @@ class SYS_ARG:
     DEVENV = ['--devenv']  # a flag for running a specific dev environment configuration
     REMOTE = ['--remote']  # set the remote directory for the system
     PLATFORM = ['--platform']  # set the platform for the system
+    PROFILE_STARTUP = ['--profile-startup']  # write a start up timing report (optional: cprofile,importtime)
 
     _help_msg = """
     Information:
@@ -106,6 +107,8 @@ class SYS_ARG:
       |--network        Run with a specific Network Configuration
       |--remote         Set the remote directory for the system
       |--platform       Set the platform for the system
+      |--profile-startup  Write a start up timing report to the log directory
+                          (optional: cprofile, importtime or cprofile,importtime)
     
     """
 
@@ -134,6 +137,10 @@ class DIRECTORY_NAME:
     SESSION = 'session'
     APPDATA = 'appdata'
     ADD_CRED = "add_cred"
+    CACHE = "cache"
+    PROFILE = "profile"
+    METRICS = "metrics"
+    ATLAS_SPILL = "atlas_spill"
     HOME_DATA_AES = '.aes'
     HOME_DATA_APP = '.app'
     HOME_DATA_ATLAS = '.atlas'
@@ -196,6 +203,10 @@ class AES:
     BLOCK_SIZE = 16
     PASS_LENGTH = 16
     ENCODING = "utf-8"
+    # encrypted container (TKS_container)
+    CONTAINER_MAGIC = b"PYBC"
+    CONTAINER_VERSION = 1
+    CHUNK_SIZE = 64 * 1024
 
 
 @dataclass
@@ -206,9 +217,121 @@ class DEFAULT:
     COMMAND_LINE_KEY = 'python3'
 
 
+@dataclass
+class SCHEDULER:
+    """
+    Node scheduler
+    """
+    IDLE_DELAY = 1  # sec, sleep between passes when no apps are scheduled
+    MAX_SLEEP = 60  # sec, longest sleep between passes so wall clock changes are picked up
+    CLOCK_JUMP = 1  # sec, wall clock change that reschedules the wall clock apps
+
+
+@dataclass
+class NVM:
+    """
+    App data (NVM_dataInterface) storage
+    """
+    FILE = "file"  # one pickle file per data name
+    SQLITE = "sqlite"  # one sqlite database per app
+    DB_EXTENSION = ".db"
+    BUSY_TIMEOUT = 5  # sec, wait for another process writing the same database
+
+
+@dataclass
+class CONFIG_CACHE:
+    """
+    Start up cache of the parsed config files (data/cache)
+    """
+    EXTENSION = ".cache"
+    FORMAT = 2  # bump when the cached objects change
+
+
+@dataclass
+class PROFILER:
+    """
+    Start up profiler (--profile-startup)
+    """
+    CPROFILE = "cprofile"
+    IMPORTTIME = "importtime"
+    MIN_TIME = 0.0005  # sec, shorter phases are left out of the report
+    CPROFILE_LINES = 60
+    MAX_INDENT = 20  # deepest indent level of the timing tree
+    FILE_PREFIX = "STARTUP_PROFILE_"
+
+
+@dataclass
+class STARTUP:
+    """
+    Node start up
+    """
+    LOAD_WORKERS = 8  # apps imported and constructed concurrently
+    LAZY_DELAY = 60  # sec, apps first due later than this after start are loaded when they are first due
+
+
+@dataclass
+class EXECUTOR:
+    """
+    Node executor modes
+    """
+    # node modes
+    SERIAL = "serial"  # all apps step one at a time on the node
+    POOL = "pool"  # apps that opt in step on a worker pool
+    ASYNCIO = "asyncio"  # node runs on an event loop, async apps step concurrently, worker pools are enabled
+    # app pools
+    NONE = "none"  # step on the node
+    THREAD = "thread"  # I/O bound apps
+    PROCESS = "process"  # CPU bound apps (app must be picklable)
+
+
+@dataclass
+class LOG_WRITER:
+    """
+    Background log writer
+    """
+    FLUSH_LINES = 256  # queued lines that wake the writer
+    FLUSH_INTERVAL = 0.5  # sec, longest a line waits before it is written
+    CLOSE_TIMEOUT = 5  # sec, wait for the writer thread on exit
+
+
+@dataclass
+class LOG_ROTATION:
+    """
+    Log segments
+    """
+    SEGMENTS = 10  # a log with a line limit is split into this many segments
+    MIN_SEGMENT_LINES = 100
+    MAX_SEGMENT_BYTES = 16 * 1024 * 1024  # a segment is rolled at this size even if it is under its line count
+
+
+@dataclass
+class LOG_BINARY:
+    """
+    Binary log (TCS_log_binary)
+    """
+    EXTENSION = ".plog"
+    INDEX_EXTENSION = ".pidx"
+    ORDER_SLACK = 5  # sec, records written by different processes can be this far out of time order
+
+
+@dataclass
+class METRICS:
+    """
+    Node step metrics
+    """
+    MIN_VALUE = 1e-5  # sec, lower bound of the histograms
+    MAX_VALUE = 1e4  # sec, upper bound of the histograms
+    BUCKETS_PER_DECADE = 20
+    FILE_PREFIX = "METRICS_"  # metrics dump file, DATA_METRICS/METRICS_<node>.json
+
+
 @dataclass
 class ATLAS:
-    LOG_COLLECTION = "log"
+    LOG_COLLECTION = "log"  # capped collection app logs are written to (TCS_log_atlas)
+    LOG_SPILL_PREFIX = "ATLAS_LOG_"  # DATA_ATLAS_SPILL/ATLAS_LOG_<app>_<db>.jsonl, logs kept while the database is unreachable
+    LOG_SPILL_EXTENSION = ".jsonl"
+    PYMONGO = "pymongo"  # MongoDB server
+    MONGOMOCK = "mongomock"  # in process stand-in for local testing, no server needed
 
 
 HELP = """
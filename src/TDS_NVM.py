@@ -21,27 +21,216 @@
 #
 # ##########################################################################
 
+import collections
+import hashlib
 import os
 import pickle
+import sqlite3
 import sys
+import threading
+import time
+import typing
 
 import TCS_interface
 import TCS_variables
+import TKS_container
 import TKS_encryption
 
 
 class NVM_dataInterface:
-    def __init__(self, app_code: str, save_key: str = "") -> None:
+    """
+    App data storage
+    - save() - pickles and stores a value under a data name
+    - load() - loads the value of a data name, None if it has not been saved
+    - flush() - writes the cached values that have changed
+    - end_step() - flushes every flush_steps steps or flush_interval seconds
+    - flush_due() - flushes if flush_interval seconds have passed, called by the node between steps
+    values are stored by a backend (TCS_variables.NVM), FILE keeps one pickle file per data name,
+    SQLITE keeps all the values of an app in one database and reads only the requested value
+    with a cache (cache_size > 0) the values of the last cache_size data names are kept in memory, saves only mark a
+    value dirty and dirty values are pickled and written by flush() (values that have not changed since they were last
+    written are not written again)
+    load() then returns the cached value itself, not a copy, a loaded value that is changed has to be saved again to be
+    written
+    """
+
+    def __init__(self, app_code: str, save_key: str = "", backend: str = TCS_variables.NVM.SQLITE,
+                 cache_size: int = 0, flush_steps: int = 0, flush_interval: float = 0) -> None:
         self._app_code = app_code
         self._save_key = save_key
         if save_key == "":
             self._encryption = False
+            self._my_aes = None
         else:
             self._encryption = True
-            self._my_aes = TKS_encryption.AES_savekey(app_name=self._app_code, save_key=self._save_key)
+            self._my_aes = TKS_encryption.savekey(app_name=self._app_code, save_key=self._save_key)
         self._app_dir = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_APPDATA, app_code.upper())
         if not os.path.exists(self._app_dir):
             os.makedirs(self._app_dir)
+        self._files = _file_store(self._app_code, self._app_dir, self._my_aes)
+        if backend == TCS_variables.NVM.SQLITE:
+            self._store = _sqlite_store(self._app_code, self._app_dir, self._my_aes, self._files)
+        else:
+            self._store = self._files
+
+        # data key: cached value, least recently used first
+        self._cache: collections.OrderedDict[str, _cache_entry] = collections.OrderedDict()
+        self._cache_size = cache_size
+        self._flush_steps = flush_steps
+        self._flush_interval = flush_interval
+        self._steps = 0
+        self._next_flush = time.monotonic() + flush_interval
+        # a value has been saved since the last flush
+        self._dirty = False
+
+    def save(self, data_name: str, data):
+        """
+        Save data to file
+        :param data_name:
+        :param data:
+        :return:
+        """
+        if self._cache_size <= 0:
+            self._store.put(data_name, pickle.dumps(data))
+            return
+        key = _data_key(data_name)
+        entry = self._cache.get(key)
+        if entry is None:
+            self._cache_put(key, _cache_entry(data_name, data, None, True))
+        else:
+            entry.value = data
+            entry.dirty = True
+            self._cache.move_to_end(key)
+        self._dirty = True
+
+    def load(self, data_name: str):
+        """
+        Load data from file
+        :param data_name:
+        :return:
+        """
+        try:
+            key = _data_key(data_name)
+            if self._cache_size > 0 and key in self._cache:
+                self._cache.move_to_end(key)
+                return self._cache[key].value
+            my_data = self._store.get(data_name)
+            if my_data is None:
+                return None
+            data = pickle.loads(my_data)
+            if self._cache_size > 0:
+                self._cache_put(key, _cache_entry(data_name, data, hashlib.sha1(my_data).digest(), False))
+            return data
+        except (EOFError, pickle.UnpicklingError, TCS_variables.PYBIRDValueError) as e:
+            app_inter = TCS_interface.interface(self._app_code)
+            app_inter.log("Error loading data: " + data_name, "ERROR")
+            if self._encryption:
+                app_inter.log("File may be corrupted or the save key may have changed", "ERROR")
+            else:
+                app_inter.log("File may be corrupted", "ERROR")
+            del app_inter
+            if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                raise e
+
+            return None
+
+    def _cache_put(self, key: str, entry) -> None:
+        self._cache[key] = entry
+        self._cache.move_to_end(key)
+        while len(self._cache) > self._cache_size:
+            _, evicted = self._cache.popitem(last=False)
+            if evicted.dirty:
+                self._write(evicted)
+
+    def _write(self, entry) -> bool:
+        """
+        Write a dirty value, values that pickle to what was last written are not written again
+        :param entry:
+        :return: True if the value was written
+        """
+        my_data = pickle.dumps(entry.value)
+        digest = hashlib.sha1(my_data).digest()
+        entry.dirty = False
+        if digest == entry.digest:
+            return False
+        self._store.put(entry.data_name, my_data)
+        entry.digest = digest
+        return True
+
+    def flush(self) -> int:
+        """
+        Write the cached values that have changed
+        :return: number of values written
+        """
+        # a flush that fails is tried again after flush_interval, not on every pass of the node
+        self._steps = 0
+        self._next_flush = time.monotonic() + self._flush_interval
+        written = 0
+        for entry in self._cache.values():
+            if entry.dirty and self._write(entry):
+                written += 1
+        self._dirty = False
+        return written
+
+    def end_step(self) -> None:
+        """
+        Count an app step, the cache is flushed every flush_steps steps or flush_interval seconds
+        :return:
+        """
+        if self._cache_size <= 0:
+            return
+        self._steps += 1
+        if self._flush_steps > 0 and self._steps >= self._flush_steps:
+            self.flush()
+        else:
+            self.flush_due()
+
+    def next_flush(self) -> typing.Union[float, None]:
+        """
+        time.monotonic() time flush_due() will write the cache
+        :return: None if there is nothing to write or flush_interval is off
+        """
+        if self._cache_size <= 0 or self._flush_interval <= 0 or not self._dirty:
+            return None
+        return self._next_flush
+
+    def flush_due(self) -> int:
+        """
+        Flush the cache if flush_interval seconds have passed since the last flush
+        the node calls this between steps so apps that step rarely do not keep saved values in memory until their
+        next step
+        :return: number of values written
+        """
+        if self._cache_size <= 0 or self._flush_interval <= 0 or time.monotonic() < self._next_flush:
+            return 0
+        return self.flush()
+
+
+class _cache_entry:
+    __slots__ = ("data_name", "value", "digest", "dirty")
+
+    def __init__(self, data_name: str, value, digest: typing.Union[bytes, None], dirty: bool) -> None:
+        self.data_name = data_name
+        self.value = value
+        self.digest = digest  # sha1 of the pickled value last written or loaded, None if it has not been written
+        self.dirty = dirty  # saved since it was last written
+
+
+def _data_key(data_name: str) -> str:
+    # data names are not case sensitive
+    return data_name.replace(" ", "_").upper()
+
+
+class _file_store:
+    """
+    One pickle file per data name, encrypted files are encrypted containers (TKS_container)
+    files written by older versions (the hex of the pickle AES encrypted and base64 encoded) are still read
+    """
+
+    def __init__(self, app_code: str, app_dir: str, aes: typing.Union[TKS_encryption._AES, None]) -> None:
+        self._app_code = app_code
+        self._app_dir = app_dir
+        self._my_aes = aes
 
     def _file_name(self, data_name: str):
         filename = ""
@@ -57,68 +246,102 @@ class NVM_dataInterface:
         return self._file_name(data_name) + ".enc"
 
     def _get_file_name(self, data_name: str):
-        if self._encryption:
+        if self._my_aes is not None:
             return self._file_enc_name(data_name)
         else:
             return self._file_name(data_name)
 
-    def save(self, data_name: str, data):
-        """
-        Save data to file
-        :param data_name:
-        :param data:
-        :return:
-        """
+    def put(self, data_name: str, my_data: bytes) -> None:
         file = self._get_file_name(data_name)
-        with open(file, 'wb') as f:
-            my_data = pickle.dumps(data)
-            if self._encryption:
-                my_data_hex = my_data.hex()
-                my_data_enc = self._my_aes.encrypt(my_data_hex)
-                f.write(my_data_enc)
+        temp_file = file + "." + str(os.getpid())
+        with open(temp_file, 'wb') as f:
+            if self._my_aes is not None:
+                with TKS_container.writer(f, self._my_aes.container_key) as container:
+                    container.write(my_data)
             else:
                 f.write(my_data)
+        os.replace(temp_file, file)
 
-    def load(self, data_name: str):
-        """
-        Load data from file
-        :param data_name:
-        :return:
-        """
+    def get(self, data_name: str) -> typing.Union[bytes, None]:
         file = self._get_file_name(data_name)
-        if os.path.isfile(file):
-            with open(file, 'rb') as f:
-                if self._encryption:
-                    try:
-                        my_data_enc = f.read()
-                        my_data_hex = self._my_aes.decrypt(my_data_enc.decode()).decode(TCS_variables.AES.ENCODING)
-                        my_data = bytes.fromhex(my_data_hex)
-                        return pickle.loads(bytes(my_data))
-                    except EOFError as e:
-                        app_inter = TCS_interface.interface(self._app_code)
-                        app_inter.log("Error loading data: " + data_name, "ERROR")
-                        app_inter.log("File may be corrupted or the save key may have changed", "ERROR")
-                        del app_inter
-                        if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
-                            raise e
-
-                        return None
-
-                else:
-                    try:
-                        my_data = f.read()
-                        return pickle.loads(my_data)
-                    except EOFError as e:
-                        app_inter = TCS_interface.interface(self._app_code)
-                        app_inter.log("Error loading data: " + data_name, "ERROR")
-                        app_inter.log("File may be corrupted", "ERROR")
-                        del app_inter
-                        if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
-                            raise e
-
-                        return None
-        else:
+        if not os.path.isfile(file):
             return None
+        with open(file, 'rb') as f:
+            if self._my_aes is not None:
+                if TKS_container.is_container(f.read(TKS_container.HEADER_SIZE)):
+                    f.seek(0)
+                    return b"".join(TKS_container.read_chunks(f, self._my_aes.container_key))
+                f.seek(0)
+                my_data_enc = f.read()
+                my_data_hex = self._my_aes.decrypt(my_data_enc.decode()).decode(TCS_variables.AES.ENCODING)
+                return bytes.fromhex(my_data_hex)
+            return f.read()
+
+
+class _sqlite_store:
+    """
+    All the values of an app in one sqlite database (DATA_APPDATA/<APP>/<APP>.db)
+    a write is a single transaction, readers only read the requested value
+    encrypted values are encrypted containers (TKS_container), encrypted and plain values are kept apart (like the .enc
+    files)
+    values that are not in the database are read from the FILE store once and moved into the database
+    """
+
+    def __init__(self, app_code: str, app_dir: str, aes: typing.Union[TKS_encryption._AES, None],
+                 legacy: _file_store) -> None:
+        self._path = os.path.join(app_dir, app_code.upper() + TCS_variables.NVM.DB_EXTENSION)
+        self._my_aes = aes
+        self._encrypted = 0 if aes is None else 1
+        self._legacy = legacy
+        self._lock = threading.Lock()
+        self._db: typing.Union[sqlite3.Connection, None] = None
+        self._pid = None
+
+    def __getstate__(self):
+        # apps are sent to worker processes, each process opens its own connection
+        state = self.__dict__.copy()
+        state["_db"] = None
+        state["_lock"] = None
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._db is None or self._pid != os.getpid():
+            self._db = sqlite3.connect(self._path, timeout=TCS_variables.NVM.BUSY_TIMEOUT, isolation_level=None,
+                                       check_same_thread=False)
+            self._db.execute("PRAGMA journal_mode=WAL")
+            self._db.execute("PRAGMA synchronous=NORMAL")
+            self._db.execute("CREATE TABLE IF NOT EXISTS nvm "
+                             "(name TEXT NOT NULL, encrypted INTEGER NOT NULL, value BLOB NOT NULL, "
+                             "PRIMARY KEY (name, encrypted))")
+            self._pid = os.getpid()
+        return self._db
+
+    def put(self, data_name: str, my_data: bytes) -> None:
+        if self._my_aes is not None:
+            my_data = TKS_container.encrypt(self._my_aes.container_key, my_data)
+        with self._lock:
+            self._connect().execute("INSERT OR REPLACE INTO nvm (name, encrypted, value) VALUES (?, ?, ?)",
+                                    (_data_key(data_name), self._encrypted, my_data))
+
+    def get(self, data_name: str) -> typing.Union[bytes, None]:
+        with self._lock:
+            row = self._connect().execute("SELECT value FROM nvm WHERE name = ? AND encrypted = ?",
+                                          (_data_key(data_name), self._encrypted)).fetchone()
+        if row is None:
+            my_data = self._legacy.get(data_name)
+            if my_data is not None:
+                self.put(data_name, my_data)
+            return my_data
+        if self._my_aes is not None:
+            if TKS_container.is_container(row[0]):
+                return TKS_container.decrypt(self._my_aes.container_key, row[0])
+            # AES-CBC values stored before the container format
+            return self._my_aes.decrypt_bytes(row[0])
+        return row[0]
 
 
 if __name__ == "__main__":
@@ -21,13 +21,140 @@
 #
 # ##########################################################################
 
+import collections.abc
+import os
+import threading
+import time
+import typing
+
+import bson
+from pymongo.errors import BulkWriteError, PyMongoError
 from pymongo.mongo_client import MongoClient
 from pymongo.server_api import ServerApi
 
+import TCS_config
 import TCS_utils
+import TCS_variables
 import TKS_keychain
 
 
+def _uri_label(uri: str) -> str:
+    """
+    uri without credentials, options and database, safe to log
+    :param uri:
+    :return:
+    """
+    scheme, _, rest = uri.partition("://")
+    hosts = rest.rpartition("@")[2].split("/")[0].split("?")[0]
+    return scheme + "://" + hosts
+
+
+class client_registry:
+    """
+    Node wide registry of MongoDB clients
+    Apps share one client (and its connection pool) per URI instead of opening their own, clients connect on first use
+    """
+
+    def __init__(self) -> None:
+        self._clients: typing.Dict[typing.Tuple[str, str], typing.Any] = dict()
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def get(self, uri: str, server_api: str) -> typing.Union[MongoClient, typing.Any]:
+        """
+        Get the shared client of a URI, the client is created the first time it is needed
+        :param uri:
+        :param server_api: stable API version
+        :return:
+        """
+        with self._lock:
+            if self._pid != os.getpid():
+                # clients are not fork safe, a worker process opens its own
+                self._clients = dict()
+                self._pid = os.getpid()
+            client = self._clients.get((uri, server_api))
+            if client is None:
+                client = self._new_client(uri, server_api)
+                self._clients[(uri, server_api)] = client
+            return client
+
+    def _new_client(self, uri: str, server_api: str) -> typing.Union[MongoClient, typing.Any]:
+        """
+        :param uri:
+        :param server_api:
+        :return: pymongo client, mongomock client if the atlas client is mongomock
+        """
+        config = TCS_config.get_config().atlas
+        if config.client == TCS_variables.ATLAS.MONGOMOCK:
+            import mongomock
+            return mongomock.MongoClient(uri)
+        elif config.client != TCS_variables.ATLAS.PYMONGO:
+            raise TCS_variables.PYBIRDValueError("Invalid atlas client: " + str(config.client))
+        return MongoClient(uri,
+                           server_api=ServerApi(server_api),
+                           connect=False,
+                           maxPoolSize=config.max_pool_size,
+                           minPoolSize=config.min_pool_size,
+                           maxIdleTimeMS=int(config.max_idle_time * 1000),
+                           connectTimeoutMS=int(config.connect_timeout * 1000),
+                           serverSelectionTimeoutMS=int(config.server_selection_timeout * 1000))
+
+    def health(self) -> typing.Dict[str, dict]:
+        """
+        Health of every client, from the state the client already monitors (does not block on the server)
+        :return: {uri label: {"topology": str, "servers": {address: {"type": str, "rtt": sec, "error": str}}}}
+        """
+        with self._lock:
+            clients = list(self._clients.items())
+        health = dict()
+        for (uri, _), client in clients:
+            if not isinstance(client, MongoClient):
+                health[_uri_label(uri)] = {"topology": TCS_variables.ATLAS.MONGOMOCK, "servers": {}}
+                continue
+            description = client.topology_description
+            servers = dict()
+            for address, server in description.server_descriptions().items():
+                servers[address[0] + ":" + str(address[1])] = {
+                    "type": server.server_type_name,
+                    "rtt": server.round_trip_time,
+                    "error": None if server.error is None else str(server.error).split("\n")[0]}
+            health[_uri_label(uri)] = {"topology": description.topology_type_name, "servers": servers}
+        return health
+
+    def report(self) -> str:
+        """
+        Health of every client as text
+        :return:
+        """
+        lines = []
+        for label, client in self.health().items():
+            lines.append(label + " [" + client["topology"] + "]")
+            for address, server in client["servers"].items():
+                rtt = "-" if server["rtt"] is None else "{:.1f} ms".format(server["rtt"] * 1000)
+                line = "    " + address + " " + server["type"] + " rtt " + rtt
+                if server["error"] is not None:
+                    line += " error: " + server["error"]
+                lines.append(line)
+        return "\n".join(lines)
+
+    def close(self) -> None:
+        """
+        Close all clients
+        :return:
+        """
+        with self._lock:
+            clients = list(self._clients.values()) if self._pid == os.getpid() else []
+            self._clients = dict()
+        for client in clients:
+            client.close()
+
+    def __len__(self) -> int:
+        return len(self._clients)
+
+
+clients = client_registry()
+
+
 # https://stackoverflow.com/questions/4421207/how-to-get-the-last-n-records-in-mongodb
 class mongodb_atlas:
     def __init__(self, app, DB_name) -> None:
@@ -46,16 +173,8 @@ class mongodb_atlas:
             self.server_api = keys[2]
             self.database_name = keys[3]
 
-            self.client = MongoClient(self.uri, server_api=ServerApi(self.server_api))
-
-            try:
-                self.client.admin.command('ping')
-                self._app.interface.dlog("Connected to MongoDB Atlas")
-            except Exception as e:
-                self._app.interface.log("Could not connect to MongoDB Atlas [" + self.database_name + "]")
-                e_mod = str(e).split("\n")
-                for i in e_mod:
-                    self._app.interface.log(i)
+            # shared with the other apps of the node, connects on first use
+            self.client = clients.get(self.uri, self.server_api)
 
             self.db = self.client.get_database(self.database_name)
         except:
@@ -91,6 +210,20 @@ class mongodb_atlas:
         """
         return self.db.get_collection(collection_name)
 
+    def ping(self) -> bool:
+        """
+        Check the connection to the database server, blocks up to the server selection timeout
+        :return: True if the server answered
+        """
+        try:
+            self.client.admin.command('ping')
+            return True
+        except Exception as e:
+            self._app.interface.log("Could not connect to MongoDB Atlas [" + self.db.name + "]")
+            for i in str(e).split("\n"):
+                self._app.interface.log(i)
+            return False
+
     def database_status(self):
         """
         Get the database status
@@ -99,5 +232,274 @@ class mongodb_atlas:
         return self.db.command({"dbStats": 1})
 
 
+# duplicate key error, a retried batch finds the documents the failed attempt already wrote
+_DUPLICATE_KEY = 11000
+
+
+class buffered_collection:
+    """
+    Collection that queues writes and sends them in batches from a background thread
+    A batch is written when buffer_documents, buffer_bytes or buffer_age is reached, runs of queued documents with
+    insert_many (unordered) and runs of operations with bulk_write (ordered), in the order they were queued
+    writes that fail because the server can not be reached are retried with backoff and dropped after write_retries
+    Every other attribute (find, count_documents, ...) is the one of the collection
+    """
+
+    def __init__(self, collection, interface, buffer_documents: int = None, buffer_bytes: int = None,
+                 buffer_age: float = None, write_retries: int = None, retry_backoff: float = None) -> None:
+        """
+        thresholds default to the [system_config.atlas] values
+        :param collection: pymongo collection
+        :param interface: interface errors are logged to
+        :param buffer_documents: queued writes
+        :param buffer_bytes: queued BSON size, only documents are counted
+        :param buffer_age: sec since the oldest queued write
+        :param write_retries:
+        :param retry_backoff: sec before the first retry, doubled on every retry
+        """
+        config = TCS_config.get_config().atlas
+        self.collection = collection
+        self._interface = interface
+        self._max_documents = config.buffer_documents if buffer_documents is None else buffer_documents
+        self._max_bytes = config.buffer_bytes if buffer_bytes is None else buffer_bytes
+        self._max_age = config.buffer_age if buffer_age is None else buffer_age
+        self._write_retries = config.write_retries if write_retries is None else write_retries
+        self._retry_backoff = config.retry_backoff if retry_backoff is None else retry_backoff
+
+        self._queue: list = []
+        self._bytes = 0
+        self._oldest: typing.Union[float, None] = None
+        self._condition = threading.Condition()
+        # one batch is written at a time so batches reach the server in order
+        self._flush_lock = threading.Lock()
+        self._thread: typing.Union[threading.Thread, None] = None
+        self._closed = False
+        self.stats = {"written": 0, "batches": 0, "retries": 0, "dropped": 0}
+
+    def __getattr__(self, item):
+        return getattr(self.__dict__["collection"], item)
+
+    def insert_one(self, document: dict) -> typing.Any:
+        """
+        Queue a document, the _id is set right away so retried batches are not written twice
+        :param document:
+        :return: _id of the document
+        """
+        document.setdefault("_id", bson.ObjectId())
+        self._put([document])
+        return document["_id"]
+
+    def insert_many(self, documents: typing.Iterable[dict]) -> list:
+        """
+        Queue documents
+        :param documents:
+        :return: _id of the documents
+        """
+        documents = list(documents)
+        for document in documents:
+            document.setdefault("_id", bson.ObjectId())
+        self._put(documents)
+        return [document["_id"] for document in documents]
+
+    def bulk_write(self, requests: typing.Iterable) -> None:
+        """
+        Queue write operations (pymongo InsertOne, UpdateOne, DeleteMany, ...), they are written in order with the
+        queued documents
+        operations are retried when the server can not be reached, an operation that is not idempotent ($inc, $push,
+        ...) is applied twice if the failed attempt had already reached the server
+        :param requests:
+        :return:
+        """
+        self._put(list(requests))
+
+    def _put(self, items: list) -> None:
+        """
+        :param items: documents or write operations
+        :return:
+        """
+        size = 0
+        if self._max_bytes > 0:
+            size = sum(len(bson.encode(item)) for item in items if isinstance(item, collections.abc.Mapping))
+        with self._condition:
+            if self._closed:
+                # nothing left to write in the background after close
+                self._queue.extend(items)
+            else:
+                if self._thread is None:
+                    self._thread = threading.Thread(target=self._run, name="buffered_collection", daemon=True)
+                    self._thread.start()
+                started = self._oldest is None
+                if started:
+                    self._oldest = time.monotonic()
+                self._queue.extend(items)
+                self._bytes += size
+                # the writer waits without a timeout while the queue is empty, it starts the buffer_age timer
+                if started or self._due():
+                    self._condition.notify()
+                return
+        self.flush()
+
+    def _due(self) -> bool:
+        """
+        True if the queue has reached a threshold, call with the condition held
+        :return:
+        """
+        if len(self._queue) == 0:
+            return False
+        return len(self._queue) >= self._max_documents or \
+            (0 < self._max_bytes <= self._bytes) or \
+            time.monotonic() - self._oldest >= self._max_age
+
+    def _run(self) -> None:
+        """
+        background writer
+        :return:
+        """
+        while True:
+            with self._condition:
+                while not self._closed and not self._due():
+                    timeout = None
+                    if self._oldest is not None:
+                        timeout = max(self._oldest + self._max_age - time.monotonic(), 0)
+                    self._condition.wait(timeout)
+                if self._closed:
+                    return
+            self.flush()
+
+    def flush(self) -> None:
+        """
+        Write everything that is queued, blocks until written or dropped
+        :return:
+        """
+        with self._flush_lock:
+            with self._condition:
+                batch = self._queue
+                self._queue = []
+                self._bytes = 0
+                self._oldest = None
+            if len(batch) > 0:
+                self._write(batch)
+
+    def close(self) -> None:
+        """
+        Stop the background writer and write everything that is queued
+        :return:
+        """
+        with self._condition:
+            self._closed = True
+            self._condition.notify()
+        if self._thread is not None:
+            self._thread.join()
+        self.flush()
+
+    def _write(self, batch: list) -> None:
+        """
+        Write a batch, runs of documents and runs of operations are written in order
+        :param batch: documents or write operations
+        :return:
+        """
+        start = 0
+        while start < len(batch):
+            is_document = isinstance(batch[start], collections.abc.Mapping)
+            end = start
+            while end < len(batch) and isinstance(batch[end], collections.abc.Mapping) == is_document:
+                end += 1
+            try:
+                if is_document:
+                    written = self._write_documents(batch[start:end])
+                else:
+                    written = self._write_operations(batch[start:end])
+            except Exception as e:
+                # not a server error, retrying will not help
+                written = False
+                error = str(e)
+            else:
+                error = "server can not be reached"
+            if not written:
+                self.stats["dropped"] += len(batch) - start
+                self._interface.log("Collection [" + self.collection.name + "]: " + str(len(batch) - start) +
+                                    " writes dropped: " + error, "ERROR")
+                return
+            start = end
+        self.stats["batches"] += 1
+
+    def _write_documents(self, documents: list) -> bool:
+        """
+        Insert documents (unordered), retried with backoff when the server can not be reached
+        documents that fail for another reason (EX: duplicate _id) are dropped, the others are written
+        :param documents:
+        :return: False if the server could not be reached after write_retries
+        """
+        delay = self._retry_backoff
+        for attempt in range(self._write_retries + 1):
+            try:
+                self.collection.insert_many(documents, ordered=False)
+                self.stats["written"] += len(documents)
+                return True
+            except BulkWriteError as e:
+                # a retry finds the documents the failed attempt already wrote as duplicates
+                failed = [error for error in e.details.get("writeErrors", [])
+                          if attempt == 0 or error.get("code") != _DUPLICATE_KEY]
+                self.stats["written"] += len(documents) - len(failed)
+                self._log_failed(failed)
+                return True
+            except PyMongoError:
+                if attempt == self._write_retries:
+                    return False
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+        return False
+
+    def _write_operations(self, requests: list) -> bool:
+        """
+        Write operations (ordered), retried with backoff when the server can not be reached
+        an operation that fails for another reason is dropped and the ones after it are written
+        :param requests:
+        :return: False if the server could not be reached after write_retries
+        """
+        delay = self._retry_backoff
+        attempt = 0
+        while len(requests) > 0:
+            try:
+                self.collection.bulk_write(requests, ordered=True)
+                self.stats["written"] += len(requests)
+                return True
+            except BulkWriteError as e:
+                # ordered, the operations before the first error were applied and the ones after it were not
+                errors = e.details.get("writeErrors", [])
+                if len(errors) == 0:
+                    # only write concern errors, every operation was applied
+                    self.stats["written"] += len(requests)
+                    return True
+                index = errors[0]["index"]
+                if attempt > 0 and errors[0].get("code") == _DUPLICATE_KEY:
+                    # an InsertOne the failed attempt already wrote
+                    self.stats["written"] += index + 1
+                else:
+                    self.stats["written"] += index
+                    self._log_failed(errors[:1])
+                requests = requests[index + 1:]
+            except PyMongoError:
+                if attempt == self._write_retries:
+                    return False
+                attempt += 1
+                self.stats["retries"] += 1
+                time.sleep(delay)
+                delay *= 2
+        return True
+
+    def _log_failed(self, errors: list) -> None:
+        """
+        Count and log writes the server refused
+        :param errors: writeErrors of a BulkWriteError
+        :return:
+        """
+        if len(errors) == 0:
+            return
+        self.stats["dropped"] += len(errors)
+        self._interface.log("Collection [" + self.collection.name + "]: " + str(len(errors)) +
+                            " writes failed: " + str(errors[0].get("errmsg")), "ERROR")
+
 if __name__ == "__main__":
     pass
@@ -20,11 +20,14 @@
 #   michael@dompke.dev
 #
 # ##########################################################################
+import io
 import os
+import typing
 from contextlib import contextmanager
 
 import TCS_utils
 import TCS_variables
+import TKS_container
 import TKS_encryption
 
 
@@ -37,7 +40,7 @@ class TDS_file:
             self._encryption = False
         else:
             self._encryption = True
-            self._my_aes = TKS_encryption.AES_savekey(app_name=self._appName, save_key=self._saveKey)
+            self._my_aes = TKS_encryption.savekey(app_name=self._appName, save_key=self._saveKey)
 
     def open(self, file, mode='r', buffering=-1, encoding=None, errors=None, newline=None, closefd=True, opener=None):
 
@@ -85,48 +88,243 @@ def openFile(file, mode='r', buffering=-1, encoding=None, errors=None, newline=N
         f.close()
 
 
-@contextmanager
-def openFileEnc(file, aes, mode='r', buffering=-1, encoding=None, errors=None, newline=None, closefd=True, opener=None):
+def openFileEnc(file, aes, mode='r', buffering=-1, encoding=None, errors=None, newline=None, closefd=True,
+                opener=None):
+    """
+    Open an encrypted file (file + ".enc"), the file is decrypted and encrypted chunk by chunk as it is read and
+    written, appending only re-encrypts the last chunk and no plain text is written to disk
+    files encrypted before the container format are read as they are and converted when they are written to
+    :param file: plain text file name
+    :param aes: TKS_encryption._AES
+    :param mode: open() mode
+    :return: file object
+    """
+    filename_enc = file + ".enc"
+    if "r" in mode and "+" not in mode:
+        if os.path.isfile(filename_enc) and not _is_container_file(filename_enc):
+            # read the old format without converting it
+            with open(filename_enc, "rb") as f:
+                raw = io.BytesIO(aes.decrypt(f.read(), _type=bytes))
+            return _wrap(raw, mode, buffering, encoding, errors, newline)
+    elif os.path.isfile(filename_enc) and not _is_container_file(filename_enc) and "w" not in mode:
+        _convert_file(filename_enc, aes)
+    if "w" in mode and os.path.isfile(filename_enc):
+        TCS_utils.copy_file_to_old(filename_enc)
+    raw = _encrypted_file(filename_enc, aes.container_key, mode)
+    return _wrap(raw, mode, buffering, encoding, errors, newline)
+
+
+def _is_container_file(filename: str) -> bool:
+    with open(filename, "rb") as f:
+        return TKS_container.is_container(f.read(TKS_container.HEADER_SIZE))
+
+
+def _convert_file(filename_enc: str, aes) -> None:
+    """
+    Re-encrypt a file from before the container format, the old file is kept as .old
+    :param filename_enc:
+    :param aes:
+    :return:
+    """
+    with open(filename_enc, "rb") as f:
+        data = aes.decrypt(f.read(), _type=bytes)
+    TCS_utils.copy_file_to_old(filename_enc)
+    temp_file = filename_enc + "." + str(os.getpid())
+    with open(temp_file, "wb") as f:
+        with TKS_container.writer(f, aes.container_key) as container:
+            container.write(data)
+    os.replace(temp_file, filename_enc)
+
+
+def _wrap(raw, mode, buffering, encoding, errors, newline):
+    """
+    Buffer a raw file and add text decoding like open()
+    :return:
+    """
     if "b" in mode:
-        write = "wb"
-        read = "rb"
+        if buffering == 0:
+            return raw
+        buffer_size = io.DEFAULT_BUFFER_SIZE if buffering in (-1, 1) else buffering
+        if raw.readable() and raw.writable():
+            return io.BufferedRandom(raw, buffer_size)
+        if raw.writable():
+            return io.BufferedWriter(raw, buffer_size)
+        return io.BufferedReader(raw, buffer_size)
+    if raw.readable() and raw.writable():
+        buffer = io.BufferedRandom(raw)
+    elif raw.writable():
+        buffer = io.BufferedWriter(raw)
     else:
-        write = "w"
-        read = "r"
+        buffer = io.BufferedReader(raw)
+    return io.TextIOWrapper(buffer, encoding=encoding or TCS_variables.AES.ENCODING, errors=errors, newline=newline,
+                            line_buffering=buffering == 1)
 
-    filename_enc = file + ".enc"
-    filename_temp = file + ".__temp__"
-
-    if os.path.isfile(filename_enc):
-        with open(filename_enc, "rb") as f1:
-            data_enc = f1.read()
-            data = aes.decrypt(data_enc, _type=bytes)
-            with open(filename_temp, write) as f2:
-                if 'b' not in mode:
-                    data = data.decode(TCS_variables.AES.ENCODING)
-                f2.write(data)
-
-    f = open(file=filename_temp,
-             mode=mode,
-             buffering=buffering,
-             encoding=encoding,
-             errors=errors,
-             newline=newline,
-             closefd=closefd,
-             opener=opener)
-    try:
-        yield f
-    finally:
-        f.close()
 
-    if os.path.isfile(filename_enc):
-        TCS_utils.copy_file_to_old(filename_enc)
-    with open(filename_temp, read) as f1:
-        new_data = f1.read()
-        data = aes.encrypt(new_data)
-        with open(filename_enc, "wb+") as f2:
-            f2.write(data)
-    os.remove(filename_temp)
+class _encrypted_file(io.RawIOBase):
+    """
+    Raw file over an encrypted container (TKS_container)
+    one chunk is kept decrypted in memory, it is encrypted and written back when another chunk is needed or on close
+    the file only grows, writing past the end fills the gap with zeros
+    """
+
+    def __init__(self, filename: str, key: bytes, mode: str) -> None:
+        super().__init__()
+        self._mode = mode
+        self._readable = "r" in mode or "+" in mode
+        self._writable = "r" not in mode or "+" in mode
+        self._append = "a" in mode
+        self._key = key
+        if "x" in mode and os.path.exists(filename):
+            raise FileExistsError(filename)
+        create = "w" in mode or "x" in mode or (self._append and not os.path.exists(filename))
+        self._f = open(filename, "w+b" if create else ("r+b" if self._writable else "rb"))
+        self.name = filename
+
+        # decrypted chunk
+        self._chunk_index: typing.Union[int, None] = None
+        self._chunk = bytearray()
+        self._dirty = False
+        self._pos = 0
+        if create:
+            self._chunk_size = TCS_variables.AES.CHUNK_SIZE
+            self._head = TKS_container.header(self._chunk_size)
+            self._f.write(self._head)
+            self._size = 0
+            self._disk_chunks = 0
+            self._disk_last = None  # chunk sealed as the last chunk on disk
+            # an empty file is one empty chunk
+            self._chunk_index = 0
+            self._dirty = True
+        else:
+            self._head = self._f.read(TKS_container.HEADER_SIZE)
+            self._chunk_size = TKS_container.read_header(self._head)
+            data_size = self._f.seek(0, io.SEEK_END) - TKS_container.HEADER_SIZE
+            self._disk_chunks = max(1, -(-data_size // self._record_size()))
+            self._size = data_size - self._disk_chunks * TKS_container.OVERHEAD
+            if self._size < 0:
+                raise TCS_variables.PYBIRDValueError("encrypted container is truncated")
+            self._disk_last = self._disk_chunks - 1
+            self._load(self._disk_chunks - 1 if self._append else 0)
+        if self._append:
+            self._pos = self._size
+
+    def _record_size(self) -> int:
+        return self._chunk_size + TKS_container.OVERHEAD
+
+    def _chunks(self) -> int:
+        return max(1, -(-self._size // self._chunk_size))
+
+    def _read_chunk(self, index: int) -> bytearray:
+        if index >= self._disk_chunks:
+            return bytearray()
+        self._f.seek(TKS_container.HEADER_SIZE + index * self._record_size())
+        record = self._f.read(self._record_size())
+        return bytearray(TKS_container.open_chunk(self._key, self._head, index, index == self._disk_last, record))
+
+    def _write_chunk(self, index: int, plain: bytes) -> None:
+        last = index == self._chunks() - 1
+        if last and self._disk_last is not None and self._disk_last < index:
+            # the chunk that was last is now followed by others
+            self._reseal(self._disk_last)
+        self._f.seek(TKS_container.HEADER_SIZE + index * self._record_size())
+        self._f.write(TKS_container.seal(self._key, self._head, index, last, bytes(plain)))
+        self._disk_chunks = max(self._disk_chunks, index + 1)
+        if last:
+            self._disk_last = index
+        elif self._disk_last == index:
+            self._disk_last = None
+
+    def _reseal(self, index: int) -> None:
+        plain = self._read_chunk(index)
+        self._f.seek(TKS_container.HEADER_SIZE + index * self._record_size())
+        self._f.write(TKS_container.seal(self._key, self._head, index, False, bytes(plain)))
+        self._disk_last = None
+
+    def _load(self, index: int) -> None:
+        if index == self._chunk_index:
+            return
+        self._store()
+        self._chunk = self._read_chunk(index)
+        self._chunk_index = index
+
+    def _store(self) -> None:
+        if self._dirty:
+            self._write_chunk(self._chunk_index, self._chunk)
+            self._dirty = False
+
+    def readable(self) -> bool:
+        return self._readable
+
+    def writable(self) -> bool:
+        return self._writable
+
+    def seekable(self) -> bool:
+        return True
+
+    def tell(self) -> int:
+        return self._pos
+
+    def seek(self, offset: int, whence: int = io.SEEK_SET) -> int:
+        if whence == io.SEEK_CUR:
+            offset += self._pos
+        elif whence == io.SEEK_END:
+            offset += self._size
+        if offset < 0:
+            raise ValueError("negative seek position " + str(offset))
+        self._pos = offset
+        return self._pos
+
+    def readinto(self, b) -> int:
+        if not self._readable:
+            raise io.UnsupportedOperation("not readable")
+        if self._pos >= self._size:
+            return 0
+        self._load(self._pos // self._chunk_size)
+        offset = self._pos - self._chunk_index * self._chunk_size
+        count = min(len(b), len(self._chunk) - offset, self._size - self._pos)
+        b[:count] = self._chunk[offset:offset + count]
+        self._pos += count
+        return count
+
+    def write(self, b) -> int:
+        if not self._writable:
+            raise io.UnsupportedOperation("not writable")
+        if self._append:
+            self._pos = self._size
+        data = memoryview(b).cast("B")
+        if self._pos > self._size:
+            self._pos, gap = self._size, self._pos - self._size
+            self.write(bytes(gap))
+        written = 0
+        while written < len(data):
+            self._load(self._pos // self._chunk_size)
+            offset = self._pos - self._chunk_index * self._chunk_size
+            count = min(len(data) - written, self._chunk_size - offset)
+            self._chunk[offset:offset + count] = data[written:written + count]
+            self._dirty = True
+            written += count
+            self._pos += count
+            self._size = max(self._size, self._pos)
+        return written
+
+    def flush(self) -> None:
+        if not self.closed and self._writable:
+            self._store()
+            self._f.flush()
+
+    def close(self) -> None:
+        if self.closed:
+            return
+        try:
+            if self._writable:
+                self._store()
+                if self._disk_last != self._chunks() - 1:
+                    self._load(self._chunks() - 1)
+                    self._dirty = True
+                    self._store()
+        finally:
+            super().close()
+            self._f.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,206 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Encrypted Container
+Chunked AES-GCM format for encrypted app data and files, raw binary (no hex or base64)
+    header  : magic (4) | version (1) | chunk size (4)
+    chunks  : nonce (12) | cipher text (chunk size, the last chunk may be shorter) | tag (16)
+every chunk is authenticated with the header, its index and whether it is the last chunk, so chunks can not be
+reordered, dropped or the file truncated without decryption failing
+every chunk has its own random nonce, a chunk can be re-encrypted in place (appending to the last chunk)
+    - encrypt() / decrypt() - bytes to bytes
+    - writer - streams plain text into a container on a file handle
+    - read_chunks() - streams the plain text chunks of a container on a file handle
+    - is_container() - true if the bytes start with a container header
+"""
+import secrets
+import struct
+import typing
+
+from Crypto.Cipher import AES as _aes
+
+import TCS_variables
+
+_HEADER = struct.Struct("!4sBI")
+_INDEX = struct.Struct("!QB")
+HEADER_SIZE = _HEADER.size
+NONCE_SIZE = 12
+TAG_SIZE = 16
+OVERHEAD = NONCE_SIZE + TAG_SIZE  # bytes per chunk
+
+
+def is_container(data: bytes) -> bool:
+    """
+    true if data starts with a container header
+    :param data: at least the first 4 bytes
+    :return:
+    """
+    return data[:len(TCS_variables.AES.CONTAINER_MAGIC)] == TCS_variables.AES.CONTAINER_MAGIC
+
+
+def header(chunk_size: int = TCS_variables.AES.CHUNK_SIZE) -> bytes:
+    return _HEADER.pack(TCS_variables.AES.CONTAINER_MAGIC, TCS_variables.AES.CONTAINER_VERSION, chunk_size)
+
+
+def read_header(data: bytes) -> int:
+    """
+    Check a container header
+    :param data: header bytes
+    :return: chunk size
+    """
+    if len(data) < HEADER_SIZE or not is_container(data):
+        raise TCS_variables.PYBIRDValueError("not an encrypted container")
+    (_, version, chunk_size) = _HEADER.unpack(data[:HEADER_SIZE])
+    if version != TCS_variables.AES.CONTAINER_VERSION or chunk_size <= 0:
+        raise TCS_variables.PYBIRDValueError(f"unsupported encrypted container version {version}")
+    return chunk_size
+
+
+def seal(key: bytes, head: bytes, index: int, last: bool, plain: bytes) -> bytes:
+    """
+    Encrypt one chunk
+    :param key: 32 byte key
+    :param head: container header
+    :param index: chunk index
+    :param last: the chunk is the last chunk of the container
+    :param plain:
+    :return: nonce + cipher text + tag
+    """
+    nonce = secrets.token_bytes(NONCE_SIZE)
+    cipher = _aes.new(key, _aes.MODE_GCM, nonce=nonce)
+    cipher.update(head + _INDEX.pack(index, last))
+    cipher_text, tag = cipher.encrypt_and_digest(plain)
+    return nonce + cipher_text + tag
+
+
+def open_chunk(key: bytes, head: bytes, index: int, last: bool, record: bytes) -> bytes:
+    """
+    Decrypt and verify one chunk
+    :param key:
+    :param head: container header
+    :param index: chunk index
+    :param last: the chunk is the last chunk of the container
+    :param record: nonce + cipher text + tag
+    :return: plain text
+    """
+    if len(record) < OVERHEAD:
+        raise TCS_variables.PYBIRDValueError("encrypted container is truncated")
+    cipher = _aes.new(key, _aes.MODE_GCM, nonce=record[:NONCE_SIZE])
+    cipher.update(head + _INDEX.pack(index, last))
+    try:
+        return cipher.decrypt_and_verify(record[NONCE_SIZE:-TAG_SIZE], record[-TAG_SIZE:])
+    except ValueError:
+        raise TCS_variables.PYBIRDValueError(
+            f"encrypted container chunk {index} failed verification (corrupted or wrong key)")
+
+
+class writer:
+    """
+    Streams plain text into a container, close() writes the last chunk
+    """
+
+    def __init__(self, f: typing.BinaryIO, key: bytes, chunk_size: int = TCS_variables.AES.CHUNK_SIZE) -> None:
+        self._f = f
+        self._key = key
+        self._chunk_size = chunk_size
+        self._head = header(chunk_size)
+        self._buffer = bytearray()
+        self._index = 0
+        self._f.write(self._head)
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        # keep at least one byte back, the last chunk is only known on close
+        while len(self._buffer) > self._chunk_size:
+            self._f.write(seal(self._key, self._head, self._index, False, bytes(self._buffer[:self._chunk_size])))
+            del self._buffer[:self._chunk_size]
+            self._index += 1
+        return len(data)
+
+    def close(self) -> None:
+        self._f.write(seal(self._key, self._head, self._index, True, bytes(self._buffer)))
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        if exc_type is None:
+            self.close()
+
+
+def read_chunks(f: typing.BinaryIO, key: bytes) -> typing.Iterator[bytes]:
+    """
+    Stream the plain text chunks of a container
+    :param f: binary file handle at the start of the container
+    :param key:
+    :return:
+    """
+    head = f.read(HEADER_SIZE)
+    chunk_size = read_header(head)
+    record_size = chunk_size + OVERHEAD
+    index = 0
+    record = f.read(record_size)
+    while True:
+        following = f.read(record_size) if len(record) == record_size else b""
+        last = len(following) == 0
+        yield open_chunk(key, head, index, last, record)
+        if last:
+            return
+        record = following
+        index += 1
+
+
+def encrypt(key: bytes, data: bytes, chunk_size: int = TCS_variables.AES.CHUNK_SIZE) -> bytes:
+    """
+    Encrypt bytes into a container
+    :param key:
+    :param data:
+    :param chunk_size:
+    :return:
+    """
+    head = header(chunk_size)
+    parts = [head]
+    view = memoryview(data)
+    count = max(1, -(-len(data) // chunk_size))
+    for index in range(count):
+        plain = bytes(view[index * chunk_size:(index + 1) * chunk_size])
+        parts.append(seal(key, head, index, index == count - 1, plain))
+    return b"".join(parts)
+
+
+def decrypt(key: bytes, data: bytes) -> bytes:
+    """
+    Decrypt a container
+    :param key:
+    :param data:
+    :return:
+    """
+    chunk_size = read_header(data)
+    head = data[:HEADER_SIZE]
+    record_size = chunk_size + OVERHEAD
+    view = memoryview(data)[HEADER_SIZE:]
+    count = max(1, -(-len(view) // record_size))
+    return b"".join(open_chunk(key, head, index, index == count - 1,
+                               bytes(view[index * record_size:(index + 1) * record_size])) for index in range(count))
@@ -27,9 +27,9 @@ import base64
 import hashlib
 import os
 import secrets
-from typing import Union
+import threading
+from typing import Dict, Tuple, Union
 
-from Crypto import Random
 from Crypto.Cipher import AES as _aes
 
 import TCS_utils
@@ -41,8 +41,10 @@ class _AES:
         self.version = TCS_utils.version()
 
         self._key = key
-
-        self.aes = _aes
+        # key material is prepared once, every cipher is created from these
+        # CBC and GCM need a fresh iv/nonce per message so the cipher objects themselves can not be reused
+        self._key_bytes = key.encode(TCS_variables.AES.ENCODING)
+        self._container_key = hashlib.sha256(TCS_variables.AES.CONTAINER_MAGIC + self._key_bytes).digest()
 
     def encrypt(self, raw: Union[str, bytes]) -> bytes:
         """
@@ -52,11 +54,18 @@ class _AES:
         """
         if isinstance(raw, str):
             raw = raw.encode(TCS_variables.AES.ENCODING)
-        private_key = self._key.encode(TCS_variables.AES.ENCODING)
+        return base64.b64encode(self.encrypt_bytes(raw))
+
+    def encrypt_bytes(self, raw: bytes) -> bytes:
+        """
+        encrypt bytes without the base64 encoding
+        :param raw:
+        :return: iv + cipher text
+        """
         raw = self.pad(raw)
-        iv = Random.new().read(_aes.block_size)
-        cipher = self.aes.new(private_key, _aes.MODE_CBC, iv)
-        return base64.b64encode(iv + cipher.encrypt(raw))
+        iv = os.urandom(_aes.block_size)
+        cipher = _aes.new(self._key_bytes, _aes.MODE_CBC, iv)
+        return iv + cipher.encrypt(raw)
 
     def decrypt(self, enc: bytes, _type: type = bytes) -> Union[str, bytes]:
         """
@@ -65,25 +74,38 @@ class _AES:
         :param _type:
         :return:
         """
-        private_key = self._key.encode(TCS_variables.AES.ENCODING)
-        enc = base64.b64decode(enc)
-        iv = enc[:16]
-        cipher = _aes.new(private_key, _aes.MODE_CBC, iv)
-        raw_bytes = self.unpad(cipher.decrypt(enc[16:]))
+        raw_bytes = self.decrypt_bytes(base64.b64decode(enc))
         if _type == str:
             return raw_bytes.decode(TCS_variables.AES.ENCODING)
         else:
             return raw_bytes
 
+    def decrypt_bytes(self, enc: bytes) -> bytes:
+        """
+        decrypt bytes from encrypt_bytes
+        :param enc: iv + cipher text
+        :return:
+        """
+        iv = enc[:16]
+        cipher = _aes.new(self._key_bytes, _aes.MODE_CBC, iv)
+        return self.unpad(cipher.decrypt(enc[16:]))
+
+    @property
+    def container_key(self) -> bytes:
+        """
+        key of the encrypted container format (TKS_container), derived from the AES key
+        :return: 32 bytes
+        """
+        return self._container_key
+
     def pad(self, s: bytes) -> bytes:
         """
         This function is used to pad bytes to the correct block size
         :param s:
         :return:
         """
-        return s + ((TCS_variables.AES.BLOCK_SIZE - len(s) % TCS_variables.AES.BLOCK_SIZE) * \
-                    chr(TCS_variables.AES.BLOCK_SIZE - len(s) % TCS_variables.AES.BLOCK_SIZE)).encode(
-            TCS_variables.AES.ENCODING)
+        pad_length = TCS_variables.AES.BLOCK_SIZE - len(s) % TCS_variables.AES.BLOCK_SIZE
+        return s + bytes((pad_length,)) * pad_length
 
     def unpad(self, s: bytes) -> bytes:
         """
@@ -123,14 +145,98 @@ class AES_savekey_ENC(_AES):
         :param app_name:
         :param save_key:
         """
-        key_aes = AES_ENC()
+        key_aes = keychain_key()
         my_key = app_name + save_key
         my_key_enc = key_aes.encrypt(my_key)
         self._key = hashlib.sha256(my_key_enc).hexdigest()[0:32]
-        del key_aes
         super().__init__(self._key)
 
 
+################################################################################################
+# region context cache
+# the prepared AES contexts are shared by all NVM, file and keychain users of a process
+# so the keys are derived (and the keychain key file read) once instead of on every instantiation
+_contexts: Dict[Tuple[str, str, str], _AES] = dict()
+_keychain_context: Union[Tuple[int, AES_ENC], None] = None
+_contexts_lock = threading.RLock()
+
+
+def savekey(app_name: str, save_key: str) -> AES_savekey:
+    """
+    shared AES_savekey context of an app
+    :param app_name:
+    :param save_key:
+    :return:
+    """
+    cache_key = ("SAVEKEY", app_name, save_key)
+    with _contexts_lock:
+        context = _contexts.get(cache_key)
+        if context is None:
+            context = AES_savekey(app_name=app_name, save_key=save_key)
+            _contexts[cache_key] = context
+        return context
+
+
+def savekey_enc(app_name: str, save_key: str) -> AES_savekey_ENC:
+    """
+    shared AES_savekey_ENC context of an app
+    :param app_name:
+    :param save_key:
+    :return:
+    """
+    cache_key = ("SAVEKEY_ENC", app_name, save_key)
+    with _contexts_lock:
+        context = _contexts.get(cache_key)
+        if context is None:
+            context = AES_savekey_ENC(app_name=app_name, save_key=save_key)
+            _contexts[cache_key] = context
+        return context
+
+
+def keychain_key() -> AES_ENC:
+    """
+    shared AES_ENC context of the keychain key file
+    the key file is read again when it is modified
+    :return:
+    """
+    global _keychain_context
+    try:
+        stamp = os.stat(TCS_variables.AES_KEY_FILE).st_mtime_ns
+    except OSError:
+        raise TCS_variables.PYBIRDAESkeyERROR("AES Key file not found")
+    with _contexts_lock:
+        if _keychain_context is None or _keychain_context[0] != stamp:
+            if _keychain_context is not None:
+                # contexts derived from the old key are no longer valid
+                _clear_derived()
+            _keychain_context = (stamp, AES_ENC())
+        return _keychain_context[1]
+
+
+def _clear_derived() -> None:
+    """
+    drop the contexts derived from the keychain key
+    :return:
+    """
+    for cache_key in [k for k in _contexts if k[0] == "SAVEKEY_ENC"]:
+        del _contexts[cache_key]
+
+
+def clear_cache() -> None:
+    """
+    drop all shared AES contexts
+    :return:
+    """
+    global _keychain_context
+    with _contexts_lock:
+        _contexts.clear()
+        _keychain_context = None
+
+
+# endregion
+################################################################################################
+
+
 class _AES_keychain:
     def __init__(self) -> None:
         self.version = TCS_utils.version()
@@ -211,6 +317,7 @@ using "PYBIRDMgrUI.py".
         TCS_utils.append_text_file(TCS_variables.AES_KEY_FILE, _encoded_key)
         TCS_utils.append_text_file(TCS_variables.AES_KEY_FILE, _key_hash)
         TCS_utils.append_text_file(TCS_variables.AES_KEY_FILE, _encoded_key_hash)
+        clear_cache()
 
         print("AES key added!")
         # _test = self._read_key()
@@ -25,7 +25,9 @@ import hashlib
 import json
 import os
 import shutil
-from typing import Union
+import threading
+import time
+from typing import Dict, Tuple, Union
 
 import TCS_config
 import TCS_interface
@@ -33,6 +35,11 @@ import TCS_utils
 import TCS_variables
 import TKS_encryption
 
+# credential kinds of the credential cache
+_KIND_X = "X"
+_KIND_ATLAS = "ATLAS"
+_KIND_GENERAL = "GENERAL"
+
 
 class keychain:
     def __init__(self) -> None:
@@ -40,15 +47,15 @@ class keychain:
 
         # self._keys: dict = dict()
         self.interface = TCS_interface.interface("keychain", pybird_app=True)
-        self.config = TCS_config.TCS_config()
+        self.config = TCS_config.get_config()
 
         if not self.config.encryption.encrypt_app_key:
             self.interface.dlog("WARNING: App keys are not encrypted", "WARNING")
             self.AES = None
             self.AES_saveKey = None
         else:
-            self.AES = TKS_encryption.AES_ENC()
-            self.AES_saveKey = TKS_encryption.AES_savekey_ENC
+            self.AES = TKS_encryption.keychain_key()
+            self.AES_saveKey = TKS_encryption.savekey_enc
 
         # self.interface.log("TESTTSTS")
 
@@ -140,6 +147,7 @@ class keychain:
             _app_path = TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_APP_HOME_DIR(appToRemove)
             # print(_app_path)
             shutil.rmtree(_app_path)
+            _credentials.clear()
             self.interface.log("Removed " + appToRemove + " keys")
 
     def remove_specific_key_ui(self):
@@ -176,6 +184,7 @@ class keychain:
             self.interface.log("Removing " + key_to_remove + " from " + app_to_remove_key_from + " keys")
             key_path = os.path.join(key_cat_path, key_to_remove)
             os.remove(key_path)
+            _credentials.discard_file(key_path)
             self.interface.log("Removed " + key_to_remove + " from " + app_to_remove_key_from + " keys")
 
     # endregion
@@ -225,7 +234,7 @@ class keychain:
         """
         file = TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_APP_X_KEY(in_app_name)
         self.interface.dlog("Twitter Creds File: " + file, "FILE LOC")
-        return self._read_key_from_file(file).strip().split(",")
+        return self._load_key(_KIND_X, in_app_name, "", file).strip().split(",")
 
     # endregion
     ################################################################################################
@@ -265,7 +274,7 @@ class keychain:
 
         self.interface.dlog("Atlas Creds File: " + file, "FILE LOC")
 
-        return self._read_key_from_file(file).strip().split(",")
+        return self._load_key(_KIND_ATLAS, app_name, db_name, file).strip().split(",")
 
     # endregion
     ################################################################################################
@@ -306,7 +315,7 @@ class keychain:
         if not os.path.exists(file):
             raise TCS_variables.PYBIRDAPPkeyERROR("Unable to find key file for " + str(tuple((appname, keyname))) + "!")
         else:
-            key_encoded = self._read_key_from_file(file)
+            key_encoded = self._load_key(_KIND_GENERAL, appname, keyname, file)
             return self._decode_key(key_encoded)
 
     # endregion
@@ -348,6 +357,7 @@ class keychain:
             self.interface.dlog("Updating " + file + " credentials")
             TCS_utils.copy_file_to_old(file)
             TCS_utils.delete_file(file)
+        _credentials.discard_file(file)
 
         key_encode = keys.encode(TCS_variables.AES.ENCODING)
 
@@ -361,6 +371,30 @@ class keychain:
             TCS_utils.append_text_file(file, keys)
             TCS_utils.append_text_file(file, hashlib.sha256(key_encode).hexdigest())
 
+    def _load_key(self, kind: str, app_name: str, name: str, file: str) -> Union[str, None]:
+        """
+        Read key from the credential cache or from file
+        :param kind: credential kind
+        :param app_name:
+        :param name: key/database name, empty if the kind has one key per app
+        :param file: key file
+        :return: returns the keys if valid, None if invalid
+        """
+        ttl = self.config.credentials.cache_ttl
+        if ttl <= 0:
+            return self._read_key_from_file(file)
+
+        cache_key = (app_name, kind, name)
+        key = _credentials.get(cache_key)
+        if key is not None:
+            return key
+        # stamp before reading, a key file replaced during the read is not cached as current
+        stamp = _file_stamp(file)
+        key = self._read_key_from_file(file)
+        if key is not None and stamp is not None:
+            _credentials.put(cache_key, file, stamp, ttl, key)
+        return key
+
     def _read_key_from_file(self, file: str) -> Union[str, None]:
         """
         Read key from file
@@ -517,6 +551,122 @@ class keychain:
     ################################################################################################
 
 
+################################################################################################
+# region credential cache
+def _file_stamp(file: str) -> Union[Tuple[int, int, int], None]:
+    """
+    stamp of a key file, changes when the file is modified or replaced
+    :param file:
+    :return: (inode, mtime ns, size), None if the file does not exist
+    """
+    try:
+        stat = os.stat(file)
+    except OSError:
+        return None
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class _credential_entry:
+    __slots__ = ("file", "stamp", "expires", "buffer")
+
+    def __init__(self, file: str, stamp: Tuple[int, int, int], expires: float, key: str) -> None:
+        """
+        decrypted credential held in a buffer that is zeroed when the entry is dropped
+        zeroing is best-effort: the key handed in and the copies returned by key() are immutable str that stay on the
+        heap until they are garbage collected, callers (URIs, API tokens) need str
+        :param file: key file
+        :param stamp: key file stamp when it was read
+        :param expires: time.monotonic() after which the entry is dropped
+        :param key:
+        """
+        self.file = file
+        self.stamp = stamp
+        self.expires = expires
+        self.buffer = bytearray(key.encode(TCS_variables.AES.ENCODING))
+
+    def key(self) -> str:
+        """
+        :return: str copy of the credential, not zeroed by wipe()
+        """
+        return self.buffer.decode(TCS_variables.AES.ENCODING)
+
+    def wipe(self) -> None:
+        self.buffer[:] = bytes(len(self.buffer))
+
+
+class _credential_cache:
+    """
+    process wide cache of decrypted credentials keyed by (app, kind, name)
+    keychains are created by every plugin/app instance, the cache keeps them from reading and decrypting
+    the key files each time. entries expire after credentials.cache_ttl and are dropped when the key file changes
+    """
+
+    def __init__(self) -> None:
+        self._entries: Dict[Tuple[str, str, str], _credential_entry] = dict()
+        self._lock = threading.Lock()
+
+    def get(self, cache_key: Tuple[str, str, str]) -> Union[str, None]:
+        """
+        :param cache_key: (app, kind, name)
+        :return: cached key, None if not cached, expired or the key file changed
+        """
+        with self._lock:
+            entry = self._entries.get(cache_key)
+            if entry is None:
+                return None
+            if entry.expires <= time.monotonic() or _file_stamp(entry.file) != entry.stamp:
+                self._drop(cache_key)
+                return None
+            return entry.key()
+
+    def put(self, cache_key: Tuple[str, str, str], file: str, stamp: Tuple[int, int, int], ttl: float,
+            key: str) -> None:
+        """
+        :param cache_key: (app, kind, name)
+        :param file: key file
+        :param stamp: key file stamp taken before it was read
+        :param ttl: seconds
+        :param key:
+        :return:
+        """
+        now = time.monotonic()
+        with self._lock:
+            for expired in [k for k, entry in self._entries.items() if entry.expires <= now]:
+                self._drop(expired)
+            if cache_key in self._entries:
+                self._drop(cache_key)
+            self._entries[cache_key] = _credential_entry(file, stamp, now + ttl, key)
+
+    def discard_file(self, file: str) -> None:
+        """
+        drop the entries read from a key file
+        :param file:
+        :return:
+        """
+        with self._lock:
+            for cache_key in [k for k, entry in self._entries.items() if entry.file == file]:
+                self._drop(cache_key)
+
+    def clear(self) -> None:
+        """
+        drop all entries
+        :return:
+        """
+        with self._lock:
+            for cache_key in list(self._entries):
+                self._drop(cache_key)
+
+    def _drop(self, cache_key: Tuple[str, str, str]) -> None:
+        self._entries.pop(cache_key).wipe()
+
+
+_credentials = _credential_cache()
+
+
+# endregion
+################################################################################################
+
+
 if __name__ == "__main__":
     k = keychain()
     k.remove_specific_key_ui()
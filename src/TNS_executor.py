@@ -0,0 +1,157 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Node executor
+Steps apps on a thread or process worker pool so one slow app does not hold up the rest of the node
+"""
+import concurrent.futures
+import pickle
+import signal
+import sys
+
+import TAS_app_finder
+import TCS_config
+import TCS_interface
+import TCS_variables
+
+
+class executor:
+    def __init__(self, config: TCS_config.executor_config, interface: TCS_interface.interface) -> None:
+        self._config = config
+        self._interface = interface
+
+        self._thread_pool = None
+        self._process_pool = None
+
+    def enabled(self) -> bool:
+        """
+        True if the node steps apps on worker pools
+        :return:
+        """
+        return self._config.mode in [TCS_variables.EXECUTOR.POOL, TCS_variables.EXECUTOR.ASYNCIO]
+
+    def asyncio_mode(self) -> bool:
+        """
+        True if the node runs on an event loop
+        :return:
+        """
+        return self._config.mode == TCS_variables.EXECUTOR.ASYNCIO
+
+    def resolve_pool(self, app) -> str:
+        """
+        Get the pool an app steps on
+        Apps that ask for a process pool but can not be pickled fall back to the thread pool
+        :param app: TAS_app_base.app
+        :return: TCS_variables.EXECUTOR.NONE | THREAD | PROCESS | ASYNCIO
+        """
+        if app.isAsync:
+            # async apps step on the node event loop
+            if self.asyncio_mode():
+                return TCS_variables.EXECUTOR.ASYNCIO
+            return TCS_variables.EXECUTOR.NONE
+
+        if not self.enabled():
+            return TCS_variables.EXECUTOR.NONE
+
+        pool = app._app_config.executor_pool
+        if pool == TCS_variables.EXECUTOR.PROCESS:
+            try:
+                pickle.dumps(app)
+            except Exception as e:
+                self._interface.log("App " + app.name + " can not be sent to a worker process, using a thread : " +
+                                    str(e), logType="WARNING")
+                pool = TCS_variables.EXECUTOR.THREAD
+        elif pool not in [TCS_variables.EXECUTOR.NONE, TCS_variables.EXECUTOR.THREAD]:
+            self._interface.log("App " + app.name + " invalid executor pool [" + str(pool) + "] stepping on the node",
+                                logType="WARNING")
+            pool = TCS_variables.EXECUTOR.NONE
+        return pool
+
+    def submit(self, app, pool: str) -> concurrent.futures.Future:
+        """
+        Step an app on a worker pool
+        The future result is the stepped app for process pools (the worker has its own copy) and None for threads
+        :param app: TAS_app_base.app
+        :param pool: TCS_variables.EXECUTOR.THREAD | PROCESS
+        :return:
+        """
+        if pool == TCS_variables.EXECUTOR.PROCESS:
+            return self._processes().submit(_step_app, app, True)
+        return self._threads().submit(_step_app, app, False)
+
+    def shutdown(self) -> None:
+        """
+        Wait for running steps and close the worker pools
+        :return:
+        """
+        if self._thread_pool is not None:
+            self._thread_pool.shutdown(wait=True)
+            self._thread_pool = None
+        if self._process_pool is not None:
+            self._process_pool.shutdown(wait=True)
+            self._process_pool = None
+
+    def _threads(self) -> concurrent.futures.ThreadPoolExecutor:
+        if self._thread_pool is None:
+            self._thread_pool = concurrent.futures.ThreadPoolExecutor(max_workers=self._config.thread_workers,
+                                                                      thread_name_prefix="PYBIRD_APP")
+        return self._thread_pool
+
+    def _processes(self) -> concurrent.futures.ProcessPoolExecutor:
+        if self._process_pool is None:
+            self._process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=self._config.process_workers,
+                                                                        initializer=_init_worker,
+                                                                        initargs=(list(sys.path), list(sys.argv),
+                                                                                  TAS_app_finder.get_finder().directories()))
+        return self._process_pool
+
+
+def _init_worker(path: list, argv: list, app_directories: list) -> None:
+    """
+    Give spawned workers the node's import paths, app directories and sys args
+    :param path:
+    :param argv:
+    :param app_directories:
+    :return:
+    """
+    sys.path[:] = path
+    sys.argv[:] = argv
+    # the node shuts the pool down (and the apps write their data) on SIGINT / SIGTERM
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_IGN)
+    for directory in app_directories:
+        TAS_app_finder.add_directory(directory)
+
+
+def _step_app(app, return_app: bool):
+    """
+    Run one app step on a worker
+    :param app:
+    :param return_app:
+    :return:
+    """
+    app.step()
+    if return_app:
+        return app
+    return None
@@ -0,0 +1,228 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Node metrics
+Per app step latency and scheduler lag histograms, memory use is fixed no matter how long the node runs
+"""
+import bisect
+import json
+import math
+import typing
+
+import TCS_variables
+
+
+def _bucket_bounds() -> list:
+    """
+    Upper bounds of the histogram buckets (sec), log spaced between METRICS.MIN_VALUE and METRICS.MAX_VALUE
+    :return:
+    """
+    decades = math.log10(TCS_variables.METRICS.MAX_VALUE / TCS_variables.METRICS.MIN_VALUE)
+    total = int(round(decades * TCS_variables.METRICS.BUCKETS_PER_DECADE))
+    return [TCS_variables.METRICS.MIN_VALUE * 10 ** (i / TCS_variables.METRICS.BUCKETS_PER_DECADE)
+            for i in range(total + 1)]
+
+
+_BOUNDS: list = _bucket_bounds()
+
+
+class histogram:
+    """
+    Fixed memory histogram of durations (sec)
+    Percentiles are accurate to one bucket (~12% with 20 buckets per decade)
+    """
+
+    def __init__(self) -> None:
+        # last bucket holds everything above METRICS.MAX_VALUE
+        self.buckets = [0] * (len(_BOUNDS) + 1)
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, value: float) -> None:
+        """
+        Record a value, negative values are recorded as 0
+        :param value: sec
+        :return:
+        """
+        value = max(value, 0.0)
+        self.buckets[bisect.bisect_left(_BOUNDS, value)] += 1
+        self.count += 1
+        self.total += value
+        self.max = max(self.max, value)
+
+    def percentile(self, pct: float) -> float:
+        """
+        Get a percentile
+        :param pct: 0 - 100
+        :return: upper bound of the bucket the percentile falls in (sec), 0 if nothing has been recorded
+        """
+        if self.count == 0:
+            return 0.0
+        rank = max(1, math.ceil(self.count * pct / 100))
+        seen = 0
+        for i, bucket in enumerate(self.buckets):
+            seen += bucket
+            if seen >= rank:
+                if i == len(_BOUNDS):
+                    return self.max
+                return min(_BOUNDS[i], self.max)
+        return self.max
+
+    def mean(self) -> float:
+        """
+        Get the mean
+        :return:
+        """
+        if self.count == 0:
+            return 0.0
+        return self.total / self.count
+
+    def summary(self) -> dict:
+        """
+        Get the count, mean, p50, p95, p99 and max
+        :return:
+        """
+        return {
+            "count": self.count,
+            "mean": self.mean(),
+            "p50": self.percentile(50),
+            "p95": self.percentile(95),
+            "p99": self.percentile(99),
+            "max": self.max,
+        }
+
+
+class app_metrics:
+    """
+    Step metrics for one app
+    - pre, step, post - wall time of preStep, myStep and postStep
+    - total - wall time of the full step
+    - lag - time the step started after it was due
+    """
+
+    def __init__(self) -> None:
+        self.pre = histogram()
+        self.step = histogram()
+        self.post = histogram()
+        self.total = histogram()
+        self.lag = histogram()
+
+    def summary(self) -> dict:
+        return {
+            "pre": self.pre.summary(),
+            "step": self.step.summary(),
+            "post": self.post.summary(),
+            "total": self.total.summary(),
+            "lag": self.lag.summary(),
+        }
+
+
+class node_metrics:
+    """
+    Step metrics for every app on a node
+    - record_lag() - records how late a step started
+    - record_step() - records the phase times of a completed step
+    - summary() - returns the percentiles of every app
+    - report() - returns a table of the percentiles for the log
+    - dump() - writes the percentiles to a json file
+    """
+
+    def __init__(self) -> None:
+        self.apps: typing.Dict[str, app_metrics] = {}
+
+    def _get(self, name: str) -> app_metrics:
+        if name not in self.apps:
+            self.apps[name] = app_metrics()
+        return self.apps[name]
+
+    def record_lag(self, name: str, lag: float) -> None:
+        """
+        Record how late a step started
+        :param name: app name
+        :param lag: sec after the step was due
+        :return:
+        """
+        self._get(name).lag.record(lag)
+
+    def record_step(self, name: str, step_times: typing.Union[tuple, None]) -> None:
+        """
+        Record the phase times of a completed step
+        :param name: app name
+        :param step_times: (preStep, myStep, postStep) sec, as set by the app step
+        :return:
+        """
+        if step_times is None:
+            return
+        metrics = self._get(name)
+        (pre, step, post) = step_times
+        metrics.pre.record(pre)
+        metrics.step.record(step)
+        metrics.post.record(post)
+        metrics.total.record(pre + step + post)
+
+    def summary(self) -> dict:
+        """
+        Get the percentiles of every app
+        :return:
+        """
+        return {name: metrics.summary() for name, metrics in self.apps.items()}
+
+    def report(self) -> str:
+        """
+        Table of step time and lag percentiles, apps that use the most step time first
+        :return:
+        """
+        header = f"{'APP':<16}{'STEPS':>8}{'BUSY s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}" \
+                 f"{'LAG p50':>10}{'LAG p99':>10}"
+        lines = [header]
+        apps = sorted(self.apps.items(), key=lambda item: item[1].total.total, reverse=True)
+        for name, metrics in apps:
+            total = metrics.total
+            lag = metrics.lag
+            lines.append(f"{name:<16}{total.count:>8}{total.total:>10.2f}"
+                         f"{total.percentile(50) * 1000:>10.1f}{total.percentile(95) * 1000:>10.1f}"
+                         f"{total.percentile(99) * 1000:>10.1f}"
+                         f"{lag.percentile(50) * 1000:>10.1f}{lag.percentile(99) * 1000:>10.1f}")
+        return "\n".join(lines)
+
+    def dump(self, path: str) -> None:
+        """
+        Write the percentiles of every app to a json file
+        :param path:
+        :return:
+        """
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.summary(), f, indent=4)
+
+
+if __name__ == "__main__":
+    import random
+
+    m = node_metrics()
+    for i in range(10000):
+        m.record_lag("A", random.random() * 0.01)
+        m.record_step("A", (0.001, random.expovariate(100), 0.002))
+    print(m.report())
+    print(json.dumps(m.summary()["A"]["step"], indent=4))
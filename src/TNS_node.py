@@ -21,30 +21,52 @@
 #
 # ##########################################################################
 
-import datetime
+import asyncio
+import concurrent.futures
+import importlib
+import os
 import sys
+import time
+import typing
 
 import TAS_app
 import TCS_configApp
 # import TNS_node_tools as tools
 import TCS_core
 import TCS_interface
+import TCS_log_atlas
+import TCS_profiler
 import TCS_timing_manager
 import TCS_utils
 import TCS_variables
+import TDS_database_atlas
+import TNS_executor
+import TNS_metrics
+import TNS_scheduler
+
+
+# app config fields that only take effect when the node is restarted
+# save_key: the app data and file interfaces are created with the key
+_RESTART_KEYS = ("local_app", "main_app", "executor_pool", "save_key", "atlas_logging_enabled", "atlas_logging_db")
+# app config fields that rebuild the timing manager
+_TIMING_KEYS = ("timing_mode", "timing_step_duration", "timing_step_skip_missed", "timing_step_sync_time",
+                "timing_time_list", "timing_once")
 
 
 class step_info:
-    def __init__(self, app: TAS_app.app):
-        self.app = app
-        self.name = app.name
+    def __init__(self, app_parameters: TCS_configApp._app_config, factory: typing.Callable[[], TAS_app.app]):
+        # None until the app is loaded (imported and constructed), apps are loaded when they are first due
+        self.app: typing.Union[TAS_app.app, None] = None
+        self.factory = factory
+        self.name = app_parameters.app_code
         self.timing_manager = TCS_timing_manager.TimingManager(
-            app.name, app._app_config)
+            self.name, app_parameters)
         # self.step_time = app._app_config.step_time
         # self.step_on_start = app._app_config.step_on_boot
         # self.step_on_shutdown = app._app_config.step_on_shutdown
         self.step_count = 1
         self.status = "RUNNING"
+        self.pool = TCS_variables.EXECUTOR.NONE
 
 
 class node(TCS_core.core):
@@ -62,66 +84,197 @@ class node(TCS_core.core):
 
         self.app_list: list[step_info] = []
         self.boot_list = []
+        self.scheduler = TNS_scheduler.scheduler()
+        # wall clock - monotonic clock, a change means the wall clock was set
+        self._clock_offset = time.time() - time.monotonic()
 
         self.step_time = 1
         self.interface = TCS_interface.node_interface(self)
+        self.executor = TNS_executor.executor(self._config.executor, self.interface)
+        # apps currently stepping on a worker pool or the event loop
+        self._running: dict[typing.Union[concurrent.futures.Future, asyncio.Future], step_info] = {}
+        # apps with cached data to write: time.monotonic() time it is due (nvm.flush_interval)
+        self._data_flush: typing.Dict[step_info, float] = {}
+        self._loop: typing.Union[asyncio.AbstractEventLoop, None] = None
+        self.metrics = TNS_metrics.node_metrics()
+        self._next_metrics_report = time.monotonic() + self._config.metrics.report_interval
+        self._metrics_dump_requested = False
+        # config files of the apps, checked for changes every app_reload.check_interval
+        self.app_configs: list[TCS_configApp.TAS_apps_config] = []
+        self._next_config_check = time.monotonic() + self._config.app_reload.check_interval
         # end
         self.interface.dlog(
             f"{self.name} v{self.version} : NODE-BASE INITIALIZED", logType="INFO")
 
-    def add_app(self, app: TAS_app.app, app_parameters: TCS_configApp._app_config) -> None:
+    def add_app(self, app, app_parameters: TCS_configApp._app_config) -> None:
         """
         Adds an app to the Node
+        The app is imported and constructed when the node starts, apps that are not due soon after start are
+        loaded when they are first due
+        :param app: app module or module name (imported when the app is loaded)
+        :param app_parameters:
         """
-        self.boot_list.append(app)
-        _temp_app = app.TUAapp(app_parameters)
-        _temp_app._settings()
-        self.app_list.append(step_info(_temp_app))
+        self.app_list.append(step_info(app_parameters, lambda: self._build_app(app, app_parameters)))
         self.interface.log(
-            f"{self.name} v{self.version} : APP ADDED {_temp_app.name}", logType="INFO")
+            f"{self.name} v{self.version} : APP ADDED {app_parameters.app_code}", logType="INFO")
+
+    def _build_app(self, app, app_parameters: TCS_configApp._app_config) -> TAS_app.app:
+        """
+        Import and construct an app
+        :param app: app module or module name
+        :param app_parameters:
+        :return:
+        """
+        with TCS_profiler.phase("load app " + app_parameters.app_code):
+            if isinstance(app, str):
+                app = importlib.import_module(app)
+            self.boot_list.append(app)
+            _temp_app = app.TUAapp(app_parameters)
+            _temp_app._settings()
+        return _temp_app
 
     def _start_base(self):
         # self.calc_step_time()
         # self.ProcessTable()
+        now = time.monotonic()
         for app in self.app_list:
             try:
                 app.timing_manager.set_next_time()
-                app.app._start()
             except Exception as e:
                 self.interface.log(f"Error: {e}", logType="ERROR")
                 if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
                     raise e
 
+        with TCS_profiler.phase("load apps"):
+            self._load_apps([app for app in self.app_list if self._load_on_start(app, now)])
+        for app in self.app_list:
+            if app.app is not None:
+                with TCS_profiler.phase("start app " + app.name):
+                    self._start_app(app)
+            elif app.status == "RUNNING":
+                self.interface.dlog("APP LOADED WHEN FIRST DUE: " + app.name, logType="INFO")
+            self._schedule(app, now)
+
+    def _load_on_start(self, app: step_info, now: float) -> bool:
+        """
+        True if an app is loaded when the node starts, apps that are not due within STARTUP.LAZY_DELAY are loaded
+        when they are first due
+        :param app:
+        :param now: time.monotonic() time
+        :return:
+        """
+        next_time = app.timing_manager.get_cur_time()
+        if next_time == "request":
+            # the app is asked when it wants to step
+            return True
+        if next_time == "never" or next_time is None:
+            return False
+        return next_time - now <= TCS_variables.STARTUP.LAZY_DELAY
+
+    def _load_apps(self, apps: typing.List[step_info]) -> None:
+        """
+        Import and construct apps, concurrently on STARTUP.LOAD_WORKERS threads
+        :param apps:
+        :return:
+        """
+        if len(apps) <= 1 or TCS_variables.STARTUP.LOAD_WORKERS <= 1:
+            for app in apps:
+                self._load_app(app, app.factory)
+            return
+        with concurrent.futures.ThreadPoolExecutor(max_workers=TCS_variables.STARTUP.LOAD_WORKERS,
+                                                   thread_name_prefix="PYBIRD_APP_LOAD") as pool:
+            futures = [(app, pool.submit(app.factory)) for app in apps]
+            for app, future in futures:
+                self._load_app(app, future.result)
+
+    def _load_app(self, app: step_info, load: typing.Callable[[], TAS_app.app]) -> bool:
+        """
+        Load an app, an app that fails to load is not scheduled
+        :param app:
+        :param load: returns the app
+        :return: True if the app loaded
+        """
+        try:
+            app.app = load()
+        except Exception as e:
+            app.status = "FAILED"
+            self.interface.log("Error in app " + app.name + " Unable to load : " + str(e), logType="ERROR")
+            if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                raise e
+            return False
+        app.pool = self.executor.resolve_pool(app.app)
+        self.interface.dlog("APP LOADED: " + app.name, logType="INFO")
+        return True
+
+    @staticmethod
+    async def _start_step_async(app: TAS_app.app) -> None:
+        await app._start()
+        await app.step()
+
+    def _start_app(self, app: step_info) -> None:
+        """
+        Start a loaded app
+        :param app:
+        :return:
+        """
+        try:
+            if app.app.isAsync:
+                self.async_loop().run_until_complete(app.app._start())
+            else:
+                app.app._start()
+        except Exception as e:
+            self.interface.log(f"Error: {e}", logType="ERROR")
+            if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                raise e
+
     def _step_base(self):
 
         self.errorNum = 0
         self.errorList = []
         apps_ran = []
 
-        for app in self.app_list:
-            next_time = app.timing_manager.get_cur_time()
-            if next_time == "request":
-                next_time = app.app.myTimeRequest()
-            elif next_time == "never":
-                continue
+        now = time.monotonic()
+        self._check_clock(now)
+        self._check_app_configs(now)
+        self._flush_app_data(now)
+        # apps that finished on a worker pool or the event loop since the last pass
+        for future in [f for f in self._running if f.done()]:
+            app = self._running.pop(future)
+            self._app_step_result(app, future)
+            self._app_ran(app, now, apps_ran)
 
-            if next_time.timestamp() <= datetime.datetime.utcnow().timestamp():
+        for app in self.scheduler.pop_due(now):
+            # request mode apps may have changed the time they asked for since they were scheduled
+            due_time = self._next_due_time(app, now)
+            if due_time is None:
+                continue
+            if due_time > now:
+                self.scheduler.push(app, due_time)
+                continue
+            if app.app is None:
+                # first time the app is due
+                if not self._load_app(app, app.factory):
+                    continue
+                if app.pool == TCS_variables.EXECUTOR.ASYNCIO:
+                    # the event loop is running, start the app on it with its first step
+                    self._running[self.async_loop().create_task(self._start_step_async(app.app))] = app
+                    continue
+                self._start_app(app)
+            if self._config.metrics.enable:
+                self.metrics.record_lag(app.name, time.monotonic() - due_time)
 
+            if app.pool == TCS_variables.EXECUTOR.NONE:
                 self._app_step(app)
-                app.timing_manager.set_next_time()
-                if app.step_count == 1:
-                    self.interface.dlog(
-                        'FIRST STEP SUCCESSFUL: ' + app.name, logType="STEP")
-                app.step_count += 1
-                apps_ran.append(app.name)
-
-            # if self.step_count == 1 and self.i.step_on_start == True:
-            #     status = self._app_step(self.i)
-            #     if status:
-            #         self.interface.log(
-            #             'START UP STEP SUCCESSFUL: ' + self.i.name, logType="STEP")
-            # elif self.step_count % self.i.step_count == 0:
-            #     self._app_step(self.i)
+                self._app_ran(app, now, apps_ran)
+            elif app.pool == TCS_variables.EXECUTOR.ASYNCIO:
+                # rescheduled once the step completes
+                self._running[self.async_loop().create_task(app.app.step())] = app
+            else:
+                future = self.executor.submit(app.app, app.pool)
+                if self.executor.asyncio_mode():
+                    future = asyncio.wrap_future(future, loop=self.async_loop())
+                self._running[future] = app
+
         if len(apps_ran) == 0:
             self.interface.dlog("NO APPS RAN", logType="STEP")
         else:
@@ -130,24 +283,333 @@ class node(TCS_core.core):
                                " | step apps ran = " + str(apps_ran) + " | step error list = " + str(self.errorList),
                                logType="STEP")
 
-    def _app_step(self, app_info: step_info):
+        self._metrics_report(now)
+
+    def _app_ran(self, app: step_info, now: float, apps_ran: list) -> None:
+        """
+        Step bookkeeping once an app has finished its step
+        :param app:
+        :param now: time.monotonic() time of the current pass
+        :param apps_ran: names of the apps that ran in the current pass
+        :return:
+        """
+        if self._config.metrics.enable:
+            self.metrics.record_step(app.name, app.app.step_times)
+        app.app.step_times = None
+        app.timing_manager.set_next_time()
+        if app.step_count == 1:
+            self.interface.dlog(
+                'FIRST STEP SUCCESSFUL: ' + app.name, logType="STEP")
+        app.step_count += 1
+        apps_ran.append(app.name)
+        self._schedule(app, now, ran=True)
+        self._track_data_flush(app)
+
+    def _metrics_report(self, now: float) -> None:
+        """
+        Dump the metrics every report_interval or when a dump has been requested
+        :param now: time.monotonic() time of the current pass
+        :return:
+        """
+        if not self._config.metrics.enable:
+            return
+        interval = self._config.metrics.report_interval
+        if self._metrics_dump_requested or (interval > 0 and now >= self._next_metrics_report):
+            self._metrics_dump_requested = False
+            self._next_metrics_report = now + interval
+            self.dump_metrics()
+
+    def request_metrics_dump(self) -> None:
+        """
+        Dump the metrics on the next pass, safe to call from a signal handler
+        :return:
+        """
+        self._metrics_dump_requested = True
+
+    def dump_metrics(self) -> str:
+        """
+        Log the p50/p95/p99 step time and lag of every app and write them to DATA_METRICS/METRICS_<node>.json
+        :return: path of the metrics file
+        """
+        path = os.path.join(TCS_variables.PYBIRD_DIRECTORIES.DATA_METRICS,
+                            TCS_variables.METRICS.FILE_PREFIX + self.name + ".json")
+        self.interface.log_multiline(self.metrics.report(), logType="METRICS")
+        if len(TDS_database_atlas.clients) > 0:
+            self.interface.log_multiline(TDS_database_atlas.clients.report(), logType="ATLAS")
         try:
-            app_info.app.step()
-            return True
+            self.metrics.dump(path)
         except Exception as e:
-            self.errorNum += 1
-            self.errorList.append(app_info.app.name)
-            self.interface.log(
-                "Error in app " + app_info.app.name + " Unable to process step : " + str(e), logType="STEP ERROR")
-            try:
-                app_info.app.interface.log(
-                    "Error in app " + app_info.app.name + " Unable to process step : " + str(e), logType="STEP ERROR")
-            except:
-                pass
+            self.interface.log("Unable to write metrics file " + path + " : " + str(e), logType="ERROR")
             if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
                 raise e
+        return path
+
+    def wait_for_next_step(self) -> None:
+        """
+        Block until the next app is due or an app running on a worker pool finishes
+        :return:
+        """
+        timeout = self.time_to_next_step()
+        if len(self._running) > 0:
+            concurrent.futures.wait(list(self._running), timeout=timeout,
+                                    return_when=concurrent.futures.FIRST_COMPLETED)
+        else:
+            time.sleep(timeout)
+
+    async def wait_for_next_step_async(self) -> None:
+        """
+        Wait on the event loop until the next app is due or a running app finishes
+        :return:
+        """
+        timeout = self.time_to_next_step()
+        if len(self._running) > 0:
+            await asyncio.wait(list(self._running), timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+        else:
+            await asyncio.sleep(timeout)
+
+    def async_loop(self) -> asyncio.AbstractEventLoop:
+        """
+        The node event loop, async apps are started and stepped on it
+        :return:
+        """
+        if self._loop is None:
+            self._loop = asyncio.new_event_loop()
+        return self._loop
+
+    def time_to_next_step(self) -> float:
+        """
+        Seconds until the next app is due
+        :return:
+        """
+        next_time = self.scheduler.next_time()
+        if next_time is None:
+            return max(self._config.system.inter_step_delay, TCS_variables.SCHEDULER.IDLE_DELAY)
+        flush_time = self._next_data_flush()
+        if flush_time is not None:
+            # wake up to write cached app data
+            next_time = min(next_time, flush_time)
+        return min(max(0.0, next_time - time.monotonic()), TCS_variables.SCHEDULER.MAX_SLEEP)
+
+    def _check_clock(self, now: float) -> None:
+        """
+        Reschedule the apps if the wall clock has been changed since the last pass
+        Interval apps are on the monotonic clock and keep their times, wall clock apps (time, once) move with the clock
+        :param now: time.monotonic() time of the current pass
+        :return:
+        """
+        offset = time.time() - now
+        jump = offset - self._clock_offset
+        self._clock_offset = offset
+        if abs(jump) < TCS_variables.SCHEDULER.CLOCK_JUMP:
+            return
+        self.interface.log(f"WALL CLOCK CHANGED BY {jump:.3f} s, RESCHEDULING APPS", logType="WARNING")
+        self.scheduler.reschedule(lambda app: self._next_due_time(app, now))
+
+    def _track_data_flush(self, app: step_info) -> None:
+        """
+        Note when the data an app has cached has to be written, apps only save data while they step
+        :param app:
+        :return:
+        """
+        if self._config.nvm.cache_size <= 0:
+            return
+        flush_time = app.app.data_interface.next_flush()
+        if flush_time is None:
+            self._data_flush.pop(app, None)
+        else:
+            self._data_flush[app] = flush_time
+
+    def _next_data_flush(self) -> typing.Union[float, None]:
+        """
+        Earliest time cached app data has to be written, apps stepping on a worker pool are skipped
+        :return: time.monotonic() time, None if no app has cached data to write
+        """
+        if len(self._data_flush) == 0:
+            return None
+        running = set(self._running.values())
+        times = [flush_time for app, flush_time in self._data_flush.items() if app not in running]
+        return min(times) if len(times) > 0 else None
+
+    def _flush_app_data(self, now: float) -> None:
+        """
+        Write the app data that has been cached for nvm.flush_interval, apps stepping on a worker pool are skipped
+        :param now: time.monotonic() time of the current pass
+        :return:
+        """
+        if self._config.nvm.cache_size <= 0 or len(self._data_flush) == 0:
+            return
+        running = set(self._running.values())
+        for app, flush_time in list(self._data_flush.items()):
+            if flush_time > now or app in running:
+                continue
+            try:
+                app.app.data_interface.flush_due()
+            except Exception as e:
+                self.interface.log("Unable to write the data of app " + app.name + " : " + str(e), logType="ERROR")
+                if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                    raise e
+            self._track_data_flush(app)
+
+    def _check_app_configs(self, now: float) -> None:
+        """
+        Apply app config changes every app_reload.check_interval
+        :param now: time.monotonic() time of the current pass
+        :return:
+        """
+        if not self._config.app_reload.enable or now < self._next_config_check:
+            return
+        self._next_config_check = now + self._config.app_reload.check_interval
+        for app_configs in self.app_configs:
+            try:
+                changed = app_configs.reload()
+            except Exception as e:
+                self.interface.log("Unable to reload app config " + app_configs.file + " : " + str(e),
+                                   logType="ERROR")
+                if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                    raise e
+                continue
+            for app_code, app_parameters in changed.items():
+                self.update_app_config(app_code, app_parameters, now)
+
+    def update_app_config(self, app_code: str, app_parameters: typing.Union[TCS_configApp._app_config, None],
+                          now: float) -> bool:
+        """
+        Swap the config of a running app, the app keeps its in memory state
+        the timing manager is rebuilt and the app rescheduled only if the timing has changed
+        changes to which apps run and how they are loaded (active, main file, local, executor pool) need a restart
+        :param app_code:
+        :param app_parameters: new config, None if the app has been removed
+        :param now: time.monotonic() time of the current pass
+        :return: True if the config was applied
+        """
+        app = next((app for app in self.app_list if app.name == app_code), None)
+        active = None
+        if app_parameters is not None:
+            active = app_parameters.active_test if self._config.system.test_mode else app_parameters.active
+        if app is None or not active or app_parameters is None:
+            if app is not None or active:
+                self.interface.log("APP CONFIG CHANGED: " + app_code + " RESTART THE NODE TO ADD OR REMOVE THE APP",
+                                   logType="NOTICE")
+            return False
+        old = app.timing_manager._app_config
+        if any(getattr(old, key) != getattr(app_parameters, key) for key in _RESTART_KEYS):
+            self.interface.log("APP CONFIG CHANGED: " + app_code + " RESTART THE NODE TO APPLY " +
+                               str([key for key in _RESTART_KEYS
+                                    if getattr(old, key) != getattr(app_parameters, key)]), logType="NOTICE")
+            return False
+
+        if app.app is not None:
+            # an app stepping on a process pool is replaced by the worker's copy, _app_step_result applies it again
+            app.app._app_config = app_parameters
+        if any(getattr(old, key) != getattr(app_parameters, key) for key in _TIMING_KEYS):
+            app.timing_manager = TCS_timing_manager.TimingManager(app.name, app_parameters)
+            # apps running on a worker pool are scheduled when their step completes
+            if not any(running is app for running in self._running.values()):
+                self.scheduler.remove(app)
+                app.timing_manager.set_next_time()
+                self._schedule(app, now)
+        else:
+            app.timing_manager._app_config = app_parameters
+        self.interface.log("APP CONFIG RELOADED: " + app_code, logType="INFO")
+        return True
+
+    def _schedule(self, app: step_info, now: float, ran: bool = False) -> None:
+        """
+        Push an app onto the scheduler at its next due time
+        :param app:
+        :param now: time.monotonic() time of the current pass
+        :param ran: the app has just stepped in the current pass
+        :return:
+        """
+        if app.status == "FAILED":
+            return
+        due_time = self._next_due_time(app, now)
+        if due_time is None:
+            return
+        if ran and due_time <= now:
+            # an app runs at most once per pass, passes are at least inter_step_delay apart (cont mode, catch up)
+            due_time = now + self._config.system.inter_step_delay
+        self.scheduler.push(app, due_time)
+
+    def _next_due_time(self, app: step_info, now: float):
+        """
+        Get the time.monotonic() time an app is next due
+        :param app:
+        :param now: time.monotonic() time of the current pass
+        :return: time.monotonic() time, None if the app will never run again
+        """
+        next_time = app.timing_manager.get_cur_time()
+        if next_time == "request":
+            # the app may change its request at any time, poll it every inter_step_delay
+            poll_time = now + self._config.system.inter_step_delay
+            try:
+                next_time = app.app.myTimeRequest()
+            except Exception as e:
+                self.interface.log(
+                    "Error in app " + app.name + " Unable to process time request : " + str(e), logType="ERROR")
+                if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+                    raise e
+                return poll_time
+            if next_time is None:
+                return poll_time
+            # requests are datetimes (utc) or unix time
+            return min(TCS_timing_manager.epoch_to_monotonic(TCS_timing_manager.to_epoch(next_time)), poll_time)
+        elif next_time == "never" or next_time is None:
+            return None
+        return next_time
+
+    def _app_step(self, app_info: step_info):
+        try:
+            if app_info.app.isAsync:
+                self.async_loop().run_until_complete(app_info.app.step())
+            else:
+                app_info.app.step()
+            return True
+        except Exception as e:
+            self._app_step_error(app_info, e)
+        return False
+
+    def _app_step_result(self, app_info: step_info, future: concurrent.futures.Future):
+        try:
+            result = future.result()
+            if result is not None:
+                # process pool workers step their own copy of the app, the config may have been reloaded meanwhile
+                result._app_config = app_info.timing_manager._app_config
+                app_info.app = result
+            return True
+        except Exception as e:
+            self._app_step_error(app_info, e)
         return False
 
+    def _app_step_error(self, app_info: step_info, e: Exception):
+        self.errorNum += 1
+        self.errorList.append(app_info.app.name)
+        self.interface.log(
+            "Error in app " + app_info.app.name + " Unable to process step : " + str(e), logType="STEP ERROR")
+        try:
+            app_info.app.interface.log(
+                "Error in app " + app_info.app.name + " Unable to process step : " + str(e), logType="STEP ERROR")
+        except:
+            pass
+        if TCS_variables.SYS_ARG.RAISE[0] in sys.argv:
+            raise e
+
+    def _handle_cleanup(self):
+        """
+        Wait for apps stepping on worker pools and close the pools, then let the apps write their data
+        """
+        self.executor.shutdown()
+        for app in self.app_list:
+            if app.app is None:
+                continue
+            try:
+                app.app._handle_cleanup()
+            except Exception as e:
+                self.interface.log("Error in app " + app.name + " Unable to clean up : " + str(e), logType="ERROR")
+        if self._config.metrics.enable:
+            self.dump_metrics()
+        TCS_log_atlas.close()
+        TDS_database_atlas.clients.close()
 
 if __name__ == "__main__":
     pass
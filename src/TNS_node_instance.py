@@ -21,10 +21,10 @@
 #
 # ##########################################################################
 
-import importlib
 import os
 import sys
 
+import TAS_app_finder
 import TCS_configApp
 import TCS_utils
 import TCS_variables
@@ -41,12 +41,12 @@ class TWnode(TNS_node.node):
         self.app_config_list = []
         # add pybird core apps into the system
         if self._config.system.enable_pybird_core_apps and nodeName != "PYBIRD":
-            self.app_config_list.extend(TCS_configApp.TAS_apps_config("PYBIRD").configs)
-            for i in range(len(self.app_config_list)):
-                self.app_config_list[i].app_code += "-PYBIRD-CORE-" + nodeName
+            self.app_configs.append(TCS_configApp.TAS_apps_config("PYBIRD", "-PYBIRD-CORE-" + nodeName))
 
         # add node apps into the system
-        self.app_config_list.extend(TCS_configApp.TAS_apps_config(nodeName).configs)
+        self.app_configs.append(TCS_configApp.TAS_apps_config(nodeName))
+        for app_config in self.app_configs:
+            self.app_config_list.extend(app_config.configs)
         # dlog system config
         self.interface.dlog_multiline(str(self._config), "SYSTEM-CONFIG")
 
@@ -87,14 +87,16 @@ class TWnode(TNS_node.node):
 
     def _app_import(self, app):
         self._sys_path(app)
-        temp_app = importlib.import_module(app.main_app)
-        self.add_app(temp_app, app)
+        # imported when the node loads the app
+        self.add_app(app.main_app, app)
 
     def _sys_path(self, app_info):
+        # app modules are resolved by the app finder instead of adding every app directory to sys.path
         if app_info.local_app:
-            sys.path.append(os.path.join(TCS_variables.PYBIRD_DIRECTORIES.APP_LOCAL, self._pathCode(app_info)))
+            TAS_app_finder.add_directory(
+                os.path.join(TCS_variables.PYBIRD_DIRECTORIES.APP_LOCAL, self._pathCode(app_info)))
         elif not app_info.local_app:
-            sys.path.append(
+            TAS_app_finder.add_directory(
                 os.path.join(TCS_variables.PYBIRD_DIRECTORIES.PYBIRD_REMOTE_APP_DIRECTORY, self._pathCode(app_info)))
 
     def _pathCode(self, app_info):
@@ -22,12 +22,13 @@
 # ##########################################################################
 
 import atexit
+import signal as signals
 import sys
-import time
 from signal import signal, SIGINT
 
 import TCS_core
 import TCS_interface
+import TCS_profiler
 import TCS_utils
 import TCS_variables
 import TNS_node
@@ -36,13 +37,19 @@ import TNS_node_instance
 
 class run(TCS_core.core):
     def __init__(self, NodeName, autoStart: bool = False) -> None:
-        TCS_interface.write_state_file(nodeName=NodeName)
+        with TCS_profiler.phase("write state file"):
+            TCS_interface.write_state_file(nodeName=NodeName)
         super().__init__()
-        self._host: TNS_node.node = TNS_node_instance.TWnode(NodeName)
+        with TCS_profiler.phase("create host " + NodeName):
+            self._host: TNS_node.node = TNS_node_instance.TWnode(NodeName)
         self.name = "RUN_" + self._host.name
         self.version = TCS_utils.version()
         self.description = "run class for nodes"
 
+        if hasattr(signals, "SIGUSR1"):
+            # kill -USR1 <pid> dumps the node metrics (not available on windows)
+            signal(signals.SIGUSR1, self._metrics_handler)
+
         self.interface.log(f"{self.name} v{self.version} : RUN-BASE INITIALIZED", logType="INFO")
         if autoStart:
             self.autoStart()
@@ -64,12 +71,26 @@ class run(TCS_core.core):
 
     def _run_base(self):
         self.interface.log(f"{self.name} v{self.version} : RUN COMMANDED", logType="INFO")
+        try:
+            if self._host.executor.asyncio_mode():
+                self._host.async_loop().run_until_complete(self._run_async())
+            while True:
+                self._run_error_handling()
+                # sleep until the next app is due (or a pooled app finishes)
+                self._host.wait_for_next_step()
+        finally:
+            # SIGINT / SIGTERM exit through here
+            self._host._handle_cleanup()
+
+    async def _run_async(self):
+        self.interface.log(f"{self.name} v{self.version} : RUNNING ON EVENT LOOP", logType="INFO")
         while True:
-            # start = time.time()
             self._run_error_handling()
-            # time.sleep(self._host.step_time - (start - time.time()))
+            # await the next due app (or a running app finishing) so async apps keep stepping
+            await self._host.wait_for_next_step_async()
 
-            time.sleep(self._host._config.system.inter_step_delay)
+    def _metrics_handler(self, signal_received, frame):
+        self._host.request_metrics_dump()
 
     def _run_error_handling(self):
         try:
@@ -84,7 +105,7 @@ def handler(signal_received, frame):
     # Handle any cleanup here
     import TCS_interface
     interface = TCS_interface.interface("SYS", pybird_app=True)
-    interface.log('SIGINT or CTRL-C detected. Exiting gracefully', 'EXIT MSG')
+    interface.log(signals.Signals(signal_received).name + ' detected. Exiting gracefully', 'EXIT MSG')
     sys.exit(0)
 
 
@@ -98,6 +119,7 @@ def goodbye():
 if __name__ == "__main__":
 
     signal(SIGINT, handler)
+    signal(signals.SIGTERM, handler)
     argv = sys.argv
     if len(argv) > 1:
         nodename = argv[1]
@@ -108,3 +130,4 @@ if __name__ == "__main__":
     ran_instance.run()
 else:
     signal(SIGINT, handler)
+    signal(signals.SIGTERM, handler)
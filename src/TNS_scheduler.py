@@ -0,0 +1,132 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+import heapq
+from typing import Union
+
+
+class scheduler:
+    """
+    min-heap of scheduled items keyed by the time.monotonic() time they are next due
+    - push() - schedules an item at a given time
+    - pop_due() - removes and returns every item due at or before a given time
+    - reschedule() - recomputes the due time of every scheduled item
+    - remove() - removes a scheduled item
+    - next_time() - returns the time of the earliest scheduled item
+    - size() - returns the number of scheduled items
+    - empty() - returns true if nothing is scheduled
+    """
+
+    def __init__(self) -> None:
+        self.heap = []
+        self.count = 0
+
+    def __len__(self):
+        return len(self.heap)
+
+    def push(self, item, due_time: float) -> None:
+        """
+        Schedules an item
+        :param item:
+        :param due_time: time.monotonic() time the item is due
+        :return:
+        """
+        # count keeps items with the same due time in FIFO order and stops heapq from comparing items
+        entry = (due_time, self.count, item)
+        heapq.heappush(self.heap, entry)
+        self.count += 1
+
+    def pop_due(self, now: float) -> list:
+        """
+        Removes and returns all items due at or before now, earliest first
+        :param now: time.monotonic() time
+        :return:
+        """
+        due = []
+        while len(self.heap) > 0 and self.heap[0][0] <= now:
+            (_, _, item) = heapq.heappop(self.heap)
+            due.append(item)
+        return due
+
+    def reschedule(self, due_fn) -> None:
+        """
+        Recomputes the due time of every scheduled item, items due_fn returns None for are dropped
+        :param due_fn: function(item) -> due time or None
+        :return:
+        """
+        entries = self.heap
+        self.heap = []
+        for (_, _, item) in sorted(entries, key=lambda entry: entry[1]):
+            due_time = due_fn(item)
+            if due_time is not None:
+                self.push(item, due_time)
+
+    def remove(self, item) -> bool:
+        """
+        Removes an item
+        :param item:
+        :return: True if the item was scheduled
+        """
+        for i, entry in enumerate(self.heap):
+            if entry[2] is item:
+                self.heap[i] = self.heap[-1]
+                self.heap.pop()
+                heapq.heapify(self.heap)
+                return True
+        return False
+
+    def next_time(self) -> Union[float, None]:
+        """
+        returns the due time of the earliest item
+        Returns None if nothing is scheduled
+        :return:
+        """
+        if self.size() == 0:
+            return None
+        return self.heap[0][0]
+
+    def size(self):
+        """
+        returns the number of scheduled items
+        :return:
+        """
+        return len(self.heap)
+
+    def empty(self):
+        """
+        returns true if nothing is scheduled
+        :return:
+        """
+        if self.size() == 0:
+            return True
+        return False
+
+
+if __name__ == "__main__":
+    s = scheduler()
+    s.push("B", 2.0)
+    s.push("A", 1.0)
+    s.push("C", 3.0)
+    print(s.next_time())
+    print(s.pop_due(2.0))
+    print(s.next_time())
@@ -44,3 +44,24 @@ class MongoDB_Atlas:
         else:
             self.app.interface.log("Atlas Database: Disabled", "ERROR")
             return None
+
+    def buffered_collection(self, database, collection_name: str, **kwargs):
+        """
+        Join a collection that writes in batches from a background thread (logging style writes)
+        Queued writes are written when the app is cleaned up
+        :param database: database from connect_to_database
+        :param collection_name:
+        :param kwargs: thresholds of TDS_database_atlas.buffered_collection
+        :return:
+        """
+        collection = TDS_database_atlas.buffered_collection(database.get_collection(collection_name),
+                                                            self.app.interface, **kwargs)
+        self.app._register_cleanup(collection.close)
+        return collection
+
+    def health(self) -> dict:
+        """
+        Health of the database clients shared by the apps of the node
+        :return: {uri label: {"topology": str, "servers": {address: {"type": str, "rtt": sec, "error": str}}}}
+        """
+        return TDS_database_atlas.clients.health()
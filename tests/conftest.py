@@ -0,0 +1,51 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Test setup
+The PYBIRD modules read the PYBIRD directory, the home directory and the server config when they are imported,
+every test session gets its own temporary PYBIRD tree using the mongomock atlas client
+"""
+import os
+import shutil
+import sys
+import tempfile
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_PYBIRD = tempfile.mkdtemp(prefix="PYBIRD_TEST_")
+
+shutil.copytree(os.path.join(_ROOT, "config"), os.path.join(_PYBIRD, "config"))
+_server_config = os.path.join(_PYBIRD, "config", "PYBIRD_SERVER_CONFIG.toml")
+with open(_server_config, "r", encoding="utf-8") as _f:
+    _text = _f.read()
+with open(_server_config, "w", encoding="utf-8") as _f:
+    _f.write(_text.replace('client="pymongo"', 'client="mongomock"', 1))
+
+os.environ["PYBIRD"] = _PYBIRD
+os.environ["PYBIRDRemoteDir"] = os.path.join(_PYBIRD, "remote")
+os.environ["HOME"] = os.path.join(_PYBIRD, "home")
+sys.path.insert(0, os.path.join(_ROOT, "src"))
+
+
+def pytest_unconfigure(config):
+    shutil.rmtree(_PYBIRD, ignore_errors=True)
@@ -0,0 +1,109 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the app data write-back cache
+"""
+import pickle
+
+import pytest
+
+import TDS_NVM
+import TCS_variables
+
+
+@pytest.fixture
+def nvm(monkeypatch, tmp_path):
+    monkeypatch.setattr(TCS_variables.PYBIRD_DIRECTORIES, "DATA_APPDATA", str(tmp_path))
+    nvm = TDS_NVM.NVM_dataInterface("TEST", cache_size=2, flush_interval=60)
+    put = nvm._store.put
+    nvm.writes = []
+
+    def counted_put(data_name: str, my_data: bytes) -> None:
+        nvm.writes.append(data_name)
+        put(data_name, my_data)
+
+    monkeypatch.setattr(nvm._store, "put", counted_put)
+    return nvm
+
+
+def _stored(nvm, data_name: str):
+    return pickle.loads(nvm._store.get(data_name))
+
+
+def test_saves_written_on_flush(nvm):
+    nvm.save("a", [1])
+    nvm.save("a", [1, 2])
+    assert nvm.writes == []
+    assert nvm.next_flush() is not None
+    assert nvm.flush() == 1
+    assert nvm.writes == ["a"]
+    assert _stored(nvm, "a") == [1, 2]
+    assert nvm.next_flush() is None
+
+
+def test_load_returns_cached_value(nvm, monkeypatch):
+    value = {"count": 1}
+    nvm.save("a", value)
+    monkeypatch.setattr(TDS_NVM.pickle, "loads", None)
+    assert nvm.load("a") is value
+    assert nvm.load("A") is value
+
+
+def test_unchanged_value_not_written(nvm):
+    nvm.save("a", 1)
+    nvm.flush()
+    nvm.save("a", 1)
+    assert nvm.flush() == 0
+    assert nvm.writes == ["a"]
+
+
+def test_loaded_value_not_written(nvm):
+    nvm._store.put("a", pickle.dumps([1]))
+    nvm.writes.clear()
+    value = nvm.load("a")
+    nvm.save("a", value)
+    assert nvm.flush() == 0
+    value.append(2)
+    nvm.save("a", value)
+    assert nvm.flush() == 1
+    assert _stored(nvm, "a") == [1, 2]
+
+
+def test_evicted_value_written(nvm):
+    nvm.save("a", 1)
+    nvm.save("b", 2)
+    nvm.save("c", 3)
+    assert nvm.writes == ["a"]
+    assert nvm.load("a") == 1
+    assert nvm.writes == ["a", "b"]
+
+
+def test_no_cache(monkeypatch, tmp_path):
+    monkeypatch.setattr(TCS_variables.PYBIRD_DIRECTORIES, "DATA_APPDATA", str(tmp_path))
+    nvm = TDS_NVM.NVM_dataInterface("TEST")
+    value = [1]
+    nvm.save("a", value)
+    assert nvm.load("a") == value
+    assert nvm.load("a") is not value
+    assert nvm.next_flush() is None
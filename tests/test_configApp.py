@@ -0,0 +1,54 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the app toml schema
+"""
+import os
+
+import pytest
+import toml
+
+import TCS_configApp
+import TCS_variables
+
+_APP_TOML = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "PYBIRD_APPS", "CLEAN APPS", "APP_NAME.toml")
+
+
+def _time_data(time_list) -> dict:
+    with open(_APP_TOML, "r", encoding="utf-8") as f:
+        data = toml.load(f)
+    data["app_config"]["timing"]["mode"] = "time"
+    data["app_config"]["timing"]["time"]["time_list"] = time_list
+    return data
+
+
+def test_time_list():
+    config = TCS_configApp.compile_app_toml(TCS_configApp._app_config(), _time_data(["00:00:00 E"]), "APP.toml")
+    assert config.time_calendar == [day * 24 * 60 * 60 for day in range(7)]
+
+
+def test_time_list_entry_type():
+    with pytest.raises(TCS_variables.PYBIRDTypeError, match=r"time_list\[1\] must be str not int"):
+        TCS_configApp.compile_app_toml(TCS_configApp._app_config(), _time_data(["00:00:00 E", 5]), "APP.toml")
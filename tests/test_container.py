@@ -0,0 +1,120 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the AES-GCM encrypted container
+"""
+import io
+import os
+
+import pytest
+
+import TCS_variables
+import TKS_container
+
+_KEY = bytes(range(32))
+_CHUNK = 16
+_RECORD = _CHUNK + TKS_container.OVERHEAD
+
+
+@pytest.mark.parametrize("size", [0, 1, _CHUNK - 1, _CHUNK, _CHUNK + 1, 3 * _CHUNK, 3 * _CHUNK + 5])
+def test_round_trip(size):
+    data = os.urandom(size)
+    container = TKS_container.encrypt(_KEY, data, _CHUNK)
+    assert TKS_container.is_container(container)
+    assert TKS_container.decrypt(_KEY, container) == data
+    assert b"".join(TKS_container.read_chunks(io.BytesIO(container), _KEY)) == data
+
+
+@pytest.mark.parametrize("size", [0, _CHUNK, 3 * _CHUNK + 5])
+def test_writer(size):
+    data = os.urandom(size)
+    f = io.BytesIO()
+    with TKS_container.writer(f, _KEY, _CHUNK) as container:
+        # written in pieces that do not line up with the chunks
+        for start in range(0, size, 7):
+            container.write(data[start:start + 7])
+    assert TKS_container.decrypt(_KEY, f.getvalue()) == data
+    # the writer and encrypt() write the same layout
+    assert len(f.getvalue()) == len(TKS_container.encrypt(_KEY, data, _CHUNK))
+
+
+def test_default_chunk_size():
+    data = os.urandom(TCS_variables.AES.CHUNK_SIZE + 1)
+    assert TKS_container.decrypt(_KEY, TKS_container.encrypt(_KEY, data)) == data
+
+
+def _container() -> bytes:
+    return TKS_container.encrypt(_KEY, bytes(3 * _CHUNK + 5), _CHUNK)
+
+
+def _chunks(container: bytes) -> list:
+    body = container[TKS_container.HEADER_SIZE:]
+    return [body[start:start + _RECORD] for start in range(0, len(body), _RECORD)]
+
+
+def _rejected(container: bytes) -> None:
+    with pytest.raises(TCS_variables.PYBIRDValueError):
+        TKS_container.decrypt(_KEY, container)
+    with pytest.raises(TCS_variables.PYBIRDValueError):
+        b"".join(TKS_container.read_chunks(io.BytesIO(container), _KEY))
+
+
+def test_tampered_chunk():
+    container = bytearray(_container())
+    container[TKS_container.HEADER_SIZE + TKS_container.NONCE_SIZE + 1] ^= 1
+    _rejected(bytes(container))
+
+
+def test_unsupported_version():
+    container = bytearray(_container())
+    container[len(TCS_variables.AES.CONTAINER_MAGIC)] += 1
+    _rejected(bytes(container))
+
+
+def test_reordered_chunks():
+    container = _container()
+    chunks = _chunks(container)
+    _rejected(container[:TKS_container.HEADER_SIZE] + chunks[1] + chunks[0] + b"".join(chunks[2:]))
+
+
+def test_truncated_at_chunk_boundary():
+    container = _container()
+    chunks = _chunks(container)
+    # the new last chunk was not sealed as the last chunk
+    _rejected(container[:TKS_container.HEADER_SIZE] + b"".join(chunks[:-1]))
+
+
+def test_truncated_chunk():
+    _rejected(_container()[:-1])
+    _rejected(_container()[:TKS_container.HEADER_SIZE + TKS_container.OVERHEAD - 1])
+
+
+def test_wrong_key():
+    _rejected(TKS_container.encrypt(bytes(32), b"data", _CHUNK))
+
+
+def test_not_a_container():
+    assert not TKS_container.is_container(b"plain data")
+    with pytest.raises(TCS_variables.PYBIRDValueError):
+        TKS_container.decrypt(_KEY, b"plain data")
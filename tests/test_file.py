@@ -0,0 +1,184 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of streamed encrypted app files
+"""
+import io
+import os
+
+import pytest
+
+import TCS_variables
+import TDS_file
+import TKS_container
+import TKS_encryption
+
+_CHUNK = 16
+
+
+@pytest.fixture
+def aes(monkeypatch):
+    # small chunks so every test crosses chunk boundaries
+    monkeypatch.setattr(TCS_variables.AES, "CHUNK_SIZE", _CHUNK)
+    return TKS_encryption._AES("k" * 32)
+
+
+@pytest.fixture
+def file(tmp_path) -> str:
+    return str(tmp_path / "file.txt")
+
+
+def _plain(aes, file: str) -> bytes:
+    with open(file + ".enc", "rb") as f:
+        return TKS_container.decrypt(aes.container_key, f.read())
+
+
+def _write(aes, file: str, data: bytes) -> None:
+    with TDS_file.openFileEnc(file, aes, "wb") as f:
+        f.write(data)
+
+
+def test_text_round_trip(aes, file):
+    lines = ["line " + str(i) + "\n" for i in range(20)]
+    with TDS_file.openFileEnc(file, aes, "w") as f:
+        f.writelines(lines)
+    with TDS_file.openFileEnc(file, aes, "r") as f:
+        assert f.readlines() == lines
+    with open(file + ".enc", "rb") as f:
+        # no plain text on disk
+        assert b"line" not in f.read()
+    assert not os.path.exists(file)
+
+
+def test_empty_file(aes, file):
+    _write(aes, file, b"")
+    assert _plain(aes, file) == b""
+    with TDS_file.openFileEnc(file, aes, "rb") as f:
+        assert f.read() == b""
+
+
+def test_seek_and_read(aes, file):
+    data = bytes(range(100))
+    _write(aes, file, data)
+    with TDS_file.openFileEnc(file, aes, "rb") as f:
+        assert f.seek(10) == 10
+        assert f.read(20) == data[10:30]
+        assert f.seek(-5, io.SEEK_END) == 95
+        assert f.read() == data[95:]
+        assert f.seek(-50, io.SEEK_CUR) == 50
+        assert f.read(16) == data[50:66]
+        assert f.read(0) == b""
+        f.seek(200)
+        assert f.read() == b""
+        with pytest.raises(io.UnsupportedOperation):
+            f.write(b"x")
+
+
+def test_append(aes, file):
+    _write(aes, file, bytes(20))
+    with TDS_file.openFileEnc(file, aes, "ab") as f:
+        f.write(b"a" * 30)
+        # appends always go to the end
+        f.seek(0)
+        f.write(b"b")
+    assert _plain(aes, file) == bytes(20) + b"a" * 30 + b"b"
+
+
+def test_append_new_file(aes, file):
+    with TDS_file.openFileEnc(file, aes, "a") as f:
+        f.write("first\n")
+    with TDS_file.openFileEnc(file, aes, "a") as f:
+        f.write("second\n")
+    with TDS_file.openFileEnc(file, aes, "r") as f:
+        assert f.read() == "first\nsecond\n"
+
+
+def test_rewrite_in_place(aes, file):
+    data = bytearray(range(100))
+    _write(aes, file, bytes(data))
+    size = os.path.getsize(file + ".enc")
+    assert size == TKS_container.HEADER_SIZE + 100 + 7 * TKS_container.OVERHEAD
+    with TDS_file.openFileEnc(file, aes, "r+b") as f:
+        f.seek(10)
+        f.write(b"x" * 30)
+        f.seek(0)
+        assert f.read(5) == data[:5]
+        f.seek(90)
+        f.write(b"y" * 5)
+    data[10:40] = b"x" * 30
+    data[90:95] = b"y" * 5
+    assert _plain(aes, file) == bytes(data)
+    assert os.path.getsize(file + ".enc") == size
+
+
+def test_rewrite_grows_file(aes, file):
+    _write(aes, file, b"a" * 20)
+    with TDS_file.openFileEnc(file, aes, "r+b") as f:
+        f.seek(15)
+        f.write(b"b" * 20)
+        # writing past the end fills the gap with zeros
+        f.seek(50)
+        f.write(b"c")
+    assert _plain(aes, file) == b"a" * 15 + b"b" * 20 + bytes(15) + b"c"
+
+
+def test_truncate_keeps_old(aes, file):
+    _write(aes, file, b"old data")
+    _write(aes, file, b"new")
+    assert _plain(aes, file) == b"new"
+    with open(file + ".enc.old", "rb") as f:
+        assert TKS_container.decrypt(aes.container_key, f.read()) == b"old data"
+
+
+def test_exclusive(aes, file):
+    with TDS_file.openFileEnc(file, aes, "xb") as f:
+        f.write(b"data")
+    with pytest.raises(FileExistsError):
+        TDS_file.openFileEnc(file, aes, "xb")
+
+
+def test_old_format(aes, file):
+    with open(file + ".enc", "wb") as f:
+        f.write(aes.encrypt(b"old format\n"))
+    with TDS_file.openFileEnc(file, aes, "r") as f:
+        assert f.read() == "old format\n"
+    # read only opens do not convert the file
+    with open(file + ".enc", "rb") as f:
+        assert not TKS_container.is_container(f.read())
+    with TDS_file.openFileEnc(file, aes, "a") as f:
+        f.write("appended\n")
+    assert _plain(aes, file) == b"old format\nappended\n"
+    assert os.path.exists(file + ".enc.old")
+
+
+def test_tampered_file(aes, file):
+    _write(aes, file, bytes(40))
+    with open(file + ".enc", "r+b") as f:
+        f.seek(-1, io.SEEK_END)
+        last = f.read(1)
+        f.seek(-1, io.SEEK_END)
+        f.write(bytes([last[0] ^ 1]))
+    with TDS_file.openFileEnc(file, aes, "rb") as f:
+        with pytest.raises(TCS_variables.PYBIRDValueError):
+            f.read()
@@ -0,0 +1,166 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the atlas log sink, on the mongomock atlas client
+"""
+import os
+import time
+
+import pytest
+from pymongo.errors import ServerSelectionTimeoutError
+
+import TCS_log_atlas
+import TCS_log_binary
+import TDS_database_atlas
+import TKS_keychain
+import TCS_variables
+
+_URI = "mongodb://localhost:27017"
+
+
+@pytest.fixture
+def sink(monkeypatch):
+    monkeypatch.setattr(TKS_keychain.keychain, "load_atlas_keys",
+                        lambda self, app_name, db_name: [app_name, _URI, "1", "TEST_LOG"])
+    sink = TCS_log_atlas.atlas_sink("TEST", "DB")
+    # the test flushes, the sink thread is never started
+    sink._closed = True
+    yield sink
+    for path in [sink._spill_path, sink._spill_path + ".bad"]:
+        if os.path.exists(path):
+            os.remove(path)
+    TDS_database_atlas.clients.get(_URI, "1").drop_database("TEST_LOG")
+
+
+def _record(number: int) -> TCS_log_binary.log_record:
+    return TCS_log_binary.log_record(time.time(), "0.12", "TEST-0", "TEST", 0.0, number, "INFO",
+                                     "message " + str(number))
+
+
+def _collection():
+    return TDS_database_atlas.clients.get(_URI, "1").get_database("TEST_LOG")[TCS_variables.ATLAS.LOG_COLLECTION]
+
+
+def _messages() -> list:
+    return [document["message"] for document in _collection().find()]
+
+
+def _unreachable(monkeypatch, sink):
+    def connect():
+        raise ServerSelectionTimeoutError("unreachable")
+
+    monkeypatch.setattr(sink, "_connect", connect)
+
+
+def test_write_flush(sink):
+    for number in range(3):
+        sink.write(_record(number))
+    sink.flush()
+    assert _messages() == ["message 0", "message 1", "message 2"]
+    assert sink.stats == {"written": 3, "spilled": 0, "dropped": 0}
+
+
+def test_queue_full_drops(sink):
+    sink._max_queue = 2
+    for number in range(5):
+        sink.write(_record(number))
+    assert sink.stats["dropped"] == 3
+    sink.flush()
+    assert _messages() == ["message 0", "message 1"]
+
+
+def test_spill_when_unreachable(sink, monkeypatch):
+    _unreachable(monkeypatch, sink)
+    for number in range(3):
+        sink.write(_record(number))
+    sink.flush()
+    assert sink.stats["spilled"] == 3
+    assert sink.error is not None
+    with open(sink._spill_path, "r", encoding="utf-8") as f:
+        assert len(f.readlines()) == 3
+
+
+def test_spill_full_drops(sink, monkeypatch):
+    _unreachable(monkeypatch, sink)
+    sink._spill_bytes = 1
+    sink.write(_record(0))
+    sink.flush()
+    assert sink.stats["spilled"] == 0
+    assert sink.stats["dropped"] == 1
+
+
+def test_replay_order_after_recovery(sink, monkeypatch):
+    with monkeypatch.context() as m:
+        _unreachable(m, sink)
+        for number in range(3):
+            sink.write(_record(number))
+        sink.flush()
+        sink.write(_record(3))
+        sink.flush()
+    sink._retry_at = 0.0
+    sink.write(_record(4))
+    sink.flush()
+    assert _messages() == ["message 0", "message 1", "message 2", "message 3", "message 4"]
+    assert not os.path.exists(sink._spill_path)
+    assert sink.error is None
+    assert sink.stats == {"written": 5, "spilled": 4, "dropped": 0}
+
+
+def test_retry_interval(sink, monkeypatch):
+    with monkeypatch.context() as m:
+        _unreachable(m, sink)
+        sink.write(_record(0))
+        sink.flush()
+    # the database is not tried again before log_retry_interval
+    sink.write(_record(1))
+    sink.flush()
+    assert _messages() == []
+    assert sink.stats["spilled"] == 2
+
+
+def test_replay_skips_written(sink):
+    # the database failed after writing part of a spilled batch
+    documents = [TCS_log_atlas._document(_record(number)) for number in range(3)]
+    _collection().insert_one(dict(documents[1]))
+    sink._spill(documents)
+    sink.write(_record(3))
+    sink.flush()
+    assert _messages() == ["message 1", "message 0", "message 2", "message 3"]
+    assert len(set(document["_id"] for document in _collection().find())) == 4
+    assert sink.stats["written"] == 4
+    assert sink.stats["dropped"] == 0
+
+
+def test_replay_skips_unreadable_lines(sink):
+    sink._spill([TCS_log_atlas._document(_record(0))])
+    with open(sink._spill_path, "a", encoding="utf-8") as f:
+        f.write("Date,Version,Session ID\n")
+    sink._spill([TCS_log_atlas._document(_record(1))])
+    sink.write(_record(2))
+    sink.flush()
+    assert _messages() == ["message 0", "message 1", "message 2"]
+    assert not os.path.exists(sink._spill_path)
+    assert sink.stats["dropped"] == 1
+    with open(sink._spill_path + ".bad", "r", encoding="utf-8") as f:
+        assert f.read() == "Date,Version,Session ID\n"
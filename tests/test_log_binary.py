@@ -0,0 +1,133 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the binary log, its index and query_log
+"""
+import os
+from datetime import datetime, timezone
+
+import pytest
+
+import TCS_interface
+import TCS_log_binary
+import TCS_variables
+
+# 1 Jan 2024 00:00:00 UTC
+_T0 = 1704067200.0
+
+
+def _record(offset: float, source_name: str = "APP", log_type: str = "INFO", session_id: str = "S1",
+            message: str = None) -> TCS_log_binary.log_record:
+    return TCS_log_binary.log_record(_T0 + offset, "0.12", session_id, source_name, offset, None, log_type,
+                                     str(offset) if message is None else message)
+
+
+def _write(path: str, records: list) -> None:
+    TCS_log_binary.write_records(path, [(TCS_log_binary.encode_record(record), TCS_log_binary.index_keys(record))
+                                        for record in records])
+
+
+def _offsets(records: list) -> list:
+    return [record.uptime for record in records]
+
+
+@pytest.fixture
+def log(tmp_path) -> str:
+    path = str(tmp_path / "LOG.plog")
+    _write(path, [_record(float(offset)) for offset in range(0, 100, 10)])
+    return path
+
+
+def test_encode_decode():
+    record = TCS_log_binary.log_record(_T0, "0.12", "S1", "APP", 1.5, 7, "INFO", "message, with comma")
+    data = TCS_log_binary.encode_record(record)
+    (decoded, index) = TCS_log_binary.decode_record(data)
+    assert index == len(data)
+    assert decoded.__dict__ == record.__dict__
+    (decoded, _) = TCS_log_binary.decode_record(TCS_log_binary.encode_record(_record(0)))
+    assert decoded.step_count is None
+
+
+def test_index(log):
+    assert TCS_log_binary.record_count(log) == 10
+    assert os.path.getsize(TCS_log_binary.index_path(log)) == 10 * TCS_log_binary.ENTRY_SIZE
+    with open(TCS_log_binary.index_path(log), "rb") as f:
+        index = TCS_log_binary._index(f)
+        assert index.bisect_time(_T0 - 1) == 0
+        assert index.bisect_time(_T0 + 30) == 3
+        assert index.bisect_time(_T0 + 31) == 4
+        assert index.bisect_time(_T0 + 1000) == 10
+
+
+def test_query_time_range(log):
+    assert _offsets(TCS_log_binary.query([log])) == [float(offset) for offset in range(0, 100, 10)]
+    # start and end are included
+    assert _offsets(TCS_log_binary.query([log], start=_T0 + 20, end=_T0 + 50)) == [20.0, 30.0, 40.0, 50.0]
+    assert _offsets(TCS_log_binary.query([log], start=_T0 + 85)) == [90.0]
+    assert _offsets(TCS_log_binary.query([log], end=_T0 + 5)) == [0.0]
+    assert TCS_log_binary.query([log], start=_T0 + 1000) == []
+
+
+def test_query_filters(tmp_path):
+    path = str(tmp_path / "LOG.plog")
+    _write(path, [_record(1, source_name="A"), _record(2, source_name="B", log_type="ERROR"),
+                  _record(3, source_name="A", session_id="S2"), _record(4, source_name="A", log_type="ERROR")])
+    assert _offsets(TCS_log_binary.query([path], source_name="a")) == [1.0, 3.0, 4.0]
+    assert _offsets(TCS_log_binary.query([path], log_type="error")) == [2.0, 4.0]
+    assert _offsets(TCS_log_binary.query([path], session_id="S2")) == [3.0]
+    assert _offsets(TCS_log_binary.query([path], source_name="A", log_type="ERROR")) == [4.0]
+
+
+def test_query_out_of_order(tmp_path):
+    # records batched by different processes are up to ORDER_SLACK seconds out of order
+    path = str(tmp_path / "LOG.plog")
+    _write(path, [_record(10), _record(12), _record(9), _record(13)])
+    assert _offsets(TCS_log_binary.query([path], start=_T0 + 9, end=_T0 + 12)) == [10.0, 12.0, 9.0]
+
+
+def test_query_segments(tmp_path):
+    old = str(tmp_path / "LOG.1.plog")
+    current = str(tmp_path / "LOG.plog")
+    _write(old, [_record(0), _record(10)])
+    _write(current, [_record(20), _record(30)])
+    assert _offsets(TCS_log_binary.query([old, current], start=_T0 + 5, end=_T0 + 25)) == [10.0, 20.0]
+    # a segment removed while querying is skipped
+    assert _offsets(TCS_log_binary.query([str(tmp_path / "LOG.0.plog"), current])) == [20.0, 30.0]
+
+
+def test_query_log(log):
+    interface = TCS_interface.interface("TEST")
+    interface.binary_log = log
+    assert _offsets(interface.query_log(start=_T0 + 20, end=_T0 + 40)) == [20.0, 30.0, 40.0]
+    # naive datetimes are UTC
+    assert _offsets(interface.query_log(start=datetime(2024, 1, 1, 0, 1, 0))) == [60.0, 70.0, 80.0, 90.0]
+    assert _offsets(interface.query_log(end=datetime(2024, 1, 1, 0, 0, 10, tzinfo=timezone.utc))) == [0.0, 10.0]
+    assert len(interface.query_log()) == 10
+
+
+def test_query_log_disabled():
+    interface = TCS_interface.interface("TEST")
+    interface.binary_log = ""
+    with pytest.raises(TCS_variables.PYBIRDIOError):
+        interface.query_log()
@@ -0,0 +1,110 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the node scheduler heap and of rescheduling apps after a wall clock change
+"""
+import os
+import time
+
+import toml
+
+import TCS_configApp
+import TCS_timing_manager
+import TNS_scheduler
+
+_APP_TOML = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "PYBIRD_APPS", "CLEAN APPS", "APP_NAME.toml")
+
+
+def _timing_manager(mode: str, time_list: list = None) -> TCS_timing_manager.TimingManager:
+    with open(_APP_TOML, "r", encoding="utf-8") as f:
+        data = toml.load(f)
+    data["app_config"]["timing"]["mode"] = mode
+    data["app_config"]["timing"]["step"]["sync_time"] = ""
+    if time_list is not None:
+        data["app_config"]["timing"]["time"]["time_list"] = time_list
+    config = TCS_configApp.compile_app_toml(TCS_configApp._app_config(), data, "APP.toml")
+    return TCS_timing_manager.TimingManager("TEST", config)
+
+
+def test_pop_due_earliest_first():
+    scheduler = TNS_scheduler.scheduler()
+    for item, due_time in [("C", 3.0), ("A", 1.0), ("D", 4.0), ("B", 2.0)]:
+        scheduler.push(item, due_time)
+    assert scheduler.next_time() == 1.0
+    assert scheduler.pop_due(0.5) == []
+    assert scheduler.pop_due(3.0) == ["A", "B", "C"]
+    assert scheduler.next_time() == 4.0
+    assert len(scheduler) == 1
+
+
+def test_same_time_fifo():
+    scheduler = TNS_scheduler.scheduler()
+    items = [object() for _ in range(5)]
+    for item in items:
+        scheduler.push(item, 1.0)
+    assert scheduler.pop_due(1.0) == items
+
+
+def test_remove():
+    scheduler = TNS_scheduler.scheduler()
+    for item, due_time in [("A", 1.0), ("B", 2.0), ("C", 3.0)]:
+        scheduler.push(item, due_time)
+    assert scheduler.remove("A")
+    assert not scheduler.remove("A")
+    assert scheduler.next_time() == 2.0
+    assert scheduler.pop_due(10.0) == ["B", "C"]
+    assert scheduler.empty()
+    assert scheduler.next_time() is None
+
+
+def test_reschedule():
+    scheduler = TNS_scheduler.scheduler()
+    for item, due_time in [("A", 1.0), ("B", 2.0), ("C", 3.0), ("D", 4.0)]:
+        scheduler.push(item, due_time)
+    scheduler.reschedule(lambda item: {"A": 5.0, "B": None, "C": 5.0, "D": 0.0}[item])
+    assert scheduler.next_time() == 0.0
+    # items rescheduled to the same time keep the order they were scheduled in
+    assert scheduler.pop_due(10.0) == ["D", "A", "C"]
+
+
+def test_reschedule_after_clock_jump(monkeypatch):
+    interval = _timing_manager("step")
+    interval.set_next_time()
+    wall_clock = _timing_manager("time", ["00:00:00 E"])
+    wall_clock.set_next_time()
+    scheduler = TNS_scheduler.scheduler()
+    scheduler.push(interval, interval.get_cur_time())
+    scheduler.push(wall_clock, wall_clock.get_cur_time())
+    interval_due = interval.get_cur_time()
+    wall_clock_due = wall_clock.get_cur_time()
+
+    # the wall clock is set an hour ahead
+    real_time = time.time
+    monkeypatch.setattr(TCS_timing_manager.time, "time", lambda: real_time() + 60 * 60)
+    scheduler.reschedule(lambda timing_manager: timing_manager.get_cur_time())
+    due = {id(entry[2]): entry[0] for entry in scheduler.heap}
+    # interval apps keep their monotonic time, wall clock apps are due an hour sooner
+    assert due[id(interval)] == interval_due
+    assert abs(due[id(wall_clock)] - (wall_clock_due - 60 * 60)) < 0.1
@@ -0,0 +1,103 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+"""
+Tests of the time mode calendar (week time list and cron entries)
+"""
+import calendar
+import os
+
+import pytest
+import toml
+
+import TCS_configApp
+import TCS_timing_manager
+
+_APP_TOML = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                         "PYBIRD_APPS", "CLEAN APPS", "APP_NAME.toml")
+_DAY = TCS_timing_manager.SECONDS_PER_DAY
+_HOUR = 60 * 60
+
+
+def _time_timing_manager(time_list: list) -> TCS_timing_manager.TimingManager:
+    with open(_APP_TOML, "r", encoding="utf-8") as f:
+        data = toml.load(f)
+    data["app_config"]["timing"]["mode"] = "time"
+    data["app_config"]["timing"]["time"]["time_list"] = time_list
+    config = TCS_configApp.compile_app_toml(TCS_configApp._app_config(), data, "APP.toml")
+    return TCS_timing_manager.TimingManager("TEST", config)
+
+
+def test_week_entries():
+    assert TCS_timing_manager.compile_time_list(["01:02:03 M", "12:00:00 U"]) == [_HOUR + 2 * 60 + 3,
+                                                                                  6 * _DAY + 12 * _HOUR]
+    assert TCS_timing_manager.compile_time_list(["00:00:30 E"]) == [day * _DAY + 30 for day in range(7)]
+
+
+def test_entries_sorted_and_merged():
+    assert TCS_timing_manager.compile_time_list(["10:00:00 T", "09:00:00 M", "10:00:00 E"]) == \
+        [9 * _HOUR] + [10 * _HOUR + day * _DAY for day in range(7)]
+
+
+def test_cron_entries():
+    # every 15 minutes of 09:00 on week days
+    assert TCS_timing_manager.compile_time_list(["*/15 9 * * MON-FRI"]) == \
+        [day * _DAY + 9 * _HOUR + minute * 60 for day in range(5) for minute in [0, 15, 30, 45]]
+    # leading second field
+    assert TCS_timing_manager.compile_time_list(["30 0 0 * * 1"]) == [30]
+    # cron sunday is 0 or 7, the last day of the week
+    assert TCS_timing_manager.compile_time_list(["0 0 * * 0", "0 0 * * 7", "0 0 * * SUN"]) == [6 * _DAY]
+    assert TCS_timing_manager.compile_time_list(["0 12 * * MON,WED"]) == [12 * _HOUR, 2 * _DAY + 12 * _HOUR]
+
+
+@pytest.mark.parametrize("entry", ["0 0 1 * *", "0 0 * 1 *", "60 0 * * *", "0 24 * * *", "0 0 * * 8",
+                                   "0 0 * * 5-1", "*/0 0 * * *", "00:00:00 X", "00:00:00", "1 2 3"])
+def test_invalid_entries(entry):
+    with pytest.raises(ValueError):
+        TCS_timing_manager.compile_time_list([entry])
+
+
+def test_next_time_in_week(monkeypatch):
+    # Wednesday 3 Jan 2024 12:00:00 UTC
+    now = float(calendar.timegm((2024, 1, 3, 12, 0, 0)))
+    monkeypatch.setattr(TCS_timing_manager.time, "time", lambda: now)
+    timing_manager = _time_timing_manager(["06:00:00 W", "18:00:00 W", "00:00:00 R"])
+    timing_manager.last_time = now
+    assert timing_manager.set_next_time() == now + 6 * _HOUR
+    assert timing_manager.set_next_time() == now + 12 * _HOUR
+
+
+def test_next_time_wraps_to_next_week(monkeypatch):
+    # Sunday 7 Jan 2024 23:00:00 UTC, after the last entry of the week
+    now = float(calendar.timegm((2024, 1, 7, 23, 0, 0)))
+    monkeypatch.setattr(TCS_timing_manager.time, "time", lambda: now)
+    timing_manager = _time_timing_manager(["01:00:00 M", "22:00:00 U"])
+    timing_manager.last_time = now
+    assert timing_manager.set_next_time() == float(calendar.timegm((2024, 1, 8, 1, 0, 0)))
+    assert timing_manager.set_next_time() == float(calendar.timegm((2024, 1, 14, 22, 0, 0)))
+    assert timing_manager.set_next_time() == float(calendar.timegm((2024, 1, 15, 1, 0, 0)))
+
+
+def test_empty_time_list():
+    timing_manager = _time_timing_manager([])
+    assert timing_manager.set_next_time() == "never"
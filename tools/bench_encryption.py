@@ -0,0 +1,94 @@
+# /bin/python3
+# ##########################################################################
+#
+#   Copyright (C) 2022-2024 Michael Dompke (https://github.com/stinger81)
+#
+#    This program is free software: you can redistribute it and/or modify
+#    it under the terms of the GNU General Public License as published by
+#    the Free Software Foundation, either version 3 of the License, or
+#    any later version.
+#
+#    This program is distributed in the hope that it will be useful,
+#    but WITHOUT ANY WARRANTY; without even the implied warranty of
+#    MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+#    GNU General Public License for more details
+#
+#    You should have received a copy of the GNU General Public License
+#    along with this program.  If not, see <http://www.gnu.org/licenses/>.
+#
+#   Michael Dompke (https://github.com/stinger81)
+#   michael@dompke.dev
+#
+# ##########################################################################
+
+# micro-benchmark of the AES context cache (TKS_encryption)
+# "uncached" builds a new context for every operation like TDS_file/NVM_dataInterface did before,
+# "cached" uses the shared context of the process
+# usage: python bench_encryption.py [iterations]
+
+import os
+import sys
+import time
+
+sys.path.append(os.path.join(os.environ["PYBIRD"], "src"))
+import TKS_container
+import TKS_encryption
+
+APP_NAME = "BENCH"
+SAVE_KEY = "bench_save_key"
+PAYLOAD = os.urandom(1024)
+
+
+def _time(func, iterations: int) -> float:
+    """
+    average time of func in microseconds
+    :param func:
+    :param iterations:
+    :return:
+    """
+    func()
+    start = time.perf_counter()
+    for _ in range(iterations):
+        func()
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def _report(name: str, uncached: float, cached: float) -> None:
+    print("{:<28}{:>12.2f}{:>12.2f}{:>10.1f}x".format(name, uncached, cached, uncached / cached))
+
+
+def main(iterations: int) -> None:
+    print("{:<28}{:>12}{:>12}{:>11}".format("operation [us/op]", "uncached", "cached", "speedup"))
+
+    _report("context",
+            _time(lambda: TKS_encryption.AES_savekey(APP_NAME, SAVE_KEY), iterations),
+            _time(lambda: TKS_encryption.savekey(APP_NAME, SAVE_KEY), iterations))
+
+    _report("container encrypt 1 KiB",
+            _time(lambda: TKS_container.encrypt(TKS_encryption.AES_savekey(APP_NAME, SAVE_KEY).container_key,
+                                                PAYLOAD), iterations),
+            _time(lambda: TKS_container.encrypt(TKS_encryption.savekey(APP_NAME, SAVE_KEY).container_key,
+                                                PAYLOAD), iterations))
+
+    enc = TKS_encryption.savekey(APP_NAME, SAVE_KEY).encrypt_bytes(PAYLOAD)
+    _report("cbc decrypt 1 KiB",
+            _time(lambda: TKS_encryption.AES_savekey(APP_NAME, SAVE_KEY).decrypt_bytes(enc), iterations),
+            _time(lambda: TKS_encryption.savekey(APP_NAME, SAVE_KEY).decrypt_bytes(enc), iterations))
+
+    try:
+        TKS_encryption.keychain_key()
+    except TKS_encryption.TCS_variables.PYBIRDAESkeyERROR:
+        print("no AES key file, skipping keychain contexts")
+        return
+    keychain_iterations = max(1, iterations // 100)
+    _report("keychain key",
+            _time(lambda: TKS_encryption.AES_ENC(), keychain_iterations),
+            _time(lambda: TKS_encryption.keychain_key(), keychain_iterations))
+    _report("keychain save key",
+            _time(lambda: (TKS_encryption.clear_cache(), TKS_encryption.savekey_enc(APP_NAME, SAVE_KEY)),
+                  keychain_iterations),
+            _time(lambda: TKS_encryption.savekey_enc(APP_NAME, SAVE_KEY), keychain_iterations))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -28,21 +28,25 @@ import sys
 sys.path.append(os.path.join(os.environ["PYBIRD"], "src"))
 import TCS_variables as VAR
 import TCS_config
+import TCS_log_writer
 
-logs = os.listdir(VAR.PYBIRD_DATA_LOG_DIRECTORY)
+logs = os.listdir(VAR.PYBIRD_DIRECTORIES.DATA_LOG)
 
-config = TCS_config.TCS_config()
+config = TCS_config.get_config()
 
 report_len = config.status.log_length
 
 for l in logs:
 
-    temp_path = os.path.join(VAR.PYBIRD_DATA_LOG_DIRECTORY, l)
+    temp_path = os.path.join(VAR.PYBIRD_DIRECTORIES.DATA_LOG, l)
+    if TCS_log_writer.is_segment(l) or l.endswith(VAR.LOG_BINARY.EXTENSION) or \
+            l.endswith(VAR.LOG_BINARY.INDEX_EXTENSION):
+        # segments are read with the log they belong to, binary logs are read with interface.query_log()
+        continue
     if os.path.isdir(temp_path):
         report = os.listdir(temp_path)
     else:
-        with open(temp_path, "r") as f:
-            report = f.readlines()
+        report = TCS_log_writer.read_lines(temp_path)
     print(l + " -> Total Log Messages: " + str(len(report)))
     if report == []:
         print("No Log Messages (" + l + ")")